@@ -1,15 +1,25 @@
 #!/usr/bin/env python3
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 from mcp.server.fastmcp import FastMCP, Context
 from mcp.server.fastmcp.prompts.base import Message, UserMessage, AssistantMessage
-from strategy_generator import StrategyGenerator
-from strategy_parser import StrategyParser
+# The shared strategy_core package sits at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from strategy_core.batching import BATCH_WORKERS, INVALID_MESSAGES, group_items, read_batch
+from strategy_core.metrics import METRICS
+from strategy_core.refinement import Refiner
+from strategy_core.strategy_generator import StrategySpec, render_strategy
+from strategy_core.strategy_parser import DEFAULT_PARAMETERS, StrategyParser
 
 # Create MCP server
 mcp = FastMCP("Strategy")
 
 # Initialize components
-generator = StrategyGenerator()
 parser = StrategyParser()
+refiner = Refiner.from_env(parser)
 
 @mcp.prompt()
 def strategy_prompt(message: str, ctx: Context) -> list[Message]:
@@ -19,32 +29,90 @@ def strategy_prompt(message: str, ctx: Context) -> list[Message]:
         AssistantMessage("I'll help you generate a trading strategy.")
     ]
 
-@mcp.tool()
-def generate_strategy(prompt: str, ctx: Context) -> str:
-    """Generate a trading strategy from description"""
+def build_strategy(kind: str, value) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Generate a strategy from a description (`kind` "prompt") or an explicit parameter set
+    (`kind` "parameters"); returns (strategy XML, None) or (None, error message). Runs on a
+    worker thread, so the caller reports errors to the client
+    """
     try:
         # Parse parameters from prompt using context
-        params = parser.parse_prompt(prompt, ctx)
+        if kind == "prompt":
+            params = parser.parse_prompt(value)
+        else:
+            params = {**DEFAULT_PARAMETERS, **value}
         
-        if not parser.validate_parameters(params):
-            error_msg = "Could not extract valid parameters from prompt"
-            ctx.error(error_msg)
-            return error_msg
+        with METRICS.stage("validate"):
+            valid = parser.validate_parameters(params)
+        if not valid:
+            return None, INVALID_MESSAGES[kind]
             
         # Generate strategy XML
-        strategy_xml = generator.generate_strategy(
-            duration=params["duration"],
-            stake=params["stake"],
-            initial_stake=params["initial_stake"],
-            profit_threshold=params["profit_threshold"],
-            loss_threshold=params["loss_threshold"]
-        )
-        return strategy_xml
+        with METRICS.stage("render"):
+            strategy_xml = render_strategy(StrategySpec.from_params(params))
+        return strategy_xml, None
         
     except Exception as e:
-        error_msg = f"Error generating strategy: {str(e)}"
-        ctx.error(error_msg)
+        return None, f"Error generating strategy: {str(e)}"
+
+@mcp.tool()
+@METRICS.instrument("generate_strategy")
+async def generate_strategy(prompt: str, ctx: Context) -> str:
+    """Generate a trading strategy from description"""
+    strategy, error_msg = await asyncio.to_thread(build_strategy, "prompt", prompt)
+    if error_msg is not None:
+        await ctx.error(error_msg)
         return error_msg
+    return strategy
+
+@mcp.tool()
+@METRICS.instrument("refine_strategy")
+async def refine_strategy(message: str, ctx: Context, session: str = None, reference: str = None,
+                          options: dict = None) -> dict:
+    """
+    Change the strategy of a session with a follow-up message such as "same as before but stake 20";
+    without a `session`, the message starts one. Returns the session, the strategy XML, its
+    parameters and which of them changed
+    """
+    try:
+        return (await refiner.refine_async(message, session, reference, options)).summary()
+    except KeyError as e:
+        await ctx.error(e.args[0])
+        return {"error": e.args[0]}
+    except Exception as e:
+        error_msg = f"Error refining strategy: {str(e)}"
+        await ctx.error(error_msg)
+        return {"error": error_msg}
+
+@mcp.tool()
+@METRICS.instrument("generate_strategies")
+async def generate_strategies(ctx: Context, prompts: list[str] = None, parameters: list[dict] = None) -> list[str]:
+    """Generate trading strategies for a batch of descriptions and/or explicit parameter sets"""
+    try:
+        items = read_batch({"prompts": prompts, "parameters": parameters})
+    except ValueError as e:
+        await ctx.error(str(e))
+        return [str(e)]
+
+    # Parse and render each distinct input once, concurrently, then report errors from the event loop
+    groups = list(group_items(items).values())
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(groups))) as pool:
+        results = await asyncio.gather(*(
+            loop.run_in_executor(pool, build_strategy, *items[indexes[0]]) for indexes in groups
+        ))
+    strategies = [None] * len(items)
+    for indexes, (strategy, error_msg) in zip(groups, results):
+        if error_msg is not None:
+            await ctx.error(f"Item {indexes[0]}: {error_msg}")
+        for index in indexes:
+            strategies[index] = strategy if error_msg is None else error_msg
+    return strategies
+
+@mcp.resource("metrics://prometheus", mime_type="text/plain")
+def metrics() -> str:
+    """Request counters, stage timings and LLM token usage in the Prometheus text format"""
+    return METRICS.render()
 
 if __name__ == "__main__":
     mcp.run()
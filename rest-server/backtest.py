@@ -0,0 +1,321 @@
+import math
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from strategy_core.strategy_generator import StrategySpec
+
+# Money-management families of the reference strategies, longest prefix first
+FAMILIES = ("reverse_martingale", "reverse_dalembert", "martingale", "dalembert", "oscars_grind", "1_3_2_6")
+
+# Used when a reference input has no literal default (text_prompt_ext asks the user at run time);
+# a stake and thresholds asked for that way are simulated at the generated strategy's defaults
+FALLBACK_VALUES = {
+    "stake": 1.0,
+    "profit": 1000.0,
+    "loss": 500.0,
+    "size": 2.0,
+    "dalembert_unit": 1.0,
+    "alembert_unit": 1.0,
+    "oscar_unit": 1.0,
+    "boolean_max_stake": False,
+    "max_stake": math.inf,
+    "boolean_tick_count": True,
+    "tick_count": 5.0,
+    "take_profit": 0.0,
+    "growth_rate": 0.01,
+}
+
+
+class MarketModel(NamedTuple):
+    """Synthetic tick outcomes: i.i.d. binary contracts and accumulator knock-outs"""
+    win_probability: float = 0.5
+    # Profit per unit stake of a winning binary contract
+    payout: float = 0.95
+    # Per-tick survival of an accumulator is (1 - accumulator_edge) / (1 + growth_rate)
+    accumulator_edge: float = 0.002
+
+
+class BacktestResult(NamedTuple):
+    """Per-run outcomes of a backtest; outcome is 1 at the profit threshold, -1 at the loss threshold, 0 if still open"""
+    profit: np.ndarray
+    max_drawdown: np.ndarray
+    trades: np.ndarray
+    peak_stake: np.ndarray
+    outcome: np.ndarray
+    seconds: float
+
+    @classmethod
+    def combine(cls, results, seconds: float) -> "BacktestResult":
+        """Concatenate the sessions of several backtests of the same strategy, run in `seconds` of wall time"""
+        return cls(*(np.concatenate(arrays) for arrays in zip(*(result[:-1] for result in results))), seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        """P&L distribution, drawdown and stop probabilities as plain JSON-ready numbers"""
+        runs = len(self.profit)
+        percentiles = np.percentile(self.profit, (5, 25, 50, 75, 95))
+        return {
+            "runs": runs,
+            "profit": {
+                "mean": float(self.profit.mean()),
+                "std": float(self.profit.std()),
+                "min": float(self.profit.min()),
+                "max": float(self.profit.max()),
+                **{f"p{p}": float(value) for p, value in zip((5, 25, 50, 75, 95), percentiles)}
+            },
+            "max_drawdown": {"mean": float(self.max_drawdown.mean()), "max": float(self.max_drawdown.max())},
+            "trades": {"mean": float(self.trades.mean()), "max": int(self.trades.max())},
+            "peak_stake": {"mean": float(self.peak_stake.mean()), "max": float(self.peak_stake.max())},
+            "ruin_probability": float(np.count_nonzero(self.outcome < 0)) / runs,
+            "target_probability": float(np.count_nonzero(self.outcome > 0)) / runs,
+            "open_probability": float(np.count_nonzero(self.outcome == 0)) / runs,
+            "runs_per_second": runs / self.seconds if self.seconds else None
+        }
+
+
+class Rule:
+    """Stake rule advancing the money-management state of many sessions at once"""
+
+    def take(self, index):
+        """Keep only the sessions selected by `index`"""
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                setattr(self, name, value[index])
+
+
+class Flat(Rule):
+    """The generated strategy: the same stake on every trade"""
+
+    def __init__(self, runs, base):
+        self.current = np.full(runs, base, dtype=float)
+
+    def stake(self):
+        return self.current
+
+    def update(self, win, pnl):
+        pass
+
+
+class Martingale(Rule):
+    """Multiply the stake by `size` after a loss (after a win if reverse), reset to the initial stake otherwise"""
+
+    def __init__(self, runs, base, size, max_stake, reverse=False):
+        self.base, self.size, self.max_stake, self.reverse = base, size, max_stake, reverse
+        self.multiplier = np.ones(runs)
+
+    def stake(self):
+        return self.base * self.multiplier
+
+    def update(self, win, pnl):
+        grow = win if self.reverse else ~win
+        self.multiplier = np.where(grow, self.multiplier * self.size, 1.0)
+        self.multiplier[self.base * self.multiplier > self.max_stake] = 1.0
+
+
+class DAlembert(Rule):
+    """Add `step` to the stake after a loss (after a win if reverse) and remove it otherwise, never below the initial stake"""
+
+    def __init__(self, runs, base, step, max_stake, reverse=False):
+        self.base, self.step, self.max_stake, self.reverse = base, step, max_stake, reverse
+        self.level = np.zeros(runs)
+
+    def stake(self):
+        return self.base + self.step * self.level
+
+    def update(self, win, pnl):
+        grow = win if self.reverse else ~win
+        self.level = np.where(grow, self.level + 1, np.maximum(self.level - 1, 0))
+        self.level[self.stake() > self.max_stake] = 0
+
+
+class OscarsGrind(Rule):
+    """
+    Keep the stake after a loss and raise it one unit after a win, capped at what brings the
+    session back to one unit of profit; a session in profit starts over at one unit
+    """
+
+    def __init__(self, runs, base, max_stake):
+        self.base, self.max_stake = base, max_stake
+        self.current = np.full(runs, base, dtype=float)
+        self.session = np.zeros(runs)
+
+    def stake(self):
+        return self.current
+
+    def update(self, win, pnl):
+        self.session += pnl
+        done = win & (self.session > 0)
+        needed = np.maximum(np.round((self.base - self.session) / self.base), 1) * self.base
+        self.current = np.where(win, np.minimum(self.current + self.base, needed), self.current)
+        done |= self.current > self.max_stake
+        self.current[done] = self.base
+        self.session[done] = 0
+
+
+class Sequence1326(Rule):
+    """Walk the 1-3-2-6 unit sequence on wins, back to the start on a loss or after completing it"""
+
+    UNITS = np.array([1.0, 3.0, 2.0, 6.0])
+
+    def __init__(self, runs, base):
+        self.base = base
+        self.position = np.zeros(runs, dtype=np.intp)
+
+    def stake(self):
+        return self.base * self.UNITS[self.position]
+
+    def update(self, win, pnl):
+        self.position = np.where(win, (self.position + 1) % 4, 0)
+
+
+def family(reference: str) -> str:
+    """
+    Money-management family of a reference strategy name, e.g. accumulators_dalembert_on_stat_reset -> dalembert;
+    raises ValueError for a name outside FAMILIES
+    """
+    name = reference.replace("accumulators_", "", 1)
+    found = next((candidate for candidate in FAMILIES if name.startswith(candidate)), None)
+    if found is None:
+        raise ValueError(f"Unknown strategy family: {reference}")
+    return found
+
+
+def _number(value):
+    if isinstance(value, str):
+        if value.upper() in ("TRUE", "FALSE"):
+            return value.upper() == "TRUE"
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return value
+
+
+def reference_values(spec: StrategySpec) -> Dict[str, Any]:
+    """Inputs a reference strategy renders with: its literal defaults, then the spec's fields and options"""
+    from strategy_core.strategy_library import default_library, spec_values
+
+    values = dict(FALLBACK_VALUES)
+    for name, parameter in default_library().get(spec.reference).parameters.items():
+        if parameter.default is not None:
+            values[name] = _number(parameter.default)
+    values.update(spec_values(spec))
+    return {name: _number(value) for name, value in values.items()}
+
+
+def build_rule(spec: StrategySpec, runs: int, values: Dict[str, Any]):
+    """Vectorized stake rule for the strategy a spec renders"""
+    if spec.reference is None:
+        return Flat(runs, float(spec.stake))
+    base = float(values["stake"])
+    max_stake = float(values["max_stake"]) if values["boolean_max_stake"] else math.inf
+    kind = family(spec.reference)
+    if kind in ("martingale", "reverse_martingale"):
+        return Martingale(runs, base, float(values["size"]), max_stake, reverse=kind == "reverse_martingale")
+    if kind in ("dalembert", "reverse_dalembert"):
+        if spec.reference == "dalembert":
+            # dalembert.xml adds its unit in currency, the other variants count units of the initial stake
+            step = float(values["alembert_unit"])
+        else:
+            step = float(values["dalembert_unit"]) * base
+        return DAlembert(runs, base, step, max_stake, reverse=kind == "reverse_dalembert")
+    if kind == "oscars_grind":
+        return OscarsGrind(runs, base, max_stake)
+    return Sequence1326(runs, base)
+
+
+def backtest(spec: StrategySpec, runs: int = 10000, max_trades: int = 1000, market: MarketModel = MarketModel(),
+             seed: Optional[int] = None, rng: Optional[np.random.Generator] = None,
+             deadline: Optional[float] = None) -> BacktestResult:
+    """
+    Simulate `runs` independent sessions of the strategy a spec renders, all advanced together one
+    trade per step, until each reaches its profit or loss threshold or `max_trades` trades
+    Stakes follow the strategy's money management; thresholds stop on the running total rounded to
+    cents, as the reference strategies' Trade Again logic does, or for a generated strategy on the
+    last contract's profit (read_details 4)
+    Raises TimeoutError once time.monotonic() passes `deadline`, rather than report truncated sessions
+    """
+    start = time.perf_counter()
+    rng = rng or np.random.default_rng(seed)
+    values = reference_values(spec) if spec.reference is not None else {}
+    rule = build_rule(spec, runs, values)
+
+    profit_threshold = float(values.get("profit", spec.profit_threshold))
+    loss_threshold = float(values.get("loss", spec.loss_threshold))
+    if spec.reference is not None and family(spec.reference) == "1_3_2_6":
+        # The 1-3-2-6 reference strategy stops at minus its profit threshold, not its loss threshold
+        loss_threshold = profit_threshold
+
+    accumulator = spec.reference is not None and spec.reference.startswith("accumulators_")
+    if accumulator:
+        growth = float(values["growth_rate"])
+        survival = (1 - market.accumulator_edge) / (1 + growth)
+        take_profit = float(values["take_profit"])
+        # Sold once the tick counter exceeds the count down, otherwise at the take profit level
+        ticks = float(values["tick_count"]) + 1 if values["boolean_tick_count"] else None
+
+    # Working state covers only the sessions still trading; `ids` maps it back to run numbers
+    ids = np.arange(runs)
+    total = np.zeros(runs)
+    peak = np.zeros(runs)
+    drawdown = np.zeros(runs)
+    peak_stake = np.zeros(runs)
+    result = BacktestResult(
+        profit=np.zeros(runs),
+        max_drawdown=np.zeros(runs),
+        trades=np.full(runs, max_trades, dtype=np.int64),
+        peak_stake=np.zeros(runs),
+        outcome=np.zeros(runs, dtype=np.int8),
+        seconds=0.0
+    )
+
+    def finish(index):
+        finished = ids[index]
+        result.profit[finished] = total[index]
+        result.max_drawdown[finished] = drawdown[index]
+        result.peak_stake[finished] = peak_stake[index]
+
+    for trade in range(1, max_trades + 1):
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("Backtest exceeded its deadline")
+        stake = rule.stake()
+        draws = rng.random(len(ids))
+        if accumulator:
+            if ticks is not None:
+                held = ticks
+            elif take_profit > 0:
+                held = np.ceil(np.log1p(take_profit / stake) / math.log1p(growth))
+            else:
+                # Without a take profit the contract is held until it is knocked out
+                held = np.inf
+            win = draws < survival ** held
+            pnl = np.where(win, stake * np.expm1(np.minimum(held, 1e6) * math.log1p(growth)), -stake)
+        else:
+            win = draws < market.win_probability
+            pnl = np.where(win, stake * market.payout, -stake)
+
+        total = np.round((total + pnl) * 100) / 100
+        np.maximum(peak, total, out=peak)
+        np.maximum(drawdown, peak - total, out=drawdown)
+        np.maximum(peak_stake, stake, out=peak_stake)
+        rule.update(win, pnl)
+
+        # A generated strategy compares the profit of the contract just settled, a reference one its running total
+        level = total if spec.reference is not None else np.round(pnl * 100) / 100
+        reached = level >= profit_threshold
+        ruined = level <= -loss_threshold
+        stopped = reached | ruined
+        if stopped.any():
+            finish(stopped)
+            result.outcome[ids[reached]] = 1
+            result.outcome[ids[ruined]] = -1
+            result.trades[ids[stopped]] = trade
+            keep = ~stopped
+            ids, total, peak, drawdown, peak_stake = ids[keep], total[keep], peak[keep], drawdown[keep], peak_stake[keep]
+            rule.take(keep)
+            if not len(ids):
+                break
+    finish(slice(None))
+
+    return result._replace(seconds=time.perf_counter() - start)
@@ -0,0 +1,80 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Tuple
+
+from strategy_core.batching import BATCH_WORKERS, INVALID_MESSAGES, group_items
+from strategy_core.strategy_generator import StrategySpec
+from strategy_core.strategy_library import default_library
+from strategy_core.strategy_parser import defaults_for
+
+
+def render_params(parser, cache, params: Dict[str, Any], kind: str = "prompt") -> Dict[str, Any]:
+    """Validate parameters read from an item of `kind` and render their strategy into a result object"""
+    if not parser.validate_parameters(params):
+        return {"error": INVALID_MESSAGES[kind]}
+    reference = params.get("reference")
+    if reference is not None and reference not in default_library().strategies:
+        return {"error": f"Unknown reference strategy: {reference}"}
+    if reference is not None:
+        try:
+            default_library().check_options(reference, params.get("options") or {})
+        except ValueError as e:
+            return {"error": str(e)}
+    entry = cache.get(StrategySpec.from_params(params))
+    if entry.digest is not None:
+        return {"strategy": entry.xml, "hash": entry.digest}
+    return {"strategy": entry.xml}
+
+
+def build_item(parser, cache, kind: str, value: Any) -> Dict[str, Any]:
+    """Parse or take the parameters of one batch item and render it"""
+    try:
+        if kind == "prompt":
+            params = parser.parse_prompt(value)
+        else:
+            params = {**defaults_for(value.get("reference")), **value}
+        return render_params(parser, cache, params, kind)
+    except Exception as e:
+        return {"error": f"Error generating strategy: {str(e)}"}
+
+
+async def build_item_async(parser, cache, kind: str, value: Any) -> Dict[str, Any]:
+    """Asynchronous variant of build_item for the ASGI server"""
+    try:
+        if kind == "prompt":
+            params = await parser.parse_prompt_async(value)
+        else:
+            params = {**defaults_for(value.get("reference")), **value}
+        # Rendering a miss takes milliseconds; keep it off the event loop
+        return await asyncio.to_thread(render_params, parser, cache, params, kind)
+    except Exception as e:
+        return {"error": f"Error generating strategy: {str(e)}"}
+
+
+def iter_batch(parser, cache, items: List[Tuple[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Build each distinct item once on a worker pool and yield indexed results as they finish"""
+    groups = group_items(items)
+    with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(groups))) as pool:
+        futures = {
+            pool.submit(build_item, parser, cache, items[indexes[0]][0], items[indexes[0]][1]): indexes
+            for indexes in groups.values()
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            for index in futures[future]:
+                yield {"index": index, **result}
+
+
+async def iter_batch_async(parser, cache, items: List[Tuple[str, Any]], limit: asyncio.Semaphore):
+    """Asynchronous variant of iter_batch running the distinct items concurrently under `limit`"""
+    groups = group_items(items)
+
+    async def build(indexes):
+        kind, value = items[indexes[0]]
+        async with limit:
+            return indexes, await build_item_async(parser, cache, kind, value)
+
+    for task in asyncio.as_completed([build(indexes) for indexes in groups.values()]):
+        indexes, result = await task
+        for index in indexes:
+            yield {"index": index, **result}
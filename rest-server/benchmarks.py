@@ -0,0 +1,1693 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the strategy generation hot paths, runnable offline
+`python benchmarks.py [names...] --json run.json --history history.jsonl` also writes the run's
+results as JSON and flags any result worse than the median of the previous runs by more than --threshold
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+# The shared strategy_core package sits at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from strategy_core import strategy_generator
+from strategy_core.fast_extractor import extract_parameters
+from strategy_core.strategy_cache import StrategyCache
+from strategy_core.strategy_generator import StrategyGenerator, StrategySpec, render_strategy_bytes, sweep_strategies, write_sweep_zip
+
+PARAMS = dict(duration=5, stake=10, initial_stake=10, profit_threshold=100, loss_threshold=50)
+
+# Prompts with the parameters a correct extraction must produce
+PROMPT_CORPUS = [
+    ("5 ticks, $10 stake, take profit 100, stop loss 50, on 1HZ10V",
+     dict(duration=5, stake=10, initial_stake=10, profit_threshold=100, loss_threshold=50, symbol="1HZ10V")),
+    ("Create a strategy with 5 tick duration, $10 stake, profit target of $100 and stop loss of $50",
+     dict(duration=5, stake=10, initial_stake=10, profit_threshold=100, loss_threshold=50)),
+    ("$3 stake for 7 ticks", dict(duration=7, stake=3, initial_stake=3)),
+    ("stake 2.5 on Volatility 100 (1s) Index, 3 ticks", dict(duration=3, stake=2.5, initial_stake=2.5, symbol="1HZ100V")),
+    ("initial stake $5, max loss 20, take-profit 40 on R_100",
+     dict(stake=5, initial_stake=5, profit_threshold=40, loss_threshold=20, symbol="R_100")),
+    ("Trade jump 10 index with 1,000 profit target, stake of 25 USD",
+     dict(stake=25, initial_stake=25, profit_threshold=1000, symbol="JD10", submarket="jump_index")),
+    ("stake: 1, duration: 10, profit threshold: 500, loss threshold: 250",
+     dict(duration=10, stake=1, initial_stake=1, profit_threshold=500, loss_threshold=250)),
+    ("Use a stake amount of 0.35 with 1 tick contracts", dict(duration=1, stake=0.35, initial_stake=0.35)),
+    ("10 dollars stake, stop-loss 30, target profit 60", dict(stake=10, initial_stake=10, profit_threshold=60, loss_threshold=30)),
+    ("stake 4 on WLDAUD for 5 ticks", dict(duration=5, stake=4, initial_stake=4, symbol="WLDAUD", market="basket_index")),
+    ("STAKE 20 TAKE PROFIT 200 STOP LOSS 100 1HZ25V", dict(stake=20, profit_threshold=200, loss_threshold=100, symbol="1HZ25V")),
+    ("Volatility 75 index, $2 stake, 4 ticks", dict(duration=4, stake=2, symbol="R_75")),
+    ("martingale with multiplier 2 and stake 1", dict(stake=1)),
+    ("I want a strategy that doubles my money safely", dict()),
+    ("stake 10 and then stake 20 after a loss", dict(stake=10)),
+    ("trade 1HZ10V and R_100 with stake 5", dict(stake=5)),
+    ("Start with five dollars and stop when I lose fifty", dict(stake=5, loss_threshold=50)),
+    ("oscars grind, stake 1, size 2, take profit 10", dict(stake=1, profit_threshold=10)),
+    ("stake of $15, 2 ticks, profit 45, loss 30 on jump 25 index",
+     dict(duration=2, stake=15, profit_threshold=45, loss_threshold=30, symbol="JD25")),
+    ("make me a bot with 3 ticks and a stake of 7.5 dollars", dict(duration=3, stake=7.5)),
+]
+
+# Prompts with numbers the extractor must not read at face value, so they go to the LLM
+NEGATIVE_PROMPTS = [
+    "stake 10, 5 ticks, take profit 1k, stop loss 50",
+    "stake 5, take profit 10%, stop loss 20",
+    "stake 5, 3 ticks, -50 loss",
+    "2x stake, 5 ticks",
+    "stake 10 times 2",
+    "raise the take profit to 1k",
+    "stake 5, duration 5 minutes",
+    "stake 2, stop after 3 losses",
+    "stake 1, target 3 wins",
+]
+
+
+class StubClient:
+    """
+    Local stand-in for anthropic.Anthropic that counts calls and answers with fixed JSON
+    With `respond`, each reply is respond(content) for the request's message content instead
+    """
+
+    def __init__(self, reply=None, delay=0.0, respond=None):
+        self.calls = 0
+        self.contents = []
+        self.reply = json.dumps(reply or {})
+        self.respond = respond
+        self.delay = delay
+        self.messages = self
+
+    def answer(self, kwargs):
+        self.calls += 1
+        content = kwargs["messages"][0]["content"]
+        self.contents.append(content)
+        text = self.respond(content) if self.respond else self.reply
+        return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+    def create(self, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.answer(kwargs)
+
+
+class AsyncStubClient(StubClient):
+    """Local stand-in for anthropic.AsyncAnthropic"""
+
+    async def create(self, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.answer(kwargs)
+
+
+def concat_strategy(variables, duration, stake, initial_stake, profit_threshold, loss_threshold):
+    """The previous f-string and `xml +=` rendering path, kept as a baseline"""
+    xml = strategy_generator.XML_HEADER
+    xml += '  <variables>\n'
+    for var in variables.values():
+        xml += f'    <variable type="{var["type"]}" id="{var["id"]}" '
+        xml += f'islocal="{var["islocal"]}" iscloud="{var["iscloud"]}">{var["name"]}</variable>\n'
+    xml += '  </variables>\n'
+    xml += strategy_generator.TRADE_DEFINITION_TEMPLATE.format(
+        market="synthetic_index", submarket="random_index", symbol="1HZ10V", duration=duration, stake=stake
+    )
+    xml += strategy_generator.INITIALIZATION_TEMPLATE.format(
+        initial_stake=initial_stake, profit_threshold=profit_threshold, loss_threshold=loss_threshold
+    )
+    xml += strategy_generator.BEFORE_PURCHASE_TEMPLATE.format(contract_type="CALL")
+    xml += strategy_generator.AFTER_PURCHASE_TEMPLATE.format(
+        profit_threshold=profit_threshold, loss_threshold=loss_threshold
+    )
+    xml += "</xml>"
+    return xml
+
+
+# Results of the current run by "benchmark.label", with the benchmark being run
+RESULTS = {}
+CURRENT = {"benchmark": None}
+
+
+def record(label, value, unit, better="lower"):
+    """Keep a result of the running benchmark for the JSON output and the history comparison"""
+    RESULTS[f"{CURRENT['benchmark']}.{label}"] = {"value": value, "unit": unit, "better": better}
+
+
+def measure(label, func, number):
+    """Print and record per-call time and allocated bytes for `func`"""
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Reported past any redirection silencing the code under test
+    print(f"{label:<24} {seconds * 1e6:8.2f} us/call  {peak:8d} B peak", file=sys.__stdout__)
+    record(label, seconds, "s")
+    record(f"{label} peak", peak, "B")
+    return seconds
+
+
+def bench_render(number=20000):
+    """Compare the compiled template engine against string concatenation"""
+    generator = StrategyGenerator()
+    generator.generate_strategy(**PARAMS)
+    assert concat_strategy(generator.variables, **PARAMS) == generator.generate_strategy(**PARAMS)
+
+    baseline = measure("concatenation", lambda: concat_strategy(generator.variables, **PARAMS), number)
+    compiled = measure("compiled template", lambda: generator.generate_strategy_bytes(**PARAMS), number)
+    print(f"speedup: {baseline / compiled:.1f}x")
+
+
+def spec_grid(count):
+    """Yield `count` strategy specs cycling over a parameter grid"""
+    values = itertools.product(range(1, 11), (1, 2.5, 10, 25), (50, 100, 1000), (25, 50.5, 500), ("1HZ10V", "R_100"))
+    for duration, stake, profit, loss, symbol in itertools.islice(itertools.cycle(values), count):
+        yield StrategySpec(duration, stake, stake, profit, loss, symbol=symbol)
+
+
+def bench_concurrency(count=5000, workers=16):
+    """Render from a thread pool and check every output matches a single-threaded render"""
+    specs = list(spec_grid(count))
+    expected = [render_strategy_bytes(spec) for spec in specs]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rendered = list(pool.map(render_strategy_bytes, specs))
+    elapsed = time.perf_counter() - start
+
+    mismatches = sum(a != b for a, b in zip(rendered, expected))
+    print(f"{count} strategies on {workers} threads in {elapsed:.3f}s, {mismatches} mismatches")
+    assert mismatches == 0
+
+
+def bench_cache(number=20000):
+    """Compare a cache hit against rendering and compressing from scratch"""
+    spec = StrategySpec(**PARAMS)
+    cache = StrategyCache(compress=True)
+    cache.get(spec)
+    measure("render", lambda: render_strategy_bytes(spec), number)
+    measure("cache hit", lambda: cache.get(spec), number)
+    print(cache.stats())
+
+
+def bench_fast_path():
+    """Accuracy of the rule-based extractor and the share of prompts served without the LLM"""
+    from strategy_core.strategy_parser import StrategyParser
+
+    client = StubClient()
+    parser = StrategyParser(client=client, cache=False)
+    served = correct = 0
+    for prompt, expected in PROMPT_CORPUS:
+        calls = client.calls
+        params = parser.parse_prompt(prompt)
+        if client.calls == calls:
+            served += 1
+            correct += all(params[key] == value for key, value in expected.items())
+    print(f"{served}/{len(PROMPT_CORPUS)} prompts served without a network call, "
+          f"{correct}/{served} of them extracted correctly")
+    for prompt in NEGATIVE_PROMPTS:
+        extraction = extract_parameters(prompt)
+        assert not extraction.complete and not extraction.understood, (prompt, extraction)
+        assert parser.refinement_delta(prompt) is None, prompt
+        calls = client.calls
+        parser.parse_prompt(prompt)
+        assert client.calls == calls + 1, prompt
+    print(f"{len(NEGATIVE_PROMPTS)} prompts with signed, scaled or unit numbers sent to the LLM")
+    measure("extract_parameters", lambda: extract_parameters(PROMPT_CORPUS[0][0]), 20000)
+
+
+class StubLLMServer:
+    """
+    Local HTTP server answering the Anthropic Messages API with fixed JSON after a delay
+    Replies take `token_delay` seconds per 4-character token: a blocking request waits for all of
+    them, a streaming one receives them as server-sent events; `text` overrides the reply text
+    `faults(n)` injects a fault into the n-th request: "overloaded" answers 529, "reset" drops the
+    connection and "hang" stalls for `hang_delay` seconds before answering
+    Reading the request takes `prefill_delay` seconds per 4-character token of its messages
+    """
+
+    def __init__(self, reply=None, delay=0.05, token_delay=0.0, text=None, faults=None, hang_delay=2.0,
+                 prefill_delay=0.0):
+        text = text if text is not None else json.dumps(reply or PROMPT_CORPUS[0][1])
+        tokens = [text[i:i + 4] for i in range(0, len(text), 4)]
+        body = json.dumps({
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": "stub",
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 100, "output_tokens": len(tokens)}
+        }).encode()
+        stub = self
+        self.tokens_sent = 0
+        self.tokens_received = 0
+        self.requests = 0
+        self.faults = faults
+        overloaded = json.dumps({"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}}).encode()
+
+        lock = threading.Lock()
+
+        def event(name, data):
+            return f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with lock:
+                    number = stub.requests
+                    stub.requests += 1
+                fault = stub.faults(number) if stub.faults else None
+                if fault == "reset":
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                received = sum((len(message["content"]) + 3) // 4 for message in request.get("messages", ()))
+                with lock:
+                    stub.tokens_received += received
+                time.sleep(delay + prefill_delay * received + (hang_delay if fault == "hang" else 0))
+                if fault == "overloaded":
+                    self.send_response(529)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(overloaded)))
+                    self.end_headers()
+                    self.wfile.write(overloaded)
+                    return
+                if request.get("stream"):
+                    return self.stream()
+                time.sleep(token_delay * len(tokens))
+                stub.tokens_sent += len(tokens)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # A hedged or timed-out request the client gave up on
+                    pass
+
+            def stream(self):
+                self.close_connection = True
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                message = json.loads(body)
+                message.update(content=[], stop_reason=None)
+                try:
+                    self.wfile.write(event("message_start", {"type": "message_start", "message": message}))
+                    self.wfile.write(event("content_block_start", {
+                        "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}
+                    }))
+                    for token in tokens:
+                        time.sleep(token_delay)
+                        self.wfile.write(event("content_block_delta", {
+                            "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}
+                        }))
+                        self.wfile.flush()
+                        stub.tokens_sent += 1
+                    self.wfile.write(event("content_block_stop", {"type": "content_block_stop", "index": 0}))
+                    self.wfile.write(event("message_delta", {
+                        "type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                        "usage": {"output_tokens": len(tokens)}
+                    }))
+                    self.wfile.write(event("message_stop", {"type": "message_stop"}))
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client left once it had what it needed
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+def report_latencies(label, latencies, elapsed):
+    """Print and record requests/sec and p50/p99 latency"""
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:<24} {len(latencies) / elapsed:8.1f} req/s  "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms", file=sys.__stdout__)
+    record(f"{label} throughput", len(latencies) / elapsed, "req/s", better="higher")
+    record(f"{label} p50", statistics.median(latencies), "s")
+    record(f"{label} p99", p99, "s")
+
+
+def bench_server_load(requests=400, workers=8, delay=0.05):
+    """
+    Flask with a fixed worker pool against the ASGI server, both calling a stub LLM over HTTP
+    All requests arrive at once, so latency includes time spent queued for a worker
+    """
+    import anthropic
+    from strategy_core.strategy_parser import StrategyParser
+    import asgi_server
+    import rest_server
+
+    prompts = [f"strategy number {i}" for i in range(requests)]
+    with StubLLMServer(delay=delay) as llm, contextlib.redirect_stdout(io.StringIO()):
+        rest_server.parser = StrategyParser(
+            client=anthropic.Anthropic(api_key="stub", base_url=llm.url), cache=False, fast_path=False
+        )
+        client = rest_server.app.test_client()
+
+        def timed_post(prompt):
+            assert client.post("/generate_strategy", json={"prompt": prompt}).status_code == 200
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            flask_latencies = list(pool.map(timed_post, prompts))
+        flask_elapsed = time.perf_counter() - start
+
+        async def run_asgi():
+            asgi_server.parser = StrategyParser(
+                client=rest_server.parser.client.client,
+                async_client=anthropic.AsyncAnthropic(api_key="stub", base_url=llm.url),
+                cache=False,
+                fast_path=False
+            )
+            asgi_client = asgi_server.app.test_client()
+
+            async def timed_post_async(prompt):
+                response = await asgi_client.post("/generate_strategy", json={"prompt": prompt})
+                assert response.status_code == 200
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(timed_post_async(prompt) for prompt in prompts))
+            return latencies, time.perf_counter() - start
+
+        asgi_latencies, asgi_elapsed = asyncio.run(run_asgi())
+
+    report_latencies(f"flask ({workers} workers)", flask_latencies, flask_elapsed)
+    report_latencies(f"asgi ({asgi_server.MAX_IN_FLIGHT} in flight)", asgi_latencies, asgi_elapsed)
+
+
+def bench_sweep(stakes=10, durations=10, profits=10, losses=100):
+    """Render a parameter grid into a zip archive and report wall time and peak RSS"""
+    ranges = dict(
+        stake=range(1, stakes + 1),
+        duration=range(1, durations + 1),
+        profit_threshold=range(100, 100 * (profits + 1), 100),
+        loss_threshold=range(10, 10 * (losses + 1), 10)
+    )
+    count = stakes * durations * profits * losses
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sweep.zip")
+        start = time.perf_counter()
+        written = write_sweep_zip(path, sweep_strategies(**ranges), compresslevel=1)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert written == count
+    print(f"{written} strategies archived in {elapsed:.1f}s ({size / 1e6:.1f} MB zip), "
+          f"peak RSS {rss_after / 1024:.0f} MB (+{(rss_after - rss_before) / 1024:.0f} MB)")
+
+    generator = StrategyGenerator()
+    sample = [spec for spec, _ in itertools.islice(sweep_strategies(**ranges), 10000)]
+    start = time.perf_counter()
+    for spec in sample:
+        generator.generate_strategy_bytes(spec.duration, spec.stake, spec.initial_stake,
+                                          spec.profit_threshold, spec.loss_threshold)
+    loop = (time.perf_counter() - start) / len(sample)
+    start = time.perf_counter()
+    for _ in itertools.islice(sweep_strategies(**ranges), len(sample)):
+        pass
+    swept = (time.perf_counter() - start) / len(sample)
+    print(f"per strategy: loop {loop * 1e6:.2f} us, sweep {swept * 1e6:.2f} us")
+
+
+def bench_library():
+    """Cold parse of the reference strategies against loading the cached index and a lookup"""
+    from strategy_core import strategy_library
+
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = os.path.join(directory, "index.json")
+        start = time.perf_counter()
+        cold = library = strategy_library.StrategyLibrary(index_path=index_path)
+        print(f"cold parse of {library.parsed} files   {(time.perf_counter() - start) * 1000:8.2f} ms")
+        start = time.perf_counter()
+        library = strategy_library.StrategyLibrary(index_path=index_path)
+        print(f"cached index load ({library.parsed} parsed) {(time.perf_counter() - start) * 1000:8.2f} ms")
+        # The cached index is plain JSON and rebuilds the same entries
+        assert library.parsed == 0 and library.strategies == cold.strategies
+        with open(index_path) as f:
+            assert json.load(f)["version"] == strategy_library.INDEX_VERSION
+    # By default it is kept outside the source tree
+    assert not strategy_library.default_library().index_path.startswith(os.path.abspath(strategy_library.REFERENCE_DIRECTORY))
+    measure("lookup", lambda: library.get("oscars_grind_max-stake"), 100000)
+
+
+def naive_reference(data, values):
+    """Baseline: parse the reference XML, set the parameter inputs and serialize it again"""
+    import xml.etree.ElementTree as ET
+    root = ET.fromstring(data)
+    for element in root.iter():
+        key = element.get("strategy_value")
+        if key not in values:
+            continue
+        if element.tag.endswith("field"):
+            element.text = str(values[key])
+        else:
+            for field in element.iter():
+                if field.tag.endswith("field") and field.get("name") in ("NUM", "BOOL"):
+                    field.text = str(values[key])
+    return ET.tostring(root)
+
+
+def bench_reference(number=20000):
+    """Splice parameters into a precompiled reference strategy against ElementTree parse-modify-serialize"""
+    import xml.etree.ElementTree as ET
+    from strategy_core import strategy_library
+
+    library = strategy_library.default_library()
+    spec = StrategySpec(initial_stake=3, profit_threshold=250, loss_threshold=80, reference="martingale_max-stake",
+                        options=(("max_stake", 40), ("size", 2.5)))
+    values = {key: getattr(spec, field) for field, key in strategy_library.SPEC_PARAMETERS[:4]}
+    values.update(spec.options)
+    data = library.get(spec.reference).xml
+
+    def literals(xml):
+        root = ET.fromstring(xml)
+        return sorted(
+            (element.get("strategy_value"), next(field.text for field in element.iter() if field.tag.endswith("field")))
+            for element in root.iter() if element.get("strategy_value")
+        )
+
+    assert literals(library.template(spec.reference).render(values)) == literals(naive_reference(data, values))
+    # A reference keeps its own market and thresholds for whatever the request leaves out
+    for name in ("martingale", "martingale_max-stake"):
+        own = library.get(name).xml
+        assert strategy_generator.render_strategy_bytes(StrategySpec.from_params({"reference": name})) == own
+        expected = library.template(name).render({"stake": 5})
+        assert strategy_generator.render_strategy_bytes(StrategySpec.from_params({"reference": name, "stake": 5})) == expected
+    for options in ({"no_such_input": 1}, {"size": [2]}, {"size": {"x": 1}}, {"size": float("nan")}):
+        try:
+            library.check_options("martingale", options)
+        except ValueError:
+            continue
+        raise AssertionError(options)
+    library.check_options("martingale", {"size": 3, "stake": 2.5})
+    start = time.perf_counter()
+    templates = [strategy_library.ReferenceTemplate(strategy.xml) for strategy in library.strategies.values()]
+    print(f"compile {len(templates)} templates      {(time.perf_counter() - start) * 1000:8.2f} ms")
+    naive = measure("ElementTree", lambda: naive_reference(data, values), number // 20)
+    splice = measure("splice", lambda: library.template(spec.reference).render(values), number)
+    measure("render_strategy_bytes", lambda: strategy_generator.render_strategy_bytes(spec), number)
+    print(f"speedup                  {naive / splice:8.1f}x")
+
+
+def bench_backtest(runs=20000):
+    """Vectorized backtest throughput on one core, in simulated sessions and trades per second"""
+    from backtest import backtest, family
+    from strategy_core.strategy_library import default_library
+
+    # Every reference strategy simulates as one of the known families; any other name is an input error
+    for name in default_library().names():
+        family(name)
+    try:
+        family("no_such_strategy")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown family accepted")
+
+    specs = [
+        ("generated", StrategySpec(stake=1, profit_threshold=20, loss_threshold=20)),
+        ("martingale", StrategySpec(profit_threshold=50, loss_threshold=100, reference="martingale", options=(("size", 2),))),
+        ("oscars_grind", StrategySpec(profit_threshold=50, loss_threshold=100, reference="oscars_grind")),
+        ("1_3_2_6", StrategySpec(profit_threshold=50, loss_threshold=100, reference="1_3_2_6")),
+        ("accumulators_dalembert", StrategySpec(profit_threshold=50, loss_threshold=100, reference="accumulators_dalembert")),
+    ]
+    for label, spec in specs:
+        backtest(spec, runs=100, seed=0)
+        result = backtest(spec, runs=runs, seed=0)
+        summary = result.summary()
+        print(f"{label:<24} {summary['runs_per_second']:10.0f} runs/s {result.trades.sum() / result.seconds:12.0f} trades/s"
+              f"  ruin {summary['ruin_probability']:.3f}  mean {summary['profit']['mean']:8.2f}")
+
+
+def bench_risk(runs=10000):
+    """Risk scoring latency on 1 and N worker processes, against the time budget, and on a cache hit"""
+    from risk import RiskScorer
+
+    spec = StrategySpec(profit_threshold=50, loss_threshold=100, reference="martingale", options=(("size", 2),))
+    counts = sorted({1, os.cpu_count() or 1})
+    for workers in counts:
+        scorer = RiskScorer(runs=runs, workers=workers, time_budget=60)
+        scorer.start()
+        start = time.perf_counter()
+        summary = scorer.score(spec)
+        print(f"{workers} worker(s)              {(time.perf_counter() - start) * 1000:8.2f} ms  "
+              f"loss probability {summary['loss_probability']:.4f}")
+        measure("cache hit", lambda: scorer.score(spec), 10000)
+        scorer.close()
+
+    for budget in (0.01, 0.05):
+        scorer = RiskScorer(runs=runs * 10, workers=counts[-1], time_budget=budget)
+        scorer.start()
+        start = time.perf_counter()
+        summary = scorer.score(spec)
+        print(f"budget {budget * 1000:4.0f} ms             {(time.perf_counter() - start) * 1000:8.2f} ms  "
+              f"{summary['runs'] if summary else 0} of {runs * 10} runs")
+        # A truncated summary is cached, so the spec costs the budget once
+        assert scorer.score(spec) is summary and scorer.stats()["timeouts"] == 1 and scorer.stats()["hits"] == 1
+        scorer.close()
+
+    # Scoring before start() runs in the calling thread rather than bringing up the pool mid-request
+    scorer = RiskScorer(runs=runs, workers=2, time_budget=0.05)
+    scorer.score(spec)
+    assert scorer._pool is None
+
+
+def run_cycles(program, cycles):
+    """Drive a compiled strategy through purchase cycles with a fixed win/loss pattern, restarting when it stops"""
+    env = program.env
+    program.reset()
+    program.initialization()
+    for cycle in range(cycles):
+        env.purchased = None
+        program.before_purchase()
+        stake = program.amount()
+        program.tick_analysis()
+        env.sell_available = True
+        program.during_purchase()
+        win = cycle % 3 != 0
+        env.result = "win" if win else "loss"
+        env.details[4] = round(stake * 0.95, 2) if win else -stake
+        env.trade_again = False
+        program.after_purchase()
+        if not env.trade_again:
+            program.reset()
+            program.initialization()
+
+
+def bench_interpreter(cycles=20000):
+    """Compile each reference strategy to closures and run its purchase cycle; blocks/s counts executed blocks"""
+    import interpreter
+    from strategy_core import strategy_library
+
+    library = strategy_library.default_library()
+    values = {"stake": 1, "profit": 50, "loss": 50, "size": 2}
+    total_blocks = total_seconds = 0
+    for name in library.names():
+        xml = library.template(name).render(values)
+        start = time.perf_counter()
+        program = interpreter.compile_strategy(xml, interpreter.Environment(inputs=values))
+        compiled = time.perf_counter() - start
+
+        counter = [0]
+        run_cycles(interpreter.compile_strategy(xml, interpreter.Environment(inputs=values), counter), 1000)
+        blocks_per_cycle = counter[0] / 1000
+        start = time.perf_counter()
+        run_cycles(program, cycles)
+        seconds = time.perf_counter() - start
+        total_blocks += blocks_per_cycle * cycles
+        total_seconds += seconds
+        print(f"{name:<45} compile {compiled * 1000:6.2f} ms  {cycles / seconds:9.0f} cycles/s  "
+              f"{blocks_per_cycle:5.1f} blocks/cycle  {blocks_per_cycle * cycles / seconds / 1e6:5.2f}M blocks/s")
+    print(f"{'all':<45} {total_blocks / total_seconds / 1e6:5.2f}M blocks/s")
+
+    # A strategy that never purchases lets the market run on until max_ticks without trading
+    purchase = b"""      <block type="purchase" id="purchase">
+        <field name="PURCHASE_LIST">CALL</field>
+      </block>"""
+    guarded = b"""      <block type="controls_if">
+        <value name="IF0"><block type="logic_boolean"><field name="BOOL">FALSE</field></block></value>
+        <statement name="DO0">%s</statement>
+      </block>""" % purchase
+    xml = render_strategy_bytes(StrategySpec(**PARAMS)).replace(purchase, guarded)
+    assert guarded in xml
+    assert interpreter.simulate(interpreter.compile_strategy(xml), max_ticks=1000) == (0.0, 0)
+
+
+def bench_streaming(concurrency=64):
+    """
+    Traced memory per in-flight /generate_strategy response for the largest reference strategy,
+    buffered JSON against the streamed modes, with `concurrency` slow clients each reading one chunk in turn
+    """
+    import gc
+    import rest_server
+    from strategy_core.strategy_parser import StrategyParser
+
+    rest_server.parser = StrategyParser(client=StubClient(), cache=False)
+    client = rest_server.app.test_client()
+    body = {"prompt": PROMPT_CORPUS[0][0], "reference": "oscars_grind_max-stake", "risk": False}
+    gzip = {"Accept-Encoding": "gzip"}
+    modes = [
+        ("json", {}, {}),
+        ("json stream", {"stream": True}, {}),
+        ("json stream gzip", {"stream": True}, gzip),
+        ("xml stream", {"format": "xml"}, {}),
+        ("xml stream gzip", {"format": "xml"}, gzip),
+    ]
+    for cached in (False, True):
+        rest_server.cache = StrategyCache(max_bytes=16 * 1024 * 1024 if cached else 0, compress=True,
+                                          envelope=rest_server.json_envelope)
+        print(f"-- {'cache hit' if cached else 'cache miss'}")
+        for label, extra, headers in modes:
+            client.post("/generate_strategy", json={**body, **extra}, headers=headers)
+            gc.collect()
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            responses = [
+                client.post("/generate_strategy", json={**body, **extra}, headers=headers, buffered=False)
+                for _ in range(concurrency)
+            ]
+            streams = [iter(response.response) for response in responses]
+            sent = 0
+            while streams:
+                for stream in list(streams):
+                    chunk = next(stream, None)
+                    if chunk is None:
+                        streams.remove(stream)
+                    else:
+                        sent += len(chunk)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            for response in responses:
+                response.close()
+            print(f"{label:<18} {(peak - baseline) / concurrency / 1024:8.1f} KiB/request peak  "
+                  f"{sent / concurrency / 1024:6.1f} KiB sent  {elapsed / concurrency * 1000:6.2f} ms/request (traced)")
+
+
+def wire_bytes(response):
+    """Bytes a response puts on the wire: status line, headers and body"""
+    head = f"HTTP/1.1 {response.status}\r\n" + "".join(f"{name}: {value}\r\n" for name, value in response.headers.items())
+    return len(head) + 2 + len(response.get_data())
+
+
+def bench_http_cache(repeats=20):
+    """
+    Bytes on the wire for `repeats` identical requests: POST against GET with compression and
+    a client revalidating with If-None-Match; each mode must send less than the one before
+    """
+    import rest_server
+    from strategy_core.strategy_parser import StrategyParser
+
+    rest_server.parser = StrategyParser(client=StubClient(), cache=False)
+    rest_server.cache = StrategyCache(compress=True, envelope=rest_server.json_envelope)
+    client = rest_server.app.test_client()
+    for reference in (None, "oscars_grind_max-stake"):
+        params = {"stake": 10, "duration": 5, "profit_threshold": 100, "loss_threshold": 50, "risk": "false"}
+        if reference:
+            params["reference"] = reference
+        query = "/generate_strategy?" + "&".join(f"{name}={value}" for name, value in params.items())
+        prompt = {"prompt": PROMPT_CORPUS[0][0], "reference": reference, "risk": False}
+
+        def repeated(method, url, headers=None, revalidate=False, **kwargs):
+            total = 0
+            etag = None
+            for _ in range(repeats):
+                sent = dict(headers or {}, **({"If-None-Match": etag} if revalidate and etag else {}))
+                response = method(url, headers=sent, **kwargs)
+                assert response.status_code in (200, 304)
+                etag = response.headers.get("ETag")
+                total += wire_bytes(response)
+            return total
+
+        gzip = {"Accept-Encoding": "gzip"}
+        modes = [
+            ("POST json", repeated(client.post, "/generate_strategy", json=prompt)),
+            ("GET json", repeated(client.get, query)),
+            ("GET json gzip", repeated(client.get, query, gzip)),
+            ("GET json gzip + etag", repeated(client.get, query, gzip, revalidate=True)),
+            ("GET xml gzip + etag", repeated(client.get, query + "&format=xml", gzip, revalidate=True)),
+        ]
+        print(f"-- {reference or 'generated'}")
+        baseline = modes[0][1]
+        for label, total in modes:
+            print(f"{label:<22} {total / repeats:9.0f} B/request  {baseline / total:6.1f}x fewer bytes than POST")
+        assert modes[2][1] < modes[1][1] and modes[3][1] < modes[2][1]
+
+
+def extraction_reply(content):
+    """Stub LLM reply with what the rule-based extractor finds in the request's sentence or numbered sentences"""
+    sentences = re.findall(r"^\s*\d+\. '(.*)'$", content, re.M)
+    if sentences:
+        return json.dumps([extract_parameters(sentence).params for sentence in sentences])
+    return json.dumps(extract_parameters(re.search(r"sentence\? '(.*)'$", content, re.M).group(1)).params)
+
+
+def bench_coalescing(users=64, delay=0.05):
+    """
+    LLM calls made by `users` concurrent requests against a stub LLM with `delay` seconds of latency:
+    equivalent prompts with and without single-flight coalescing, distinct prompts with and without
+    micro-batching; every caller must still get its own prompt's parameters
+    """
+    from strategy_core.strategy_parser import DEFAULT_PARAMETERS, StrategyParser
+
+    same = [f"{' ' * (i % 3)}Stake {'  ' if i % 2 else ' '}5 for 3 TICKS" if i % 4 else "stake 5 for 3 ticks"
+            for i in range(users)]
+    distinct = [f"stake {i + 1} for {i % 9 + 1} ticks" for i in range(users)]
+
+    def check(prompts, results):
+        for prompt, result in zip(prompts, results):
+            assert result == {**DEFAULT_PARAMETERS, **extract_parameters(prompt).params}, (prompt, result)
+
+    def threaded(prompts, **options):
+        client = StubClient(delay=delay, respond=extraction_reply)
+        parser = StrategyParser(client=client, cache=False, fast_path=False, **options)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            results = list(pool.map(parser.parse_prompt, prompts))
+        return time.perf_counter() - start, client, parser, results
+
+    def asynchronous(prompts, **options):
+        client = AsyncStubClient(delay=delay, respond=extraction_reply)
+        parser = StrategyParser(client=client, async_client=client, cache=False, fast_path=False, **options)
+
+        async def run():
+            return await asyncio.gather(*(parser.parse_prompt_async(prompt) for prompt in prompts))
+
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        return time.perf_counter() - start, client, parser, results
+
+    runs = [
+        ("same, threads", same, threaded, dict(coalesce=False)),
+        ("same, threads, coalesced", same, threaded, {}),
+        ("same, async, coalesced", same, asynchronous, {}),
+        ("distinct, threads", distinct, threaded, {}),
+        ("distinct, threads, batched", distinct, threaded, dict(batch_window=0.01, max_batch=16)),
+        ("distinct, async, batched", distinct, asynchronous, dict(batch_window=0.01, max_batch=16)),
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        outcomes = [(label, prompts, run(prompts, **options)) for label, prompts, run, options in runs]
+    for label, prompts, (elapsed, client, parser, results) in outcomes:
+        check(prompts, results)
+        print(f"{label:<28} {client.calls:3d} LLM calls for {len(prompts)} prompts  {elapsed * 1000:7.1f} ms  {parser.stats()}")
+
+
+def bench_streaming_llm(prompts=5, token_delay=0.005):
+    """
+    Time to parameters through the Anthropic SDK against a stub streaming one 4-character token per
+    `token_delay` seconds, for a reply wrapping its JSON in prose: blocking create against streaming
+    with early exit once the JSON closes. The blocking parse used to fail on such replies
+    """
+    import anthropic
+    from strategy_core.llm_client import AsyncResilientClient
+    from strategy_core.strategy_parser import StrategyParser
+
+    from strategy_core.incremental_json import JSONScanner, find_json
+
+    # Bracketed prose is skipped in one pass, however much of it comes before the JSON or in how many pieces
+    prose = "{x}" * 5000
+    start = time.perf_counter()
+    assert find_json(prose + '{"stake": 5}') == {"stake": 5}
+    scanner = JSONScanner()
+    assert all(scanner.feed(piece) is None for piece in prose) and scanner.feed('{"stake": 5}') == {"stake": 5}
+    print(f"find_json after {len(prose)} characters of bracketed prose: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    params = PROMPT_CORPUS[0][1]
+    text = ("Sure! Here are the trading parameters I found in your sentence:\n```json\n" + json.dumps(params, indent=2)
+            + "\n```\nThe duration is in ticks and the thresholds are in your account currency. Let me know "
+              "if you would like to adjust the stake or add a martingale multiplier to this strategy.")
+    with StubLLMServer(delay=0.01, token_delay=token_delay, text=text) as llm, \
+            contextlib.redirect_stdout(io.StringIO()):
+        client = anthropic.Anthropic(api_key="stub", base_url=llm.url, max_retries=0)
+        timings = {}
+        for stream in (False, True):
+            parser = StrategyParser(client=client, cache=False, fast_path=False, coalesce=False, stream=stream)
+            parser.request_parameters(PROMPT_CORPUS[0][0])
+            sent = llm.tokens_sent
+            latencies = []
+            for _ in range(prompts):
+                start = time.perf_counter()
+                assert parser.request_parameters(PROMPT_CORPUS[0][0]) == params
+                latencies.append(time.perf_counter() - start)
+            generated = (llm.tokens_sent - sent) / prompts
+
+            async def run_async():
+                # The async client's connections belong to this event loop
+                parser.async_client = AsyncResilientClient(
+                    anthropic.AsyncAnthropic(api_key="stub", base_url=llm.url, max_retries=0), parser.client.policy
+                )
+                await parser.request_parameters_async(PROMPT_CORPUS[0][0])
+                start = time.perf_counter()
+                assert await parser.request_parameters_async(PROMPT_CORPUS[0][0]) == params
+                return time.perf_counter() - start
+
+            timings[stream] = (statistics.median(latencies), asyncio.run(run_async()), generated)
+
+    tokens = (len(text) + 3) // 4
+    for stream, (latency, async_latency, sent) in timings.items():
+        print(f"{'streaming' if stream else 'blocking':<10} {latency * 1000:7.1f} ms to parameters  "
+              f"(async {async_latency * 1000:7.1f} ms)  {sent:.0f}/{tokens} tokens generated")
+    print(f"speedup: {timings[False][0] / timings[True][0]:.1f}x")
+
+
+def bench_resilience(calls=60, delay=0.02):
+    """
+    The resilient LLM client against a stub injecting faults: retries under a 20% error rate,
+    hedging under a 10% slow tail, the circuit breaker through an outage and the deadline
+    against a hanging upstream. Calls the client cannot complete fall back to the rule-based extractor
+    """
+    import anthropic
+    from strategy_core.llm_client import AsyncResilientClient, ResiliencePolicy
+    from strategy_core.strategy_parser import StrategyParser
+
+    prompt, params = PROMPT_CORPUS[0]
+    fast = ResiliencePolicy(backoff_base=0.01, backoff_cap=0.05)
+
+    def run(llm, policy, number=calls):
+        parser = StrategyParser(client=anthropic.Anthropic(api_key="stub", base_url=llm.url, max_retries=0),
+                                cache=False, fast_path=False, coalesce=False, stream=False, policy=policy)
+        latencies = []
+        for _ in range(number):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = parser.parse_prompt(prompt)
+            assert all(result[key] == value for key, value in params.items())
+            latencies.append(time.perf_counter() - start)
+        return parser, sorted(latencies)
+
+    def p99(latencies):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+    # Every fifth request answers 529 Overloaded, every 17th drops the connection
+    flaky = lambda n: "overloaded" if n % 5 == 2 else "reset" if n % 17 == 9 else None
+    with StubLLMServer(delay=delay, faults=flaky) as llm:
+        rates = {}
+        for attempts in (1, 3):
+            parser, latencies = run(llm, fast._replace(max_attempts=attempts, failure_threshold=calls))
+            rates[attempts] = 1 - parser.fallbacks / calls
+            print(f"flaky, {attempts} attempt(s)      {rates[attempts]:6.1%} served by the LLM  "
+                  f"p50 {statistics.median(latencies) * 1000:6.1f} ms  {parser.client.stats()}")
+        assert rates[3] > rates[1] and rates[3] >= 0.95
+
+    # One request in ten stalls for half a second
+    with StubLLMServer(delay=delay, faults=lambda n: "hang" if n % 10 == 3 else None, hang_delay=0.5) as llm:
+        tails = {}
+        for hedge_after in (None, 0.1):
+            parser, latencies = run(llm, fast._replace(hedge_after=hedge_after))
+            tails[hedge_after] = p99(latencies)
+            print(f"slow tail, hedge after {hedge_after}  p50 {statistics.median(latencies) * 1000:6.1f} ms  "
+                  f"p99 {tails[hedge_after] * 1000:6.1f} ms  {parser.client.stats()}")
+        assert tails[0.1] < tails[None] / 2
+
+        async def run_async():
+            async_client = AsyncResilientClient(
+                anthropic.AsyncAnthropic(api_key="stub", base_url=llm.url, max_retries=0), fast._replace(hedge_after=0.1)
+            )
+            latencies = []
+            for _ in range(calls // 2):
+                start = time.perf_counter()
+                await async_client.create(model="stub", max_tokens=10, messages=[{"role": "user", "content": prompt}])
+                latencies.append(time.perf_counter() - start)
+            return sorted(latencies), async_client.stats()
+
+        latencies, stats = asyncio.run(run_async())
+        print(f"slow tail, async hedge      p50 {statistics.median(latencies) * 1000:6.1f} ms  "
+              f"p99 {p99(latencies) * 1000:6.1f} ms  {stats}")
+        assert p99(latencies) < tails[None] / 2
+
+    # A full outage, then recovery: the breaker stops the calls reaching the upstream and a trial closes it
+    outage = True
+    with StubLLMServer(delay=delay, faults=lambda n: "overloaded" if outage else None) as llm:
+        for threshold in (calls, 5):
+            parser, latencies = run(llm, fast._replace(failure_threshold=threshold, reset_timeout=0.2), calls // 2)
+            print(f"outage, breaker at {threshold:<3d}     mean {statistics.mean(latencies) * 1000:6.1f} ms  "
+                  f"{llm.requests:3d} upstream requests  {parser.client.stats()}")
+            requests, llm.requests = llm.requests, 0
+        assert requests < calls // 2 and parser.client.breaker.state == "open"
+        assert parser.fallbacks == calls // 2
+        outage = False
+        time.sleep(0.2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser.parse_prompt(prompt)
+        assert parser.client.breaker.state == "closed"
+        print(f"recovered after the reset timeout: {parser.client.stats()}")
+
+    # Every request hangs for two seconds; the deadline bounds the wait
+    with StubLLMServer(delay=delay, faults=lambda n: "hang") as llm:
+        parser, latencies = run(llm, fast._replace(deadline=0.3, attempt_timeout=0.15), 3)
+        print(f"hanging upstream, 0.3 s deadline  max {latencies[-1] * 1000:6.1f} ms  {parser.client.stats()}")
+        assert latencies[-1] < 0.5 and parser.fallbacks == 3
+
+
+# Instrumentation may add at most this much to a request, enabled or disabled
+METRICS_BUDGET = {True: 30e-6, False: 5e-6}
+
+
+def bench_metrics(number=20000, requests=2000):
+    """
+    Per-request cost of the instrumentation: the stage timers, request counter and token count a
+    /generate_strategy request records, with metrics enabled and disabled, then the same comparison
+    end to end on cached GET requests through Flask; checks /metrics and the MCP resource expose them
+    """
+    import rest_server
+    import strategy_server
+    from strategy_core.metrics import METRICS
+
+    usage = SimpleNamespace(input_tokens=100, output_tokens=40)
+
+    def instrumented_request():
+        for stage in ("cache_lookup", "normalize", "llm", "validate", "render", "serialize"):
+            with METRICS.stage(stage):
+                pass
+        METRICS.count_tokens(usage)
+        METRICS.count_request("generate_strategy", 200, 0.01)
+
+    client = rest_server.app.test_client()
+    url = "/generate_strategy?stake=10&duration=5&risk=false"
+    get = lambda: client.get(url)
+    costs = {}
+    for enabled in (False, True):
+        METRICS.enabled = enabled
+        costs[enabled] = measure(f"instrumentation, {'on' if enabled else 'off'}", instrumented_request, number)
+    for enabled in (False, True):
+        assert costs[enabled] < METRICS_BUDGET[enabled], f"{costs[enabled] * 1e6:.2f} us per request"
+
+    # End to end the overhead is a few percent of a request, within this machine's run-to-run noise:
+    # warm up, then time the two modes in alternating short rounds and take the median difference
+    for _ in range(requests // 4):
+        get()
+    batch = requests // 100
+    latencies = {False: [], True: []}
+    for _ in range(100):
+        for enabled in (False, True):
+            METRICS.enabled = enabled
+            latencies[enabled].append(timeit.timeit(get, number=batch) / batch)
+    METRICS.enabled = True
+    overhead = statistics.median(on - off for off, on in zip(latencies[False], latencies[True]))
+    print(f"cached GET /generate_strategy  off {min(latencies[False]) * 1e6:7.1f} us  on {min(latencies[True]) * 1e6:7.1f} us  "
+          f"overhead {overhead * 1e6:+.1f} us (budget {METRICS_BUDGET[True] * 1e6:.0f} us)")
+    assert overhead < METRICS_BUDGET[True], f"{overhead * 1e6:.1f} us per request end to end"
+
+    scraped = client.get("/metrics").get_data(as_text=True)
+    assert 'strategy_requests_total{endpoint="get_strategy",status="200"}' in scraped
+    assert 'strategy_stage_duration_seconds_count{stage="render"}' in scraped
+    resource = asyncio.run(strategy_server.mcp.read_resource("metrics://prometheus"))
+    assert "# TYPE llm_tokens_total counter" in resource[0].content
+    print(f"/metrics: {len(scraped.splitlines())} lines, {len(scraped)} bytes")
+
+    # Timings are queued for their histograms, but a caller that only times stages never scrapes;
+    # the queue is still added up once MAX_PENDING timings are waiting
+    from strategy_core.metrics import MAX_PENDING, Metrics
+    registry = Metrics()
+    for _ in range(MAX_PENDING * 3):
+        with registry.stage("render"):
+            pass
+    assert len(registry._pending) < MAX_PENDING
+
+
+def bench_generator(number=20000):
+    """StrategyGenerator.generate_strategy throughput, peak allocation and memory blocks kept per call"""
+    generator = StrategyGenerator()
+    generator.generate_strategy(**PARAMS)
+    seconds = measure("generate_strategy", lambda: generator.generate_strategy(**PARAMS), number)
+    measure("generate_strategy_bytes", lambda: generator.generate_strategy_bytes(**PARAMS), number)
+    record("generate_strategy throughput", 1 / seconds, "calls/s", better="higher")
+
+    # Blocks still allocated per call with the results kept: the strategy string and nothing else
+    kept = []
+    blocks = sys.getallocatedblocks()
+    for _ in range(1000):
+        kept.append(generator.generate_strategy(**PARAMS))
+    retained = (sys.getallocatedblocks() - blocks) / len(kept)
+    print(f"generate_strategy        {1 / seconds:8.0f} calls/s  {retained:8.2f} blocks kept per call")
+    record("generate_strategy blocks kept", retained, "blocks")
+
+
+def bench_parse_prompt(number=2000):
+    """StrategyParser.parse_prompt latency through the rule-based fast path, the prompt cache and a stubbed LLM"""
+    from strategy_core.prompt_cache import PromptCache, normalize_prompt
+    from strategy_core.strategy_parser import StrategyParser
+
+    # Only valid thousands groups lose their commas
+    assert normalize_prompt("Stake 1,000.50") == normalize_prompt("stake 1000.5")
+    assert normalize_prompt("stake 1,5") != normalize_prompt("stake 15")
+    assert normalize_prompt("ticks 1,2,3") != normalize_prompt("ticks 123")
+    assert normalize_prompt("stake 1,2345") != normalize_prompt("stake 12345")
+    prompt, params = PROMPT_CORPUS[1]
+    with contextlib.redirect_stdout(io.StringIO()):
+        fast = StrategyParser(client=StubClient(), cache=False)
+        llm = StrategyParser(client=StubClient(reply=params), cache=False, fast_path=False)
+        cached = StrategyParser(client=StubClient(reply=params), cache=PromptCache(path=":memory:"), fast_path=False)
+        cached.parse_prompt(prompt)
+        for parser in (fast, llm, cached):
+            result = parser.parse_prompt(prompt)
+            assert all(result[key] == value for key, value in params.items())
+        measure("fast path", lambda: fast.parse_prompt(prompt), number)
+        measure("prompt cache hit", lambda: cached.parse_prompt(prompt), number)
+        measure("stubbed LLM", lambda: llm.parse_prompt(prompt), number)
+
+
+def bench_endpoints(requests=500):
+    """
+    Requests/sec of POST /generate_strategy through the Flask test client and the ASGI test
+    client, one at a time with a stubbed LLM and risk scoring off: routing, parsing and rendering only
+    """
+    from strategy_core.strategy_parser import StrategyParser
+    import asgi_server
+    import rest_server
+
+    prompt, params = PROMPT_CORPUS[1]
+    body = {"prompt": prompt, "risk": False}
+    with contextlib.redirect_stdout(io.StringIO()):
+        rest_server.parser = StrategyParser(client=StubClient(reply=params), cache=False, fast_path=False)
+        client = rest_server.app.test_client()
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(requests):
+            sent = time.perf_counter()
+            assert client.post("/generate_strategy", json=body).status_code == 200
+            latencies.append(time.perf_counter() - sent)
+        report_latencies("flask", latencies, time.perf_counter() - start)
+
+        async def run_asgi():
+            asgi_server.parser = StrategyParser(
+                client=StubClient(reply=params), async_client=AsyncStubClient(reply=params), cache=False, fast_path=False
+            )
+            asgi_client = asgi_server.app.test_client()
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(requests):
+                sent = time.perf_counter()
+                response = await asgi_client.post("/generate_strategy", json=body)
+                assert response.status_code == 200
+                latencies.append(time.perf_counter() - sent)
+            return latencies, time.perf_counter() - start
+
+        report_latencies("asgi", *asyncio.run(run_asgi()))
+
+
+def bench_mcp(calls=200):
+    """MCP round trips to the strategy server over in-memory streams: tool calls and a resource read"""
+    from mcp.shared.memory import create_connected_server_and_client_session
+    from strategy_core.strategy_parser import StrategyParser
+    import strategy_server
+
+    prompt, params = PROMPT_CORPUS[1]
+
+    async def round_trips():
+        strategy_server.parser = StrategyParser(client=StubClient(reply=params), async_client=AsyncStubClient(reply=params),
+                                                cache=False, fast_path=False)
+        # The opening prompt and the follow-up are both read by the rule-based extractor
+        strategy_server.refiner.parser = StrategyParser(client=StubClient(reply=params), cache=False)
+        timings = {}
+        logged = []
+
+        async def log(params):
+            logged.append(params.data)
+
+        async with create_connected_server_and_client_session(strategy_server.mcp, logging_callback=log) as session:
+            result = await session.call_tool("refine_strategy", {"message": "stake 20", "session": "no-such-session"})
+            assert "Unknown or expired session" in result.content[0].text, result
+            # Errors reach the client as log messages, worded for the tool that failed
+            result = await session.call_tool("generate_strategy", {"prompt": prompt, "reference": "no_such_strategy"})
+            assert result.content[0].text == "Unknown reference strategy: no_such_strategy"
+            result = await session.call_tool("generate_strategies", {"parameters": [{"stake": -1}]})
+            assert result.content[0].text == "Invalid strategy parameters", result
+            result = await session.call_tool("generate_strategies", {})
+            assert result.content[0].text == "Missing prompts or parameters", result
+            assert logged[1:] == ["Unknown reference strategy: no_such_strategy", "Item 0: Invalid strategy parameters",
+                                  "Missing prompts or parameters"], logged
+            opened = json.loads((await session.call_tool("refine_strategy", {"message": prompt})).content[0].text)
+            requests = {
+                "generate_strategy": lambda: session.call_tool("generate_strategy", {"prompt": prompt}),
+                "generate_strategies": lambda: session.call_tool("generate_strategies", {"prompts": [prompt] * 4}),
+                "refine_strategy": lambda: session.call_tool(
+                    "refine_strategy", {"message": "same as before but stake 20", "session": opened["session"]}
+                ),
+                "reference resource": lambda: session.read_resource("reference://strategies/martingale")
+            }
+            for label, request in requests.items():
+                result = await request()
+                assert not getattr(result, "isError", False), result
+                latencies = []
+                for _ in range(calls):
+                    start = time.perf_counter()
+                    await request()
+                    latencies.append(time.perf_counter() - start)
+                timings[label] = latencies
+        return timings
+
+    # The server logs every request
+    logging.disable(logging.INFO)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            timings = asyncio.run(round_trips())
+    finally:
+        logging.disable(logging.NOTSET)
+    for label, latencies in timings.items():
+        report_latencies(label, latencies, sum(latencies))
+
+
+# Run in a fresh interpreter by bench_startup: import a server, then time its first responses
+STARTUP_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[1])))
+module, mode, prompts = sys.argv[2], sys.argv[3], json.loads(sys.argv[4])
+server = __import__(module)
+result = {"import": time.perf_counter() - start, "anthropic": "anthropic" in sys.modules}
+if mode == "serve":
+    client = server.app.test_client()
+    for label, prompt in prompts.items():
+        sent = time.perf_counter()
+        assert client.post("/generate_strategy", json={"prompt": prompt, "risk": False}).status_code == 200
+        result[label] = time.perf_counter() - sent
+elif mode in ("fork", "preload"):
+    from strategy_core.prefork import preload
+    if mode == "preload":
+        preload(server.parser)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        sent = time.perf_counter()
+        response = server.app.test_client().post("/generate_strategy", json={"prompt": prompts["llm"], "risk": False})
+        os.write(write, json.dumps([response.status_code, time.perf_counter() - sent]).encode())
+        os._exit(0)
+    os.waitpid(pid, 0)
+    status, result["worker"] = json.loads(os.read(read, 1000))
+    assert status == 200
+print(json.dumps(result))
+"""
+
+
+def bench_startup(runs=3):
+    """
+    Cold start of each server in a fresh interpreter: import time, then the first responses through
+    the rule-based fast path and through a stub LLM (which pays for the anthropic import); and the
+    first LLM-backed response of a forked worker, with and without preload() in the parent
+    """
+    here = os.path.abspath(__file__)
+    # label: (a file in the server's directory, module)
+    servers = {
+        "rest_server": (here, "rest_server"),
+        "asgi_server": (here, "asgi_server"),
+        "strategy_server": (here, "strategy_server"),
+        "mcp-server": (os.path.join(os.path.dirname(here), os.pardir, "mcp-server", "strategy_server.py"),
+                       "strategy_server"),
+    }
+    prompts = {"fast path": PROMPT_CORPUS[0][0], "llm": "a cautious strategy for a quiet market"}
+    assert extract_parameters(prompts["fast path"]).complete and not extract_parameters(prompts["llm"]).complete
+
+    with StubLLMServer(delay=0.01) as llm:
+        env = dict(os.environ, ANTHROPIC_BASE_URL=llm.url, ANTHROPIC_API_KEY="stub", PROMPT_CACHE_PATH="",
+                   RISK_RUNS="0", LLM_CONTEXT_TOKENS="0")
+
+        def run(path, module, mode):
+            output = subprocess.run(
+                [sys.executable, "-c", STARTUP_SCRIPT, path, module, mode, json.dumps(prompts)],
+                env=env, cwd=tempfile.gettempdir(), capture_output=True, text=True, check=True
+            ).stdout
+            return json.loads(output.strip().splitlines()[-1])
+
+        for label, (path, module) in servers.items():
+            results = [run(path, module, "import") for _ in range(runs)]
+            assert not any(result["anthropic"] for result in results), f"{label} imports anthropic eagerly"
+            seconds = min(result["import"] for result in results)
+            print(f"{label + ' import':<24} {seconds * 1000:8.1f} ms", file=sys.__stdout__)
+            record(f"{label} import", seconds, "s")
+
+        served = [run(here, "rest_server", "serve") for _ in range(runs)]
+        for label in prompts:
+            seconds = min(result[label] for result in served)
+            print(f"{'first ' + label + ' response':<24} {seconds * 1000:8.1f} ms", file=sys.__stdout__)
+            record(f"first {label} response", seconds, "s")
+
+        workers = {}
+        for mode in ("fork", "preload"):
+            workers[mode] = min(run(here, "rest_server", mode)["worker"] for _ in range(runs))
+            label = "preloaded worker" if mode == "preload" else "forked worker"
+            print(f"{label + ' first llm':<24} {workers[mode] * 1000:8.1f} ms", file=sys.__stdout__)
+            record(f"{label} first llm response", workers[mode], "s")
+    assert workers["preload"] < workers["fork"]
+    print(f"preloading saves each worker {(workers['fork'] - workers['preload']) * 1000:.0f} ms", file=sys.__stdout__)
+
+
+def bench_reference_parsing(repeats=20):
+    """Parse the reference strategy XML files with ElementTree, whole documents and by iterparse"""
+    import xml.etree.ElementTree as ET
+
+    documents = [data for _, data in reference_documents()]
+    size = sum(map(len, documents))
+
+    def parse_all():
+        for data in documents:
+            ET.fromstring(data)
+
+    def iterparse_all():
+        for data in documents:
+            for _ in ET.iterparse(io.BytesIO(data)):
+                pass
+
+    for label, func in (("fromstring", parse_all), ("iterparse", iterparse_all)):
+        seconds = measure(f"{label}, {len(documents)} files", func, repeats)
+        print(f"{label:<24} {size / seconds / 1e6:8.1f} MB/s over {size / 1e3:.0f} kB")
+        record(f"{label} rate", size / seconds, "B/s", better="higher")
+
+
+def reference_documents():
+    """The reference strategy files as (name, bytes), in name order"""
+    from strategy_core import strategy_library
+
+    directory = strategy_library.REFERENCE_DIRECTORY
+    documents = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".xml"):
+            with open(os.path.join(directory, name), "rb") as file:
+                documents.append((name, file.read()))
+    return documents
+
+
+def bench_validator(batch=10000, repeats=10):
+    """
+    One-pass structural validation of the reference files and of a batch of generated strategies,
+    its peak memory against a whole-document parse, the cost it adds to a cache miss, and the
+    defects it must catch
+    """
+    import xml.etree.ElementTree as ET
+    from strategy_core.validator import validate_strategy
+
+    documents = reference_documents()
+    for name, data in documents:
+        validation = validate_strategy(data)
+        assert validation.valid, (name, validation.errors)
+        for warning in validation.warnings:
+            print(f"{name}: {warning}")
+    size = sum(len(data) for _, data in documents)
+    seconds = measure(f"{len(documents)} reference files", lambda: [validate_strategy(data) for _, data in documents],
+                      repeats)
+    print(f"{'reference files':<24} {size / seconds / 1e6:8.1f} MB/s, {seconds / len(documents) * 1000:.2f} ms per file")
+    record("reference rate", size / seconds, "B/s", better="higher")
+
+    # Peak memory on the largest file: bounded by nesting depth rather than by document size
+    largest = max((data for _, data in documents), key=len)
+    peaks = {}
+    for label, func in (("validate_strategy", validate_strategy), ("ET.fromstring", ET.fromstring)):
+        tracemalloc.start()
+        func(largest)
+        peaks[label] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    print(f"peak memory on {len(largest) // 1000} kB: validator {peaks['validate_strategy']} B, "
+          f"whole-tree parse {peaks['ET.fromstring']} B")
+    assert peaks["validate_strategy"] < peaks["ET.fromstring"] / 2
+    record("peak on largest file", peaks["validate_strategy"], "B")
+
+    rendered = [render_strategy_bytes(spec) for spec in spec_grid(batch)]
+    start = time.perf_counter()
+    invalid = sum(not validate_strategy(data).valid for data in rendered)
+    elapsed = time.perf_counter() - start
+    assert invalid == 0
+    print(f"{batch} generated strategies  {elapsed:8.2f} s, {elapsed / batch * 1e6:.0f} us per strategy")
+    record("generated strategy", elapsed / batch, "s")
+
+    spec = StrategySpec(**PARAMS)
+    for validate in (False, True):
+        cache = StrategyCache(max_bytes=0, validate=validate)
+        measure(f"cache miss{', validated' if validate else ''}", lambda: cache.get(spec), repeats * 100)
+
+    generated = render_strategy_bytes(spec)
+    oscars = dict(documents)["oscars_grind.xml"]
+    defects = {
+        "not well-formed": generated[:-10],
+        "unknown type": generated.replace(b'type="purchase"', b'type="purchase_now"'),
+        "lacks trade_definition_market": generated.replace(b"trade_definition_market", b"trade_definition_markets"),
+        "is not declared": generated.replace(b'id="initial_stake_var">Initial Stake</field>', b'id="x">Stake</field>'),
+        "undefined procedure": re.sub(rb'(<mutation[^>]*name=")', rb"\1missing ", oscars, count=1),
+        "arguments, called with": re.sub(rb'(<mutation[^>]*name="[^"]*">)', rb'\1<arg name="extra"></arg>', oscars, count=1),
+        "expected one trade_definition": generated.replace(b'type="trade_definition"', b'type="tick_analysis"'),
+    }
+    for expected, data in defects.items():
+        errors = validate_strategy(data).errors
+        assert any(expected in message for message in errors), (expected, errors)
+    print(f"{len(defects)} kinds of defect detected")
+
+
+def bench_retrieval(prompts=5, prefill_delay=0.00005):
+    """
+    The BM25 index over reference strategies and docs: build, memory-mapped load and search time,
+    then prompt size and time to parameters through the Anthropic SDK against a stub reading
+    `prefill_delay` seconds per input token, for retrieved snippets against the whole corpus as context
+    """
+    import anthropic
+    from strategy_core import retrieval
+    from strategy_core.strategy_library import REFERENCE_DIRECTORY, StrategyLibrary
+    from strategy_core.strategy_parser import StrategyParser
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index")
+        start = time.perf_counter()
+        snippets = retrieval.build_index(path)
+        built = time.perf_counter() - start
+        print(f"{'build':<24} {built * 1000:8.1f} ms, {snippets} snippets, {os.path.getsize(path)} B")
+        record("build", built, "s")
+        measure("mmap load", lambda: retrieval.RetrievalIndex(path).close(), 200)
+        index = retrieval.RetrievalIndex(path)
+
+        prompt, params = PROMPT_CORPUS[0]
+        prompt = f"martingale strategy doubling the stake after a loss: {prompt}"
+        measure("search", lambda: index.search(prompt, 5, 1000), 200)
+        # Each reference strategy is the best match for its own name
+        for name in StrategyLibrary().names():
+            found = index.search(name.replace("_", " "), 1, 1000)
+            assert found and found[0].title == name, (name, found)
+
+        class WholeCorpus:
+            """Every reference strategy summary and doc in full, as a prompt without retrieval would carry"""
+            text = "\n\n".join(
+                [snippet.render() for snippet in retrieval.strategy_snippets(StrategyLibrary(REFERENCE_DIRECTORY))]
+                + [open(file, encoding="utf-8").read()
+                   for file in retrieval.source_files() if not file.endswith(".xml")]
+            )
+
+            def context(self, query, k, token_budget):
+                return self.text
+
+        timings = {}
+        # httpx logs every request once the MCP benchmark has configured logging
+        logging.disable(logging.INFO)
+        with StubLLMServer(reply=params, delay=0.01, prefill_delay=prefill_delay) as llm, \
+                contextlib.redirect_stdout(io.StringIO()):
+            client = anthropic.Anthropic(api_key="stub", base_url=llm.url, max_retries=0)
+            for label, source in (("no context", None), ("retrieved", index), ("whole corpus", WholeCorpus())):
+                parser = StrategyParser(client=client, cache=False, fast_path=False, coalesce=False,
+                                        retrieval=source, context_budget=1000 if source else 0)
+                tokens = retrieval.estimate_tokens(parser.build_request(prompt)["messages"][0]["content"])
+                latencies = []
+                for _ in range(prompts):
+                    start = time.perf_counter()
+                    assert parser.request_parameters(prompt) == params
+                    latencies.append(time.perf_counter() - start)
+                timings[label] = (tokens, statistics.median(latencies))
+        logging.disable(logging.NOTSET)
+        index.close()
+
+    for label, (tokens, latency) in timings.items():
+        print(f"{label:<24} {tokens:8d} prompt tokens  {latency * 1000:8.1f} ms to parameters", file=sys.__stdout__)
+        record(f"{label} prompt", tokens, "tokens")
+        record(f"{label} latency", latency, "s")
+    assert timings["retrieved"][0] <= timings["no context"][0] + 1000
+    assert timings["retrieved"][0] * 10 < timings["whole corpus"][0]
+    assert timings["retrieved"][1] < timings["whole corpus"][1]
+    print(f"prompt {timings['whole corpus'][0] / timings['retrieved'][0]:.0f}x smaller, "
+          f"{timings['whole corpus'][1] / timings['retrieved'][1]:.1f}x faster", file=sys.__stdout__)
+
+
+def bench_store(count=1_000_000, sample=20000, lookups=20000):
+    """
+    The content-addressed strategy archive: compression against each codec's dictionary and per-file
+    gzip on generated and customized reference strategies, then put throughput, size on disk, open
+    time and lookup latency with `count` distinct generated strategies stored
+    """
+    import gzip
+    import random
+    from strategy_core.strategy_library import default_library
+    from strategy_core.strategy_store import CODECS, StrategyStore, strategy_digest
+
+    base = StrategySpec(**PARAMS)
+    generated = [data for _, data in itertools.islice(
+        sweep_strategies(base, stake=range(1, 101), duration=range(1, 11)), sample)]
+    references = [render_strategy_bytes(StrategySpec(**{**PARAMS, "stake": stake}, reference=name))
+                  for name in default_library().names() for stake in (1, 2.5, 7)]
+    # A re-indented copy with Windows line endings has the same key
+    assert strategy_digest(generated[0].replace(b"><", b">\r\n  <")) == strategy_digest(generated[0])
+    # The archive is opt-in: nothing is written unless STRATEGY_STORE_DIR names a directory
+    if not os.getenv("STRATEGY_STORE_DIR"):
+        assert StrategyStore.from_env() is None
+
+    for codec in CODECS:
+        with tempfile.TemporaryDirectory() as directory:
+            store = StrategyStore(directory, codec)
+            for label, documents in (("generated", generated), ("reference", references)):
+                raw = sum(map(len, documents))
+                compressed = sum(len(store.codec.compress(data)) for data in documents)
+                print(f"{codec} {label:<14} {raw / len(documents):8.0f} B -> {compressed / len(documents):6.0f} B, "
+                      f"{raw / compressed:6.1f}x")
+                record(f"{codec} {label} ratio", raw / compressed, "x", better="higher")
+            measure(f"{codec} compress reference", lambda: store.codec.compress(references[0]), 200)
+            payload = store.codec.compress(references[0])
+            assert store.codec.decompress(payload) == references[0]
+            measure(f"{codec} decompress reference", lambda: store.codec.decompress(payload), 200)
+            store.close()
+    for label, documents in (("generated", generated), ("reference", references)):
+        ratio = sum(map(len, documents)) / sum(len(gzip.compress(data, 9, mtime=0)) for data in documents)
+        print(f"per-file gzip {label:<8} {ratio:6.1f}x")
+        record(f"gzip {label} ratio", ratio, "x", better="higher")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = StrategyStore(directory)
+        for data in references:
+            store.put(data)
+        # Every 50th stored strategy is looked up again
+        kept = []
+        start = time.perf_counter()
+        sweep = sweep_strategies(base, stake=range(1, 101), duration=range(1, 11), profit_threshold=range(100, 1100, 10),
+                                 loss_threshold=range(10, 110, 10))
+        for index, (spec, data) in enumerate(itertools.islice(sweep, count)):
+            digest = store.put(data)
+            if index % 50 == 0:
+                kept.append((digest, spec))
+        elapsed = time.perf_counter() - start
+        stats = store.stats()
+        assert stats["strategies"] == count + len(set(map(strategy_digest, references))), stats
+        index_bytes = os.path.getsize(store.index_path)
+        segment_bytes = os.path.getsize(os.path.join(directory, "segment"))
+        print(f"{'put':<24} {count / elapsed:8.0f} strategies/s, render and store", file=sys.__stdout__)
+        print(f"{stats['strategies']} strategies  {stats['raw_bytes'] / 1e9:.2f} GB -> segment {segment_bytes / 1e6:.1f} MB "
+              f"+ index {index_bytes / 1e6:.1f} MB, {stats['ratio']:.0f}x, "
+              f"{(segment_bytes + index_bytes) / stats['strategies']:.0f} B per strategy", file=sys.__stdout__)
+        record("put", elapsed / count, "s")
+        record("stored ratio", stats["ratio"], "x", better="higher")
+        record("bytes on disk per strategy", (segment_bytes + index_bytes) / stats["strategies"], "B")
+        store.close()
+
+        start = time.perf_counter()
+        store = StrategyStore(directory)
+        print(f"{'open':<24} {(time.perf_counter() - start) * 1000:8.1f} ms", file=sys.__stdout__)
+        record("open", time.perf_counter() - start, "s")
+        for digest, spec in kept[::len(kept) // 100]:
+            assert store.get(digest) == render_strategy_bytes(spec)
+        assert store.get(strategy_digest(references[-1])) == references[-1]
+        assert strategy_digest(render_strategy_bytes(kept[1][1])) == kept[1][0]
+
+        digests = [digest for digest, _ in random.Random(0).choices(kept, k=lookups)]
+        latencies = []
+        for digest in digests:
+            begin = time.perf_counter()
+            store.get(digest)
+            latencies.append(time.perf_counter() - begin)
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)]
+        print(f"{'get':<24} p50 {statistics.median(latencies) * 1e6:7.1f} us  p99 {p99 * 1e6:7.1f} us", file=sys.__stdout__)
+        record("get p50", statistics.median(latencies), "s")
+        record("get p99", p99, "s")
+        missing = "0" * 64
+        assert store.get(missing) is None
+        measure("miss", lambda: store.get(missing), 1000)
+        store.close()
+
+
+REFINEMENTS = [
+    "same as before but stake 20",
+    "raise the take profit to 200",
+    "stop loss 75",
+    "switch to volatility 75 index",
+    "make it 3 ticks",
+    "make it a bit safer",
+]
+
+
+def bench_refine(conversations=20):
+    """
+    Follow-up messages in a refinement session against regenerating from each message as before
+    (parse_prompt and a full render), with an LLM stub taking 50 ms per call
+    """
+    import anthropic
+    from strategy_core.refinement import Refiner
+    from strategy_core.strategy_parser import StrategyParser
+
+    opening = PROMPT_CORPUS[0][0]
+    timings = {"refine": [], "regenerate": []}
+    llm_calls = {}
+    refined = {}
+    context_lost = 0
+    logging.disable(logging.INFO)
+    with StubLLMServer(reply={"loss_threshold": 25}, delay=0.05) as llm, contextlib.redirect_stdout(io.StringIO()):
+        client = anthropic.Anthropic(api_key="stub", base_url=llm.url, max_retries=0)
+        parser = StrategyParser(client=client, cache=False, coalesce=False)
+        refiner = Refiner(parser, validate=True)
+        for _ in range(conversations):
+            session = refiner.refine(opening).session
+            for message in REFINEMENTS:
+                start = time.perf_counter()
+                refinement = refiner.refine(message, session)
+                timings["refine"].append(time.perf_counter() - start)
+                assert refinement.data == render_strategy_bytes(StrategySpec.from_params(refinement.params)), message
+                refined[message] = refinement.data
+        llm_calls["refine"] = llm.requests
+
+        for _ in range(conversations):
+            for message in REFINEMENTS:
+                start = time.perf_counter()
+                data = render_strategy_bytes(StrategySpec.from_params(parser.parse_prompt(message)))
+                timings["regenerate"].append(time.perf_counter() - start)
+                context_lost += data != refined[message]
+        llm_calls["regenerate"] = llm.requests - llm_calls["refine"]
+    logging.disable(logging.NOTSET)
+
+    messages = conversations * len(REFINEMENTS)
+    for label, latencies in timings.items():
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{label:<24} p50 {statistics.median(latencies) * 1000:8.2f} ms  p99 {p99 * 1000:8.2f} ms  "
+              f"{llm_calls[label] / messages:.2f} LLM calls per message", file=sys.__stdout__)
+        record(f"{label} p50", statistics.median(latencies), "s")
+        record(f"{label} p99", p99, "s")
+        record(f"{label} LLM calls", llm_calls[label] / messages, "calls")
+    print(f"refine {statistics.mean(timings['regenerate']) / statistics.mean(timings['refine']):.1f}x faster on average, "
+          f"{statistics.median(timings['regenerate']) / statistics.median(timings['refine']):.0f}x at the median; "
+          f"regenerating from the message alone lost earlier changes in {context_lost}/{messages} strategies",
+          file=sys.__stdout__)
+    # Only the message the extractor cannot read needs the LLM once the session has started
+    assert llm_calls["refine"] == conversations
+    assert statistics.mean(timings["refine"]) < statistics.mean(timings["regenerate"])
+
+
+BENCHMARKS = {
+    "render": bench_render,
+    "concurrency": bench_concurrency,
+    "cache": bench_cache,
+    "fast_path": bench_fast_path,
+    "server_load": bench_server_load,
+    "sweep": bench_sweep,
+    "library": bench_library,
+    "reference": bench_reference,
+    "backtest": bench_backtest,
+    "risk": bench_risk,
+    "interpreter": bench_interpreter,
+    "streaming": bench_streaming,
+    "http_cache": bench_http_cache,
+    "coalescing": bench_coalescing,
+    "streaming_llm": bench_streaming_llm,
+    "resilience": bench_resilience,
+    "metrics": bench_metrics,
+    "generator": bench_generator,
+    "parse_prompt": bench_parse_prompt,
+    "endpoints": bench_endpoints,
+    "mcp": bench_mcp,
+    "reference_parsing": bench_reference_parsing,
+    "validator": bench_validator,
+    "retrieval": bench_retrieval,
+    "store": bench_store,
+    "refine": bench_refine,
+    "startup": bench_startup,
+}
+
+# Earlier runs a result is compared against, most recent last
+HISTORY_WINDOW = 5
+
+
+def run_info():
+    """Where and on what a run happened, stored with its results"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count()
+    }
+
+
+def read_history(path):
+    """Earlier runs stored one JSON object per line; a missing file is an empty history"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare(results, history, threshold):
+    """
+    Results worse than the median of their last HISTORY_WINDOW values by more than `threshold`
+    (a fraction) and worse than every one of them, as (key, baseline, value, change) tuples
+    Requiring both keeps a noisy tail latency within its usual spread from being flagged
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        previous = [run["results"][key]["value"] for run in history if key in run["results"]][-HISTORY_WINDOW:]
+        if not previous:
+            continue
+        baseline = statistics.median(previous)
+        if not baseline:
+            continue
+        change = (result["value"] - baseline) / baseline
+        sign = 1 if result["better"] == "lower" else -1
+        if sign * change > threshold and all(sign * (result["value"] - value) > 0 for value in previous):
+            regressions.append((key, baseline, result["value"], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--json", help="write this run's results to this file")
+    parser.add_argument("--history", help="JSON-lines file of earlier runs to compare against; this run is appended")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change flagged as a regression")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    for name in args.names or BENCHMARKS:
+        print(f"== {name}")
+        CURRENT["benchmark"] = name
+        BENCHMARKS[name]()
+
+    run = {**run_info(), "benchmarks": args.names or list(BENCHMARKS), "results": RESULTS}
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(run, file, indent=2)
+    if not args.history:
+        return 0
+
+    history = read_history(args.history)
+    regressions = compare(RESULTS, history, args.threshold)
+    compared = sum(any(key in earlier["results"] for earlier in history) for key in RESULTS)
+    print(f"== compared {compared}/{len(RESULTS)} results with {len(history)} earlier runs")
+    for key, baseline, value, change in regressions:
+        print(f"REGRESSION {key:<56} {baseline:12.6g} -> {value:12.6g} {RESULTS[key]['unit']:<6} ({change:+.0%})")
+    with open(args.history, "a") as file:
+        file.write(json.dumps(run) + "\n")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
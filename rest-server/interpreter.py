@@ -0,0 +1,639 @@
+import math
+import operator
+import random
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, List, Optional
+
+def _divide(a, b):
+    if b == 0:
+        return math.nan if a == 0 or a != a else math.copysign(math.inf, a) * math.copysign(1, b)
+    return a / b
+
+
+# Comparison and arithmetic operators; operands are coerced as JavaScript would first
+COMPARE = {
+    "EQ": operator.eq,
+    "NEQ": operator.ne,
+    "LT": operator.lt,
+    "LTE": operator.le,
+    "GT": operator.gt,
+    "GTE": operator.ge,
+}
+ARITHMETIC = {
+    "ADD": operator.add,
+    "MINUS": operator.sub,
+    "MULTIPLY": operator.mul,
+    "DIVIDE": _divide,
+    "POWER": operator.pow,
+}
+SINGLE = {
+    "ABS": abs,
+    "NEG": operator.neg,
+    "ROOT": math.sqrt,
+    "LN": math.log,
+    "LOG10": math.log10,
+    "EXP": math.exp,
+    "POW10": lambda x: 10 ** x,
+}
+ROUND = {
+    # Math.round rounds halves up, unlike Python's round
+    "ROUND": lambda x: math.floor(x + 0.5),
+    "ROUNDUP": math.ceil,
+    "ROUNDDOWN": math.floor,
+}
+
+
+class UnsupportedBlock(ValueError):
+    """A block type, operator or shape the interpreter cannot compile"""
+
+
+class Environment:
+    """
+    Trading state the blocks read and drive; a simulator updates it between stacks
+    `details` maps read_details indexes to values of the last contract (4 is its profit)
+    `inputs` answers text_prompt_ext blocks, keyed by the strategy_value of their input
+    """
+
+    def __init__(self, inputs: Optional[Dict[str, Any]] = None, log: Optional[List] = None):
+        self.inputs = inputs or {}
+        self.log = log
+        self.details: Dict[int, Any] = {}
+        self.result: Optional[str] = None
+        self.stat = 0
+        self.sell_available = False
+        self.purchased: Optional[str] = None
+        self.sold = False
+        self.trade_again = False
+
+    def purchase(self, contract_type: str):
+        self.purchased = contract_type
+
+    def sell(self):
+        self.sold = True
+
+    def notify(self, kind: str, message: Any):
+        if self.log is not None:
+            self.log.append((kind, message))
+
+    def prompt(self, key: str):
+        try:
+            return self.inputs[key]
+        except KeyError:
+            raise ValueError(f"Strategy asks for an input with no value: {key}") from None
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _children(element, tag: str, name: Optional[str] = None):
+    return [
+        child for child in element
+        if _local(child.tag) == tag and (name is None or child.get("name") == name)
+    ]
+
+
+def _field(element, name: str) -> Optional[str]:
+    fields = _children(element, "field", name)
+    return fields[0].text if fields else None
+
+
+def _input_block(container):
+    """The block plugged into a <value> or <statement>; a real block overrides its shadow"""
+    if container is None:
+        return None
+    blocks = _children(container, "block") or _children(container, "shadow")
+    return blocks[0] if blocks else None
+
+
+def _number(text: Optional[str]):
+    value = float(text or 0)
+    return int(value) if value.is_integer() else value
+
+
+def _text(value) -> str:
+    """String conversion as JavaScript does it, so 5.0 joins as "5" and booleans as "true" """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def _js_number(value):
+    """ToNumber: the reference strategies keep some numbers in text blocks and rely on this"""
+    if isinstance(value, (int, float)):
+        return value
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        try:
+            return _number(value.strip() or "0")
+        except ValueError:
+            return math.nan
+    return math.nan
+
+
+def _noop():
+    pass
+
+
+def _sequence(statements: List[Callable]) -> Callable:
+    statements = [statement for statement in statements if statement is not _noop]
+    if not statements:
+        return _noop
+    if len(statements) == 1:
+        return statements[0]
+    statements = tuple(statements)
+
+    def run():
+        for statement in statements:
+            statement()
+    return run
+
+
+class Program:
+    """A strategy compiled into closures over one slot list and one Environment"""
+
+    def __init__(self, slots: List[Any], variables: Dict[str, int], env: Environment):
+        self.slots = slots
+        self.variables = variables
+        self.env = env
+        self.trade_type = (None, None)
+        self.contract_types = None
+        self.initialization = _noop
+        self.before_purchase = _noop
+        self.during_purchase = _noop
+        self.after_purchase = _noop
+        self.tick_analysis = _noop
+        self.amount: Callable = lambda: None
+        self.duration: Callable = lambda: None
+        self.take_profit: Optional[Callable] = None
+        self.growth_rate: Optional[float] = None
+        self.procedures: Dict[str, Callable] = {}
+        self.blocks = 0
+
+    def reset(self):
+        """Forget all variable values, as a restarted bot does"""
+        self.slots[:] = [None] * len(self.slots)
+
+    def get(self, name: str):
+        """Value of a variable by name"""
+        return self.slots[self.variables[name]]
+
+
+class Compiler:
+    """
+    Compiles Blockly XML into a Program. Every block becomes a zero-argument closure; variables are
+    resolved to indexes into one slot list and procedure calls to their compiled bodies, so running a
+    stack does no lookups by name and no XML traversal
+    """
+
+    def __init__(self, env: Optional[Environment] = None, counter: Optional[List[int]] = None):
+        self.env = env or Environment()
+        # With a counter, every executed block increments counter[0]; used to measure blocks per run
+        self.counter = counter
+        self.slots: List[Any] = []
+        self.slot_ids: Dict[str, int] = {}
+        self.variables: Dict[str, int] = {}
+        self.procedures: Dict[str, List[Callable]] = {}
+        self.parents: Dict[Any, Any] = {}
+        self.blocks = 0
+
+    def compile(self, xml) -> Program:
+        root = ET.fromstring(xml) if isinstance(xml, (str, bytes)) else xml
+        self.parents = {child: parent for parent in root.iter() for child in parent}
+        for element in root.iter():
+            if _local(element.tag) == "variable":
+                self._slot(element.get("id"), element.text)
+
+        program = Program(self.slots, self.variables, self.env)
+        tops = [child for child in root if _local(child.tag) == "block"]
+        # Procedures first, so calls can bind to them wherever they are defined
+        for block in tops:
+            if block.get("type", "").startswith("procedures_def"):
+                self.procedures[_field(block, "NAME")] = [None]
+        for block in tops:
+            kind = block.get("type")
+            if kind.startswith("procedures_def"):
+                self.procedures[_field(block, "NAME")][0] = self._procedure(block)
+            elif kind == "trade_definition":
+                self._trade_definition(block, program)
+            elif kind == "before_purchase":
+                program.before_purchase = self.statements(block, "BEFOREPURCHASE_STACK")
+            elif kind == "during_purchase":
+                program.during_purchase = self.statements(block, "DURING_PURCHASE_STACK")
+            elif kind == "after_purchase":
+                program.after_purchase = self.statements(block, "AFTERPURCHASE_STACK")
+            elif kind == "tick_analysis":
+                program.tick_analysis = self.statements(block, "TICKANALYSIS_STACK")
+        program.procedures = {name: cell[0] for name, cell in self.procedures.items()}
+        program.blocks = self.blocks
+        return program
+
+    def _slot(self, variable_id: Optional[str], name: Optional[str]) -> int:
+        key = variable_id or name
+        if key not in self.slot_ids:
+            self.slot_ids[key] = len(self.slots)
+            self.slots.append(None)
+            if name is not None:
+                self.variables.setdefault(name, self.slot_ids[key])
+        return self.slot_ids[key]
+
+    def _variable(self, block, name: str = "VAR") -> int:
+        field = _children(block, "field", name)[0]
+        return self._slot(field.get("id"), field.text)
+
+    def _trade_definition(self, block, program: Program):
+        for element in block.iter():
+            if _local(element.tag) != "block":
+                continue
+            kind = element.get("type")
+            if kind == "trade_definition_tradetype":
+                program.trade_type = (_field(element, "TRADETYPECAT_LIST"), _field(element, "TRADETYPE_LIST"))
+            elif kind == "trade_definition_contracttype":
+                program.contract_types = _field(element, "TYPE_LIST")
+            elif kind in ("trade_definition_tradeoptions", "trade_definition_accumulator"):
+                if kind == "trade_definition_accumulator":
+                    program.growth_rate = float(_field(element, "GROWTHRATE_LIST"))
+                program.amount = self.value(element, "AMOUNT")
+                if _children(element, "value", "DURATION"):
+                    program.duration = self.value(element, "DURATION")
+            elif kind == "accumulator_take_profit":
+                program.take_profit = self.value(element, "AMOUNT")
+        program.initialization = self.statements(block, "INITIALIZATION")
+
+    def _procedure(self, block) -> Callable:
+        mutations = _children(block, "mutation")
+        params = tuple(
+            self._slot(arg.get("varid"), arg.get("name"))
+            for arg in (_children(mutations[0], "arg") if mutations else [])
+        )
+        body = self.statements(block, "STACK")
+        result = self.value(block, "RETURN") if _children(block, "value", "RETURN") else None
+        slots = self.slots
+
+        if not params:
+            if result is None:
+                return lambda: body()
+
+            def procedure():
+                body()
+                return result()
+            return procedure
+
+        # Parameters are local to the procedure: bind them over their slots and restore on return
+        def procedure(*args):
+            saved = [slots[index] for index in params]
+            for index, value in zip(params, args):
+                slots[index] = value
+            try:
+                body()
+                return result() if result is not None else None
+            finally:
+                for index, value in zip(params, saved):
+                    slots[index] = value
+        return procedure
+
+    def statements(self, block, name: str) -> Callable:
+        """Compile the chain of statement blocks plugged into a statement input"""
+        containers = _children(block, "statement", name)
+        first = _input_block(containers[0]) if containers else None
+        compiled = []
+        while first is not None:
+            compiled.append(self._statement(first))
+            following = _children(first, "next")
+            first = _input_block(following[0]) if following else None
+        return _sequence(compiled)
+
+    def value(self, block, name: str) -> Callable:
+        """Compile the expression plugged into a value input; an empty input evaluates to null"""
+        containers = _children(block, "value", name)
+        inner = _input_block(containers[0]) if containers else None
+        if inner is None:
+            return lambda: None
+        return self._expression(inner)
+
+    def _count(self, compiled: Callable) -> Callable:
+        self.blocks += 1
+        if self.counter is None:
+            return compiled
+        counter = self.counter
+
+        def counted(*args):
+            counter[0] += 1
+            return compiled(*args)
+        return counted
+
+    def _statement(self, block) -> Callable:
+        handler = getattr(self, "_stmt_" + block.get("type"), None)
+        if handler is None:
+            raise UnsupportedBlock(f"Unsupported statement block: {block.get('type')}")
+        compiled = handler(block)
+        return compiled if compiled is _noop else self._count(compiled)
+
+    def _expression(self, block) -> Callable:
+        handler = getattr(self, "_expr_" + block.get("type"), None)
+        if handler is None:
+            raise UnsupportedBlock(f"Unsupported value block: {block.get('type')}")
+        return self._count(handler(block))
+
+    # Statements
+
+    def _stmt_variables_set(self, block):
+        index, value, slots = self._variable(block), self.value(block, "VALUE"), self.slots
+
+        def variables_set():
+            slots[index] = value()
+        return variables_set
+
+    def _stmt_math_change(self, block):
+        index, delta, slots = self._variable(block), self.value(block, "DELTA"), self.slots
+
+        def math_change():
+            current = slots[index]
+            if isinstance(current, bool) or not isinstance(current, (int, float)):
+                current = 0
+            slots[index] = current + delta()
+        return math_change
+
+    def _stmt_controls_if(self, block):
+        mutations = _children(block, "mutation")
+        mutation = mutations[0] if mutations else None
+        count = 1 + int(mutation.get("elseif", 0)) if mutation is not None else 1
+        branches = tuple(
+            (self.value(block, f"IF{n}"), self.statements(block, f"DO{n}")) for n in range(count)
+        )
+        otherwise = self.statements(block, "ELSE")
+
+        if len(branches) == 1:
+            (condition, body), = branches
+            if otherwise is _noop:
+                def controls_if():
+                    if condition():
+                        body()
+            else:
+                def controls_if():
+                    if condition():
+                        body()
+                    else:
+                        otherwise()
+            return controls_if
+
+        def controls_if():
+            for condition, body in branches:
+                if condition():
+                    body()
+                    return
+            otherwise()
+        return controls_if
+
+    def _stmt_procedures_callnoreturn(self, block):
+        return self._call(block)
+
+    def _stmt_text_join(self, block):
+        # DBot's statement form: join the text_statement items into a variable
+        index, slots = self._variable(block, "VARIABLE"), self.slots
+        parts = []
+        items = _children(block, "statement", "STACK")
+        item = _input_block(items[0]) if items else None
+        while item is not None:
+            parts.append(self.value(item, "TEXT"))
+            following = _children(item, "next")
+            item = _input_block(following[0]) if following else None
+        parts = tuple(parts)
+
+        def text_join():
+            slots[index] = "".join(_text(part()) for part in parts)
+        return text_join
+
+    def _stmt_notify(self, block):
+        if self.env.log is None:
+            return _noop
+        message, env, kind = self.value(block, "MESSAGE"), self.env, _field(block, "NOTIFICATION_TYPE")
+        return lambda: env.notify(kind, message())
+
+    def _stmt_text_print(self, block):
+        if self.env.log is None:
+            return _noop
+        message, env = self.value(block, "TEXT"), self.env
+        return lambda: env.notify("print", message())
+
+    def _stmt_purchase(self, block):
+        env, contract_type = self.env, _field(block, "PURCHASE_LIST")
+        return lambda: env.purchase(contract_type)
+
+    def _stmt_trade_again(self, block):
+        env = self.env
+
+        def trade_again():
+            env.trade_again = True
+        return trade_again
+
+    def _stmt_sell_at_market(self, block):
+        return self.env.sell
+
+    # Values
+
+    def _expr_variables_get(self, block):
+        index, slots = self._variable(block), self.slots
+        return lambda: slots[index]
+
+    def _expr_math_number(self, block):
+        value = _number(_field(block, "NUM"))
+        return lambda: value
+
+    _expr_math_number_positive = _expr_math_number
+
+    def _expr_logic_boolean(self, block):
+        value = _field(block, "BOOL") == "TRUE"
+        return lambda: value
+
+    def _expr_logic_null(self, block):
+        return lambda: None
+
+    def _expr_text(self, block):
+        value = _field(block, "TEXT") or ""
+        return lambda: value
+
+    def _expr_logic_compare(self, block):
+        op = COMPARE.get(_field(block, "OP"))
+        if op is None:
+            raise UnsupportedBlock(f"Unsupported comparison: {_field(block, 'OP')}")
+        a, b = self.value(block, "A"), self.value(block, "B")
+        if op is operator.eq or op is operator.ne:
+            def logic_compare():
+                x, y = a(), b()
+                if type(x) is not type(y):
+                    # Loose equality: null equals only null, strings compare as numbers with numbers
+                    if x is None or y is None:
+                        return op(x is None, y is None)
+                    if isinstance(x, str) or isinstance(y, str):
+                        x, y = _js_number(x), _js_number(y)
+                return op(x, y)
+            return logic_compare
+
+        def logic_compare():
+            x, y = a(), b()
+            if type(x) is not type(y) or x is None:
+                x, y = _js_number(x), _js_number(y)
+            return op(x, y)
+        return logic_compare
+
+    def _expr_logic_operation(self, block):
+        a, b = self.value(block, "A"), self.value(block, "B")
+        # Like JavaScript's && and ||, these return an operand rather than a boolean
+        if _field(block, "OP") == "AND":
+            return lambda: a() and b()
+        return lambda: a() or b()
+
+    def _expr_math_arithmetic(self, block):
+        op = ARITHMETIC.get(_field(block, "OP"))
+        if op is None:
+            raise UnsupportedBlock(f"Unsupported arithmetic: {_field(block, 'OP')}")
+        a, b = self.value(block, "A"), self.value(block, "B")
+        concatenate = op is operator.add
+
+        def math_arithmetic():
+            x, y = a(), b()
+            if type(x) is not type(y) or type(x) is not int and type(x) is not float:
+                if concatenate and (isinstance(x, str) or isinstance(y, str)):
+                    return _text(x) + _text(y)
+                x, y = _js_number(x), _js_number(y)
+            return op(x, y)
+        return math_arithmetic
+
+    def _expr_math_single(self, block):
+        op = SINGLE.get(_field(block, "OP"))
+        if op is None:
+            raise UnsupportedBlock(f"Unsupported math function: {_field(block, 'OP')}")
+        number = self.value(block, "NUM")
+        return lambda: op(_js_number(number()))
+
+    def _expr_math_round(self, block):
+        op = ROUND.get(_field(block, "OP"))
+        if op is None:
+            raise UnsupportedBlock(f"Unsupported rounding: {_field(block, 'OP')}")
+        number = self.value(block, "NUM")
+        return lambda: op(_js_number(number()))
+
+    def _expr_procedures_callreturn(self, block):
+        return self._call(block)
+
+    def _call(self, block):
+        mutation = _children(block, "mutation")[0]
+        cell = self.procedures.get(mutation.get("name"))
+        if cell is None:
+            raise UnsupportedBlock(f"Call to undefined procedure: {mutation.get('name')}")
+        args = tuple(self.value(block, f"ARG{n}") for n in range(len(_children(mutation, "arg"))))
+        if not args:
+            return lambda: cell[0]()
+        return lambda: cell[0](*[arg() for arg in args])
+
+    def _expr_read_details(self, block):
+        env, index = self.env, int(_field(block, "DETAIL_INDEX"))
+        return lambda: env.details.get(index)
+
+    def _expr_contract_check_result(self, block):
+        env, expected = self.env, _field(block, "CHECK_RESULT")
+        return lambda: env.result == expected
+
+    def _expr_text_prompt_ext(self, block):
+        # Answered from Environment.inputs under the strategy_value of the input it feeds
+        element, key = block, None
+        while element is not None and key is None:
+            key = element.get("strategy_value")
+            element = self.parents.get(element)
+        env, key = self.env, key or block.get("id")
+        return lambda: env.prompt(key)
+
+    def _expr_stat(self, block):
+        env = self.env
+        return lambda: env.stat
+
+    def _expr_check_sell(self, block):
+        env = self.env
+        return lambda: env.sell_available
+
+
+def compile_strategy(xml, env: Optional[Environment] = None, counter: Optional[List[int]] = None) -> Program:
+    """Compile strategy XML (str, bytes or an Element) into a Program"""
+    return Compiler(env, counter).compile(xml)
+
+
+def simulate(program: Program, market=None, rng: Optional[random.Random] = None, max_trades: int = 1000,
+             max_ticks: int = 100000):
+    """
+    Run one session of a compiled strategy against synthetic ticks, executing its stacks as DBot
+    would, until after_purchase stops trading or a limit is reached. Returns (total profit, trades)
+    Binary contracts settle in one draw; accumulators are knocked out per tick, as in backtest.MarketModel
+    """
+    if market is None:
+        from backtest import MarketModel
+        market = MarketModel()
+    draw = (rng or random.Random()).random
+    env = program.env
+    program.reset()
+    env.details.clear()
+    env.stat = 0
+    program.initialization()
+
+    accumulator = program.growth_rate is not None
+    if accumulator:
+        growth = program.growth_rate
+        survival = (1 - market.accumulator_edge) / (1 + growth)
+
+    total = 0.0
+    trades = 0
+    ticks = 0
+    while trades < max_trades and ticks < max_ticks:
+        env.purchased = None
+        env.trade_again = False
+        env.sold = False
+        env.sell_available = False
+        program.before_purchase()
+        if env.purchased is None:
+            # Nothing bought on this tick; the market moves on
+            ticks += 1
+            if accumulator:
+                env.stat = env.stat + 1 if draw() < survival else 0
+            program.tick_analysis()
+            continue
+
+        stake = program.amount()
+        if accumulator:
+            take_profit = program.take_profit() if program.take_profit is not None else None
+            held = 0
+            profit = -stake
+            while ticks < max_ticks:
+                ticks += 1
+                if draw() >= survival:
+                    env.stat = 0
+                    break
+                env.stat += 1
+                held += 1
+                value = stake * ((1 + growth) ** held - 1)
+                program.tick_analysis()
+                env.sell_available = True
+                program.during_purchase()
+                if env.sold or (take_profit and value >= take_profit):
+                    profit = value
+                    break
+            win = profit > 0
+        else:
+            ticks += 1
+            win = draw() < market.win_probability
+            profit = stake * market.payout if win else -stake
+
+        profit = round(profit, 2)
+        total += profit
+        trades += 1
+        env.result = "win" if win else "loss"
+        env.details[2] = stake
+        env.details[4] = profit
+        program.after_purchase()
+        if not env.trade_again:
+            break
+    return round(total, 2), trades
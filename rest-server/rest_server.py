@@ -1,15 +1,100 @@
 #!/usr/bin/env python3
-from flask import Flask, request, jsonify
+import json
+import os
+import sys
+import time
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from strategy_generator import StrategyGenerator
-from strategy_parser import StrategyParser
+# The shared strategy_core package sits at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from batch import iter_batch
+from risk import RiskScorer
+from streaming import STRATEGY_HASH_HEADER, json_envelope, read_format, stream_strategy
+from strategy_core.batching import read_batch
+from strategy_core.http_cache import (
+    ARCHIVE_MAX_AGE, MAX_AGE, STREAM_LEVELS, compress, negotiate_encoding, read_query, strategy_etag
+)
+from strategy_core.metrics import CONTENT_TYPE, METRICS
+from strategy_core.prefork import preload, serve_forked
+from strategy_core.refinement import Refiner
+from strategy_core.strategy_cache import StrategyCache
+from strategy_core.strategy_generator import StrategySpec
+from strategy_core.strategy_library import default_library
+from strategy_core.strategy_parser import StrategyParser, defaults_for
+from strategy_core.strategy_store import is_digest
+from strategy_core.validator import validate_strategy
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 # Initialize components
-generator = StrategyGenerator()
 parser = StrategyParser()
+cache = StrategyCache.from_env(envelope=json_envelope)
+refiner = Refiner.from_env(parser, cache.store)
+library = default_library()
+risk = RiskScorer.from_env()
+METRICS.collect('strategy_cache_hits_total', 'counter', 'Rendered strategy cache hits', lambda: cache.hits)
+METRICS.collect('strategy_cache_misses_total', 'counter', 'Rendered strategy cache misses', lambda: cache.misses)
+METRICS.collect('llm_fallbacks_total', 'counter', 'Prompts answered by the rule-based extractor after an LLM failure',
+                lambda: parser.fallbacks)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def count_request(response):
+    """Count the request and record its latency until the response starts"""
+    METRICS.count_request(request.endpoint or 'unknown', response.status_code, time.perf_counter() - g.request_start)
+    return response
+
+def strategy_response(spec, response_format='json', stream=False, score_risk=True):
+    """
+    Respond with a spec's strategy in the best content coding the client accepts, or with 304 Not
+    Modified when a GET carries its current ETag
+    """
+    # Monte Carlo risk summary, bounded by RISK_TIME_BUDGET; clients may opt out with "risk": false
+    score_risk = bool(score_risk) and response_format == 'json'
+    encoding = negotiate_encoding(request.accept_encodings)
+    etag = strategy_etag(spec, f'{response_format}+risk' if score_risk else response_format, encoding)
+
+    if request.method in ('GET', 'HEAD') and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif stream:
+        risk_summary = None
+        if score_risk:
+            with METRICS.stage('risk'):
+                risk_summary = risk.score(spec)
+        with METRICS.stage('render'):
+            chunks, headers = stream_strategy(cache, spec, response_format, encoding, risk_summary)
+        response = Response(chunks, headers=headers)
+    else:
+        with METRICS.stage('render'):
+            entry = cache.get(spec)
+        risk_summary = None
+        if score_risk:
+            with METRICS.stage('risk'):
+                risk_summary = risk.score(spec)
+        with METRICS.stage('serialize'):
+            # Without a risk summary the body is the cached envelope; with one it is compressed per request
+            if risk_summary is None and encoding in entry.envelopes:
+                response = Response(entry.envelopes[encoding], mimetype='application/json')
+            else:
+                response = jsonify({'strategy': entry.xml, 'risk': risk_summary})
+                if encoding:
+                    response.set_data(compress(response.get_data(), encoding, STREAM_LEVELS[encoding]))
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        if entry.digest is not None:
+            response.headers[STRATEGY_HASH_HEADER] = entry.digest
+
+    # A risk summary cut short by its time budget can differ between calls, so its tag is weak
+    response.set_etag(etag, weak=score_risk)
+    response.vary.add('Accept-Encoding')
+    if request.method in ('GET', 'HEAD'):
+        response.cache_control.public = True
+        response.cache_control.max_age = MAX_AGE
+    return response
 
 @app.route('/generate_strategy', methods=['POST'])
 def generate_strategy():
@@ -21,26 +106,191 @@ def generate_strategy():
             return jsonify({'error': 'Missing prompt in request body'}), 400
             
         prompt = data['prompt']
+
+        # Optionally customize a reference strategy instead of the generated one
+        reference = data.get('reference')
+        if reference is not None and reference not in library.strategies:
+            return jsonify({'error': f'Unknown reference strategy: {reference}'}), 400
+        if not isinstance(data.get('options', {}), dict):
+            return jsonify({'error': 'options must be an object'}), 400
+
+        try:
+            if reference is not None:
+                library.check_options(reference, data.get('options', {}))
+            response_format, stream = read_format(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Parse parameters from prompt
-        params = parser.parse_prompt(prompt)
+        # Parse parameters from prompt; without the LLM, a prompt the rule-based extractor cannot read is refused
+        try:
+            params = parser.parse_prompt(prompt, defaults_for(reference))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        params.update(reference=reference, options=data.get('options', {}))
         
-        if not parser.validate_parameters(params):
+        with METRICS.stage('validate'):
+            valid = parser.validate_parameters(params)
+        if not valid:
             return jsonify({'error': 'Could not extract valid parameters from prompt'}), 400
             
         # Generate strategy XML
-        strategy_xml = generator.generate_strategy(
-            duration=params["duration"],
-            stake=params["stake"],
-            initial_stake=params["initial_stake"],
-            profit_threshold=params["profit_threshold"],
-            loss_threshold=params["loss_threshold"]
-        )
-        
-        return jsonify({'strategy': strategy_xml})
+        spec = StrategySpec.from_params(params)
+        return strategy_response(spec, response_format, stream, data.get('risk', True))
         
     except Exception as e:
         return jsonify({'error': f'Error generating strategy: {str(e)}'}), 500
 
+@app.route('/generate_strategy', methods=['GET'])
+def get_strategy():
+    """Generate a trading strategy from parameters in the query string, cacheable by browsers and CDNs"""
+    try:
+        params, controls = read_query(request.args)
+        response_format, stream = read_format(controls)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    reference = params.get('reference')
+    if reference is not None and reference not in library.strategies:
+        return jsonify({'error': f'Unknown reference strategy: {reference}'}), 400
+    try:
+        if reference is not None:
+            library.check_options(reference, params['options'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    params = {**defaults_for(reference), **params}
+    with METRICS.stage('validate'):
+        valid = parser.validate_parameters(params)
+    if not valid:
+        return jsonify({'error': 'Invalid strategy parameters'}), 400
+
+    try:
+        return strategy_response(StrategySpec.from_params(params), response_format, stream, controls.get('risk', True))
+    except Exception as e:
+        return jsonify({'error': f'Error generating strategy: {str(e)}'}), 500
+
+@app.route('/generate_strategies', methods=['POST'])
+def generate_strategies():
+    """Generate strategies for a batch of prompts or parameter sets, streamed back as NDJSON"""
+    try:
+        items = read_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    lines = (json.dumps(result) + '\n' for result in iter_batch(parser, cache, items))
+    return Response(lines, mimetype='application/x-ndjson')
+
+@app.route('/reference_strategies', methods=['GET'])
+def reference_strategies():
+    """List the reference strategies with their configurable parameters"""
+    return jsonify([strategy.summary() for strategy in library.strategies.values()])
+
+@app.route('/reference_strategies/<name>', methods=['GET'])
+def reference_strategy(name):
+    """Serve a reference strategy's XML"""
+    try:
+        strategy = library.get(name)
+    except KeyError:
+        return jsonify({'error': f'Unknown reference strategy: {name}'}), 404
+    return jsonify({'strategy': strategy.xml.decode()})
+
+@app.route('/refine_strategy', methods=['POST'])
+def refine_strategy():
+    """
+    Change the strategy of a session with a follow-up message such as "same as before but stake 20",
+    and re-render the whole updated spec; without a session, the message starts one
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('message'), str):
+        return jsonify({'error': 'Missing message in request body'}), 400
+    session = data.get('session')
+    if session is not None and not isinstance(session, str):
+        return jsonify({'error': 'session must be a string'}), 400
+    options = data.get('options')
+    if options is not None and not isinstance(options, dict):
+        return jsonify({'error': 'options must be an object'}), 400
+
+    try:
+        refinement = refiner.refine(data['message'], session, data.get('reference'), options)
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error refining strategy: {str(e)}'}), 500
+
+    response = jsonify(refinement.summary())
+    if refinement.digest is not None:
+        response.headers[STRATEGY_HASH_HEADER] = refinement.digest
+    return response
+
+@app.route('/strategy/<digest>', methods=['GET'])
+def archived_strategy(digest):
+    """Re-download a strategy handed out earlier by the hash in its X-Strategy-Hash response header"""
+    if not is_digest(digest):
+        return jsonify({'error': 'Strategy hash must be 64 lowercase hex digits'}), 400
+    if request.if_none_match.contains(digest):
+        response = Response(status=304)
+    else:
+        data = cache.store.get(digest) if cache.store is not None else None
+        if data is None:
+            return jsonify({'error': f'Unknown strategy: {digest}'}), 404
+        response = Response(data, content_type='application/xml')
+    # Content-addressed, so the hash is the ETag and the body never changes
+    response.set_etag(digest)
+    response.cache_control.public = True
+    response.cache_control.max_age = ARCHIVE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/validate_strategy', methods=['POST'])
+def check_strategy():
+    """
+    Check strategy XML is well-formed DBot Blockly: the raw request body, read as it streams in,
+    or the "xml" string of a JSON body
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('xml'), str):
+            return jsonify({'error': 'Missing xml in request body'}), 400
+        source = data['xml']
+    else:
+        source = request.stream
+    with METRICS.stage('validate'):
+        validation = validate_strategy(source)
+    return jsonify(validation.summary())
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Report rendered strategy and prompt cache counters, strategy archive occupancy and refinement sessions"""
+    return jsonify({
+        'strategies': cache.stats(),
+        'archive': cache.store.stats() if cache.store is not None else None,
+        'prompts': parser.cache.stats() if parser.cache else None,
+        'llm': parser.stats(),
+        'risk': risk.stats(),
+        'sessions': refiner.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request counters, stage timings and LLM token usage in the Prometheus text format"""
+    if not METRICS.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
+def serve_worker(listener):
+    """Serve on the listening socket of the preforking parent"""
+    from werkzeug.serving import make_server
+    risk.start()
+    make_server('0.0.0.0', 5000, app, threaded=True, fd=listener.fileno()).serve_forever()
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000)
+    workers = int(os.getenv('WORKERS', 1))
+    if workers > 1:
+        # Build the library and LLM clients once; the forked workers inherit them
+        preload(parser)
+        serve_forked(serve_worker, '0.0.0.0', 5000, workers)
+    else:
+        risk.start()
+        app.run(host='0.0.0.0', port=5000)
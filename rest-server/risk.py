@@ -0,0 +1,173 @@
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from backtest import BacktestResult, MarketModel, backtest, reference_values
+from strategy_core.strategy_generator import StrategySpec
+
+
+def _simulate(spec: StrategySpec, runs: int, max_trades: int, market: MarketModel,
+              seed: np.random.SeedSequence, deadline: float) -> BacktestResult:
+    """Worker entry point: one chunk of sessions with its own generator"""
+    return backtest(spec, runs=runs, max_trades=max_trades, market=market, rng=np.random.default_rng(seed),
+                    deadline=deadline)
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+def risk_summary(result: BacktestResult, spec: StrategySpec, complete: bool) -> Dict[str, Any]:
+    """Risk figures reported with a generated strategy"""
+    summary = result.summary()
+    initial_stake = float(reference_values(spec)["stake"] if spec.reference is not None else spec.stake) or 1.0
+    return {
+        "runs": summary["runs"],
+        "complete": complete,
+        "loss_probability": summary["ruin_probability"],
+        "profit_probability": summary["target_probability"],
+        "expected_trades": summary["trades"]["mean"],
+        "expected_profit": summary["profit"]["mean"],
+        "profit_p5": summary["profit"]["p5"],
+        "worst_case_stake": summary["peak_stake"]["max"],
+        "stake_escalation": summary["peak_stake"]["max"] / initial_stake,
+        "max_drawdown": summary["max_drawdown"]["max"]
+    }
+
+
+class RiskScorer:
+    """
+    Monte Carlo risk scoring on a process pool
+    The runs are split into a fixed number of chunks, each seeded from (seed, chunk index), so a
+    complete result is the same whichever worker runs each chunk and however many workers there are
+    Chunks unfinished after `time_budget` seconds are abandoned and the summary covers the rest;
+    it is cached like a complete one (as is None when no chunk finished), so a spec costs the
+    budget once. Scoring runs in the calling thread until start() brings up the worker processes
+    """
+
+    def __init__(self, runs: int = 10000, workers: Optional[int] = None, time_budget: float = 0.25,
+                 seed: int = 0, max_trades: int = 500, chunks: int = 16, cache_size: int = 1024,
+                 market: MarketModel = MarketModel()):
+        self.runs = runs
+        self.workers = workers or os.cpu_count() or 1
+        self.time_budget = time_budget
+        self.seed = seed
+        self.max_trades = max_trades
+        self.chunks = max(1, min(runs, chunks))
+        self.cache_size = cache_size
+        self.market = market
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pool = None
+
+    @classmethod
+    def from_env(cls) -> "RiskScorer":
+        """Build a scorer configured by the RISK_* environment variables; RISK_RUNS=0 disables scoring"""
+        workers = os.getenv("RISK_WORKERS")
+        return cls(
+            runs=int(os.getenv("RISK_RUNS", 10000)),
+            workers=int(workers) if workers else None,
+            time_budget=float(os.getenv("RISK_TIME_BUDGET", 0.25)),
+            seed=int(os.getenv("RISK_SEED", 0)),
+            max_trades=int(os.getenv("RISK_MAX_TRADES", 500)),
+            cache_size=int(os.getenv("RISK_CACHE_SIZE", 1024))
+        )
+
+    def start(self):
+        """Start the worker processes ahead of the first request"""
+        with self._start_lock:
+            if self.workers <= 1 or self._pool is not None:
+                return
+            # Spawned workers do not inherit the server's threads or sockets
+            pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            for future in [pool.submit(_warm) for _ in range(self.workers)]:
+                future.result()
+            self._pool = pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _run(self, spec: StrategySpec):
+        seeds = np.random.SeedSequence(self.seed).spawn(self.chunks)
+        sizes = [len(chunk) for chunk in np.array_split(np.arange(self.runs), self.chunks)]
+        start = time.perf_counter()
+        # CLOCK_MONOTONIC is shared by all processes, so workers abandon chunks past the same deadline
+        deadline = time.monotonic() + self.time_budget
+        if self._pool is None:
+            # In-process: run chunks in order until the budget is spent
+            results = []
+            for size, seed in zip(sizes, seeds):
+                try:
+                    results.append(_simulate(spec, size, self.max_trades, self.market, seed, deadline))
+                except TimeoutError:
+                    break
+        else:
+            futures = [
+                self._pool.submit(_simulate, spec, size, self.max_trades, self.market, seed, deadline)
+                for size, seed in zip(sizes, seeds)
+            ]
+            concurrent.futures.wait(futures, timeout=self.time_budget)
+            for future in futures:
+                future.cancel()
+            results = [
+                future.result() for future in futures
+                if future.done() and not future.cancelled() and future.exception() is None
+            ]
+        if not results:
+            return None, False
+        return BacktestResult.combine(results, time.perf_counter() - start), len(results) == self.chunks
+
+    def score(self, spec: StrategySpec) -> Optional[Dict[str, Any]]:
+        """Risk summary for a strategy spec, from the cache when the same parameters were scored before"""
+        if self.runs <= 0:
+            return None
+        key = spec.normalized()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        try:
+            result, complete = self._run(key)
+        except Exception as e:
+            # A failed simulation must not fail strategy generation
+            print(f"Error scoring strategy risk: {e}")
+            return None
+        if not complete:
+            with self._lock:
+                self.timeouts += 1
+        # A partial summary covers the first seeded chunks to finish, a smaller sample of the same
+        # runs; when none finished in time the spec is remembered as unscored (None)
+        summary = risk_summary(result, key, complete) if result is not None else None
+
+        with self._lock:
+            self._entries[key] = summary
+            while len(self._entries) > self.cache_size:
+                self._entries.popitem(last=False)
+        return summary
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "timeouts": self.timeouts,
+                "workers": self.workers
+            }
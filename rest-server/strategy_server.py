@@ -1,42 +1,127 @@
 #!/usr/bin/env python3
+import asyncio
 import os
+import sys
 from mcp.server.fastmcp import FastMCP, Context
-from strategy_generator import StrategyGenerator
-from strategy_parser import StrategyParser
+# The shared strategy_core package sits at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from batch import iter_batch_async
+from strategy_core.batching import BATCH_WORKERS, read_batch
+from strategy_core.metrics import METRICS
+from strategy_core.refinement import Refiner
+from strategy_core.strategy_cache import StrategyCache
+from strategy_core.strategy_generator import StrategySpec
+from strategy_core.strategy_library import default_library
+from strategy_core.strategy_parser import StrategyParser, defaults_for
+from strategy_core.validator import validate_strategy
 
 # Create MCP server
 mcp = FastMCP("Strategy")
 
 # Initialize components
-generator = StrategyGenerator()
 parser = StrategyParser()
+cache = StrategyCache.from_env()
+refiner = Refiner.from_env(parser, cache.store)
+library = default_library()
 
 @mcp.tool()
-def generate_strategy(prompt: str, ctx: Context):
-    """Generate a trading strategy from description"""
+@METRICS.instrument("generate_strategy")
+async def generate_strategy(prompt: str, ctx: Context, reference: str = None, options: dict = None):
+    """
+    Generate a trading strategy from description
+    Name a `reference` strategy to customize it instead, setting its other inputs (size, max_stake...) from `options`
+    """
     try:
+        if reference is not None and reference not in library.strategies:
+            error_msg = f"Unknown reference strategy: {reference}"
+            await ctx.error(error_msg)
+            return error_msg
+
+        if reference is not None:
+            library.check_options(reference, options or {})
+
         # Parse parameters from prompt using context
-        params = parser.parse_prompt(prompt)
+        params = await parser.parse_prompt_async(prompt, defaults_for(reference))
+        params.update(reference=reference, options=options or {})
         
-        if not parser.validate_parameters(params):
+        with METRICS.stage("validate"):
+            valid = parser.validate_parameters(params)
+        if not valid:
             error_msg = "Could not extract valid parameters from prompt"
-            ctx.error(error_msg)
+            await ctx.error(error_msg)
             return error_msg
             
-        # Generate strategy XML
-        strategy_xml = generator.generate_strategy(
-            duration=params["duration"],
-            stake=params["stake"],
-            initial_stake=params["initial_stake"],
-            profit_threshold=params["profit_threshold"],
-            loss_threshold=params["loss_threshold"]
-        )
-        return strategy_xml
+        # Generate strategy XML; a cache miss renders and validates off the event loop
+        with METRICS.stage("render"):
+            entry = await asyncio.to_thread(cache.get, StrategySpec.from_params(params))
+        return entry.xml
         
     except Exception as e:
         error_msg = f"Error generating strategy: {str(e)}"
-        ctx.error(error_msg)
+        await ctx.error(error_msg)
         return error_msg
 
+@mcp.tool()
+@METRICS.instrument("refine_strategy")
+async def refine_strategy(message: str, ctx: Context, session: str = None, reference: str = None,
+                          options: dict = None) -> dict:
+    """
+    Change the strategy of a session with a follow-up message such as "same as before but stake 20";
+    without a `session`, the message starts one. Returns the session, the strategy XML, its
+    parameters and which of them changed
+    """
+    try:
+        return (await refiner.refine_async(message, session, reference, options)).summary()
+    except KeyError as e:
+        await ctx.error(e.args[0])
+        return {"error": e.args[0]}
+    except Exception as e:
+        error_msg = f"Error refining strategy: {str(e)}"
+        await ctx.error(error_msg)
+        return {"error": error_msg}
+
+@mcp.tool()
+@METRICS.instrument("generate_strategies")
+async def generate_strategies(ctx: Context, prompts: list[str] = None, parameters: list[dict] = None) -> list[str]:
+    """Generate trading strategies for a batch of descriptions and/or explicit parameter sets"""
+    try:
+        items = read_batch({"prompts": prompts, "parameters": parameters})
+    except ValueError as e:
+        await ctx.error(str(e))
+        return [str(e)]
+
+    # Results arrive out of order; put each back at its position in the batch
+    strategies = [None] * len(items)
+    async for result in iter_batch_async(parser, cache, items, asyncio.Semaphore(BATCH_WORKERS)):
+        if "error" in result:
+            await ctx.error(f"Item {result['index']}: {result['error']}")
+        strategies[result["index"]] = result.get("strategy", result.get("error"))
+    return strategies
+
+@mcp.tool(name="validate_strategy")
+@METRICS.instrument("validate_strategy")
+def check_strategy(xml: str) -> dict:
+    """
+    Check strategy XML is well-formed DBot Blockly: known block types, a complete trade definition,
+    declared variables and calls to defined procedures
+    """
+    with METRICS.stage("validate"):
+        return validate_strategy(xml).summary()
+
+@mcp.resource("reference://strategies")
+def reference_strategies() -> list[dict]:
+    """List the reference strategies with their configurable parameters"""
+    return [strategy.summary() for strategy in library.strategies.values()]
+
+@mcp.resource("reference://strategies/{name}", mime_type="application/xml")
+def reference_strategy(name: str) -> str:
+    """Serve a reference strategy's XML"""
+    return library.get(name).xml.decode()
+
+@mcp.resource("metrics://prometheus", mime_type="text/plain")
+def metrics() -> str:
+    """Request counters, stage timings and LLM token usage in the Prometheus text format"""
+    return METRICS.render()
+
 if __name__ == "__main__":
     mcp.run()
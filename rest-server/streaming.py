@@ -0,0 +1,72 @@
+"""Chunked /generate_strategy responses: raw XML or the JSON contract, optionally compressed on the fly"""
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from strategy_core.http_cache import iter_compress
+from strategy_core.strategy_generator import STREAM_CHUNK_SIZE, StrategySpec, iter_strategy_bytes
+
+FORMATS = ("json", "xml")
+# Names the archived copy of a strategy, served by GET /strategy/<hash>
+STRATEGY_HASH_HEADER = "X-Strategy-Hash"
+
+
+def read_format(data: Dict[str, Any]) -> Tuple[str, bool]:
+    """
+    Response format and whether to stream it: "format": "xml" streams the raw XML, "stream": true
+    streams the JSON contract. Raises ValueError for an unknown format
+    """
+    response_format = data.get("format", "json")
+    if response_format not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    return response_format, response_format == "xml" or bool(data.get("stream", False))
+
+
+def iter_json(chunks: Iterable[bytes], risk_summary: Optional[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Wrap a stream of XML chunks in the {'risk', 'strategy'} JSON contract, escaping one chunk at a time
+    The output is byte for byte what Flask's jsonify produces for the same response
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    yield b'{"risk":' + json.dumps(risk_summary, separators=(",", ":"), sort_keys=True).encode() + b',"strategy":"'
+    for chunk in chunks:
+        # Escape large uncopied segments a slice at a time to bound the escaped copies
+        view = memoryview(chunk)
+        for start in range(0, len(view), STREAM_CHUNK_SIZE):
+            text = decoder.decode(view[start:start + STREAM_CHUNK_SIZE])
+            if text:
+                yield json.dumps(text)[1:-1].encode()
+    yield b'"}\n'
+
+
+def json_envelope(data: bytes) -> bytes:
+    """The JSON contract of a rendered strategy without a risk summary, for the StrategyCache to keep"""
+    return b"".join(iter_json((data,), None))
+
+
+def stream_strategy(cache, spec: StrategySpec, format: str = "json", encoding: Optional[str] = None,
+                    risk_summary: Optional[Dict[str, Any]] = None) -> Tuple[Iterator[bytes], Dict[str, str]]:
+    """
+    Body chunks and headers of a streamed strategy response
+    With the cache enabled, the shared cached rendering (or its precompressed copy) is sent as is;
+    without it or a strategy store to archive the whole document in, the strategy is rendered
+    chunk by chunk, so no request holds the whole document
+    """
+    headers = {"Content-Type": "application/xml" if format == "xml" else "application/json"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    entry = cache.get(spec) if cache.max_bytes > 0 or cache.store is not None else None
+    if entry is not None and entry.digest is not None:
+        headers[STRATEGY_HASH_HEADER] = entry.digest
+    if format == "xml" and entry is not None and entry.encoded(encoding) is not None:
+        return iter((entry.encoded(encoding),)), headers
+    if format == "json" and risk_summary is None and entry is not None and encoding in entry.envelopes:
+        return iter((entry.envelopes[encoding],)), headers
+
+    chunks = iter((entry.data,)) if entry is not None else iter_strategy_bytes(spec)
+    if format == "json":
+        chunks = iter_json(chunks, risk_summary)
+    if encoding:
+        chunks = iter_compress(chunks, encoding)
+    return chunks, headers
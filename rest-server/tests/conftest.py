@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The server modules sit one level up and import the shared strategy_core package from the repository root
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, os.pardir), os.path.join(HERE, os.pardir, os.pardir)]
@@ -0,0 +1,47 @@
+import random
+
+import numpy as np
+import pytest
+
+import interpreter
+from backtest import backtest, family
+from strategy_core.strategy_generator import StrategySpec, render_strategy_bytes
+
+SESSIONS = 400
+
+
+def interpret(spec, sessions=SESSIONS):
+    """(trades, profit) per session of the rendered strategy, executed block by block"""
+    program = interpreter.compile_strategy(render_strategy_bytes(spec))
+    rng = random.Random(0)
+    results = [interpreter.simulate(program, rng=rng) for _ in range(sessions)]
+    return np.array([trades for _, trades in results]), np.array([profit for profit, _ in results])
+
+
+@pytest.mark.parametrize("spec", [
+    # Neither threshold is reachable by one contract: trading never stops
+    StrategySpec(stake=1, profit_threshold=10, loss_threshold=5),
+    # Either outcome of the first contract stops it
+    StrategySpec(stake=1, profit_threshold=0.5, loss_threshold=0.5),
+    # Only a win stops it
+    StrategySpec(stake=2, profit_threshold=1.5, loss_threshold=5),
+])
+def test_generated_strategy_matches_interpreter(spec):
+    trades, profit = interpret(spec)
+    result = backtest(spec, runs=SESSIONS * 10, seed=0)
+    assert result.trades.mean() == pytest.approx(trades.mean(), rel=0.15)
+    assert (result.outcome != 0).mean() == pytest.approx((trades < 1000).mean(), abs=0.05)
+    # Sessions that stop on their first contract stop on a loss exactly when it lost
+    if (trades == 1).all():
+        assert (result.outcome == -1).mean() == pytest.approx((profit < 0).mean(), abs=0.08)
+
+
+def test_generated_strategy_thresholds_apply_per_contract():
+    result = backtest(StrategySpec(stake=1, profit_threshold=10, loss_threshold=5), runs=1000, max_trades=200, seed=0)
+    assert (result.trades == 200).all()
+    assert not result.outcome.any()
+
+
+def test_unknown_family():
+    with pytest.raises(ValueError, match="Unknown strategy family"):
+        family("no_such_strategy")
@@ -0,0 +1,17 @@
+import pytest
+
+from benchmarks import NEGATIVE_PROMPTS, PROMPT_CORPUS
+from strategy_core.fast_extractor import extract_parameters
+
+
+@pytest.mark.parametrize("prompt", NEGATIVE_PROMPTS)
+def test_qualified_numbers_are_left_to_the_llm(prompt):
+    extraction = extract_parameters(prompt)
+    assert not extraction.complete and not extraction.understood
+
+
+@pytest.mark.parametrize("prompt, expected", PROMPT_CORPUS)
+def test_complete_extractions_are_correct(prompt, expected):
+    extraction = extract_parameters(prompt)
+    if extraction.complete:
+        assert all(extraction.params[key] == value for key, value in expected.items())
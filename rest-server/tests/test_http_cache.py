@@ -0,0 +1,103 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+import asgi_server
+import rest_server
+from strategy_core.strategy_cache import StrategyCache
+from strategy_core.strategy_generator import StrategySpec
+from streaming import json_envelope
+
+QUERY = "/generate_strategy?stake=10&duration=5&profit_threshold=100&loss_threshold=50&risk=false"
+
+
+class Client:
+    """(status, headers, body) of a request to either server, with a fresh compressing cache"""
+
+    def __init__(self, server):
+        self.server = server
+        server.cache = StrategyCache(compress=True, envelope=json_envelope)
+        self.client = server.app.test_client()
+
+    def request(self, method, path, headers=None, json=None):
+        if self.server is rest_server:
+            response = self.client.open(path, method=method, headers=headers, json=json)
+            return response.status_code, response.headers, response.get_data()
+
+        async def send():
+            response = await self.client.open(path, method=method, headers=headers, json=json)
+            return response.status_code, response.headers, await response.get_data()
+        return asyncio.run(send())
+
+    def get(self, path, headers=None):
+        return self.request("GET", path, headers)
+
+
+@pytest.fixture(params=[rest_server, asgi_server], ids=["flask", "asgi"])
+def client(request, monkeypatch):
+    # Restore the server's own cache afterwards
+    monkeypatch.setattr(request.param, "cache", request.param.cache)
+    return Client(request.param)
+
+
+def test_etag_revalidation(client):
+    status, headers, body = client.get(QUERY)
+    assert status == 200 and headers["ETag"]
+    assert "public" in headers["Cache-Control"]
+    status, _, body = client.get(QUERY, {"If-None-Match": headers["ETag"]})
+    assert status == 304 and body == b""
+    # Another spec is another entity
+    status, _, _ = client.get(QUERY.replace("stake=10", "stake=11"), {"If-None-Match": headers["ETag"]})
+    assert status == 200
+
+
+def test_gzip_negotiation(client):
+    _, plain_headers, plain = client.get(QUERY)
+    status, headers, body = client.get(QUERY, {"Accept-Encoding": "gzip"})
+    assert status == 200
+    assert "Content-Encoding" not in plain_headers and headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in headers["Vary"]
+    assert gzip.decompress(body) == plain
+    # Each coding has its own tag
+    assert headers["ETag"] != plain_headers["ETag"]
+    status, _, _ = client.get(QUERY, {"Accept-Encoding": "gzip", "If-None-Match": plain_headers["ETag"]})
+    assert status == 200
+
+
+def test_cached_envelope_matches_serialized_response(client):
+    _, _, body = client.get(QUERY)
+    spec = StrategySpec.from_params({"stake": 10, "duration": 5, "profit_threshold": 100, "loss_threshold": 50})
+    assert json.loads(body) == {"strategy": client.server.cache.get(spec).xml, "risk": None}
+    # The body came from the cache
+    assert client.server.cache.stats()["entries"] == 1
+
+
+@pytest.mark.parametrize("name, text", [
+    ("stake", "inf"), ("stake", "nan"), ("stake", "-5"), ("duration", "0"), ("loss_threshold", "-inf"),
+    ("profit_threshold", "0"), ("stake", "ten"),
+])
+def test_invalid_parameters_are_rejected(client, name, text):
+    status, _, body = client.get(f"/generate_strategy?{name}={text}&format=xml")
+    assert status == 400
+    assert "error" in json.loads(body)
+    assert not client.server.cache.stats()["entries"]
+
+
+def test_reference_options(client):
+    status, _, _ = client.get("/generate_strategy?reference=martingale&no_such_input=1")
+    assert status == 400
+    status, _, _ = client.request("POST", "/generate_strategy",
+                                  json={"prompt": "x", "reference": "martingale", "options": {"size": [2]}, "risk": False})
+    assert status == 400
+    # Fields the request leaves out keep the reference's own values
+    status, _, body = client.get("/generate_strategy?reference=martingale&size=3&risk=false")
+    assert status == 200
+    assert json.loads(body)["strategy"].encode() == client.server.library.template("martingale").render({"size": 3})
+
+
+def test_boolean_is_not_a_number():
+    assert not rest_server.parser.validate_parameters(
+        {"stake": True, "duration": 5, "profit_threshold": 100, "loss_threshold": 50}
+    )
@@ -0,0 +1,40 @@
+import pytest
+
+from benchmarks import PROMPT_CORPUS
+from strategy_core.fast_extractor import extract_parameters
+from strategy_core.strategy_parser import DEFAULT_PARAMETERS, StrategyParser
+
+
+class DownClient:
+    """Stand-in for anthropic.Anthropic whose every call fails"""
+
+    def __init__(self):
+        self.messages = self
+
+    def create(self, **kwargs):
+        raise ConnectionError("LLM unavailable")
+
+
+@pytest.fixture
+def parser():
+    # Without the fast path every prompt goes to the failing client first
+    return StrategyParser(client=DownClient(), cache=False, fast_path=False)
+
+
+def test_fallback_serves_prompts_the_extractor_reads(parser):
+    prompt, expected = PROMPT_CORPUS[0]
+    assert extract_parameters(prompt).complete
+    assert parser.parse_prompt(prompt) == {**DEFAULT_PARAMETERS, **expected}
+    assert parser.fallbacks == 1
+
+
+def test_fallback_refuses_prompts_the_extractor_cannot_read(parser):
+    with pytest.raises(ValueError, match="Could not extract parameters"):
+        parser.parse_prompt("something cautious on volatility, please")
+    assert parser.fallbacks == 1
+
+
+def test_refine_fallback_refuses_messages_the_extractor_cannot_read(parser):
+    with pytest.raises(ValueError, match="Could not extract changes"):
+        parser.refine_parameters("a bit more aggressive than before", dict(DEFAULT_PARAMETERS))
+    assert parser.fallbacks == 1
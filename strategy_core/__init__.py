@@ -0,0 +1,38 @@
+"""
+Strategy generation shared by the REST and MCP servers: generator, parser, caches and reference library
+Names are imported from their modules on first access, so importing the package (or any one
+module) does not pull in the rest, nor the anthropic SDK before the first LLM call
+"""
+import importlib
+
+_EXPORTS = {
+    "StrategySpec": "strategy_generator",
+    "StrategyGenerator": "strategy_generator",
+    "render_strategy": "strategy_generator",
+    "render_strategy_bytes": "strategy_generator",
+    "StrategyParser": "strategy_parser",
+    "DEFAULT_PARAMETERS": "strategy_parser",
+    "defaults_for": "strategy_parser",
+    "StrategyCache": "strategy_cache",
+    "PromptCache": "prompt_cache",
+    "StrategyStore": "strategy_store",
+    "StrategyLibrary": "strategy_library",
+    "default_library": "strategy_library",
+    "validate_strategy": "validator",
+    "METRICS": "metrics",
+    "Refiner": "refinement",
+    "read_batch": "batching",
+    "preload": "prefork",
+    "serve_forked": "prefork",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
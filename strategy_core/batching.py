@@ -0,0 +1,52 @@
+"""Batch requests shared by the REST and MCP servers: reading a batch and grouping its identical items"""
+import os
+from typing import Any, Dict, List, Tuple
+
+from .prompt_cache import normalize_prompt
+from .strategy_generator import StrategySpec
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 100))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 8))
+# Why a batch item whose parameters do not validate is rejected, by kind
+INVALID_MESSAGES = {
+    "prompt": "Could not extract valid parameters from prompt",
+    "parameters": "Invalid strategy parameters",
+}
+
+
+def read_batch(data: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    """
+    Read the items of a batch request: a list of `prompts`, a list of explicit `parameters`
+    sets, or both. Raises ValueError for a malformed batch
+    """
+    if not data:
+        raise ValueError("Missing prompts or parameters")
+    prompts = data.get("prompts") or []
+    parameters = data.get("parameters") or []
+    if not isinstance(prompts, list) or not all(isinstance(prompt, str) for prompt in prompts):
+        raise ValueError("prompts must be a list of strings")
+    if not isinstance(parameters, list) or not all(isinstance(params, dict) for params in parameters):
+        raise ValueError("parameters must be a list of objects")
+    items = [("prompt", prompt) for prompt in prompts] + [("parameters", params) for params in parameters]
+    if not items:
+        raise ValueError("Missing prompts or parameters")
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch is limited to {MAX_BATCH_SIZE} items")
+    return items
+
+
+def group_items(items: List[Tuple[str, Any]]) -> Dict[Any, List[int]]:
+    """Map each distinct item to the positions it occupies in the batch"""
+    groups = {}
+    for index, (kind, value) in enumerate(items):
+        try:
+            if kind == "prompt":
+                key = (kind, normalize_prompt(value))
+            else:
+                key = (kind, StrategySpec.from_params(value).normalized())
+            hash(key)
+        except TypeError:
+            # Unhashable parameter values are never deduplicated
+            key = (kind, index)
+        groups.setdefault(key, []).append(index)
+    return groups
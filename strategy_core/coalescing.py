@@ -0,0 +1,193 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+
+class SingleFlight:
+    """Share one in-flight call among concurrent callers with the same key"""
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._futures: Dict[Any, Future] = {}
+        self._tasks: Dict[Any, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, func: Callable, *args):
+        """Call func(*args), or wait for the call already running under `key` and share its result"""
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._futures[key]
+
+    async def run_async(self, key, func: Callable, *args):
+        """Asynchronous variant of run; cancelling one waiter leaves the shared call running for the others"""
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = self._tasks[key] = asyncio.ensure_future(func(*args))
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+class BatchFailed(Exception):
+    """A packed request failed; its callers fall back to one request each"""
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        self.timer = None
+
+
+class MicroBatcher:
+    """
+    Pack items submitted within `window` seconds of each other into one call of `send_many`, at
+    most `max_size` items per call, and hand each caller its own result
+    A lone item goes through `send_one`; if a packed call fails, each caller retries with `send_one`
+    """
+
+    def __init__(self, send_one: Callable, send_many: Callable, window: float = 0.01, max_size: int = 8,
+                 send_one_async: Callable = None, send_many_async: Callable = None):
+        self.send_one = send_one
+        self.send_many = send_many
+        self.send_one_async = send_one_async
+        self.send_many_async = send_many_async
+        self.window = window
+        self.max_size = max_size
+        self.calls = 0
+        self.batched_calls = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+        self._pending = None
+        self._pending_async = None
+        self._sending = set()
+        self._lock = threading.Lock()
+
+    def _add(self, batch: _Batch, item, future) -> bool:
+        """Append to a batch; returns True once it is full"""
+        batch.items.append((item, future))
+        return len(batch.items) >= self.max_size
+
+    def _count(self, batch: _Batch):
+        with self._lock:
+            self.calls += 1
+            if len(batch.items) > 1:
+                self.batched_calls += 1
+                self.batched_items += len(batch.items)
+
+    def _deliver(self, batch: _Batch, results: List[Any]):
+        if len(results) != len(batch.items):
+            raise ValueError(f"Expected {len(batch.items)} results, got {len(results)}")
+        for (_, future), result in zip(batch.items, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _fail(self, batch: _Batch, error: BaseException):
+        # A lone item's own error is final; a packed call's error sends everyone back to send_one
+        error = error if len(batch.items) == 1 else BatchFailed(str(error))
+        for _, future in batch.items:
+            if not future.done():
+                future.set_exception(error)
+
+    def submit(self, item):
+        """Return the result for `item`, sent together with the items other threads submit meanwhile"""
+        future = Future()
+        with self._lock:
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = _Batch()
+            if self._add(batch, item, future):
+                self._pending = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._pending is batch:
+                    self._pending = None
+            self._count(batch)
+            items = [item for item, _ in batch.items]
+            try:
+                self._deliver(batch, [self.send_one(items[0])] if len(items) == 1 else self.send_many(items))
+            except Exception as e:
+                self._fail(batch, e)
+
+        try:
+            return future.result()
+        except BatchFailed:
+            with self._lock:
+                self.fallbacks += 1
+            return self.send_one(item)
+
+    async def submit_async(self, item):
+        """Asynchronous variant of submit; the packed call runs as its own task, unaffected by a cancelled caller"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending_async
+        if batch is None:
+            batch = self._pending_async = _Batch()
+            batch.timer = loop.call_later(self.window, self._flush_async, batch)
+        if self._add(batch, item, future):
+            batch.timer.cancel()
+            self._flush_async(batch)
+
+        try:
+            return await future
+        except BatchFailed:
+            self.fallbacks += 1
+            return await self.send_one_async(item)
+
+    def _flush_async(self, batch: _Batch):
+        if self._pending_async is batch:
+            self._pending_async = None
+        task = asyncio.ensure_future(self._send_async(batch))
+        # Keep a reference until the task finishes
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send_async(self, batch: _Batch):
+        self._count(batch)
+        items = [item for item, _ in batch.items]
+        try:
+            if len(items) == 1:
+                results = [await self.send_one_async(items[0])]
+            else:
+                results = await self.send_many_async(items)
+            self._deliver(batch, results)
+        except Exception as e:
+            self._fail(batch, e)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "batched_calls": self.batched_calls,
+                "batched_items": self.batched_items,
+                "fallbacks": self.fallbacks
+            }
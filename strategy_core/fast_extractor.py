@@ -0,0 +1,165 @@
+import re
+from decimal import Decimal
+from typing import Any, Dict, NamedTuple, Tuple
+
+# Symbols the extractor recognizes, with the market and submarket they trade on
+SYMBOLS = {}
+for _n in (10, 25, 50, 75, 100):
+    SYMBOLS[f"R_{_n}"] = ("synthetic_index", "random_index")
+    SYMBOLS[f"JD{_n}"] = ("synthetic_index", "jump_index")
+for _n in (10, 25, 50, 75, 100, 150, 250):
+    SYMBOLS[f"1HZ{_n}V"] = ("synthetic_index", "random_index")
+for _currency in ("AUD", "EUR", "GBP", "USD", "XAU"):
+    SYMBOLS[f"WLD{_currency}"] = ("basket_index", "forex_basket")
+
+_NUMBER = r"(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?"
+_NUM = r"(?P<value>" + _NUMBER + r")"
+_CONNECTOR = r"\s*(?:of|at|to|is|=|:)?\s*(?:\$|usd)?\s*"
+_AMOUNT = r"\$?\s*" + _NUM + r"\s*(?:usd|dollars?|\$)?"
+
+_NUMBER_PATTERN = re.compile(_NUMBER)
+# A sign before a number changes what the digits mean
+_SIGN = re.compile(r"[-+\u2212]\s*$")
+_SYMBOL_PATTERN = re.compile(
+    r"(?<!\w)(?:(?P<code>" + "|".join(sorted(SYMBOLS, key=len, reverse=True)) + r")"
+    r"|volatility\s+(?P<vol>\d+)\s*(?P<fast>\(1s\)\s*)?index"
+    r"|jump\s+(?P<jump>\d+)\s*index)(?!\w)",
+    re.IGNORECASE
+)
+# After a number the extractor may read: the end of the text, punctuation, a currency or tick unit,
+# a word starting the next field or clause, or a symbol. Anything else ("1k", "10%", "5 minutes", "3 losses")
+# means the digits are not the amount they look like
+_FOLLOWER = re.compile(
+    r"\s*(?:$|[^\w\s%\u00d7]|(?:usd|dollars?|ticks?|stake|initial|duration|take|profit|target|stop|loss"
+    r"|max(?:imum)?|and|for|on|with|then|index)(?!\w)|" + _SYMBOL_PATTERN.pattern + ")",
+    re.IGNORECASE
+)
+
+# Each field has a primary and a secondary pattern. All primary patterns are tried first,
+# then secondary ones, in field order; a number claimed earlier is not offered again
+FIELD_PATTERNS = tuple(
+    (field, tuple(re.compile(pattern, re.IGNORECASE) for pattern in patterns))
+    for field, patterns in (
+        ("initial_stake", (
+            r"initial\s+stake" + _CONNECTOR + _NUM,
+            _AMOUNT + r"\s+initial\s+stake",
+        )),
+        ("duration", (
+            _NUM + r"\s*-?\s*ticks?\b",
+            r"duration" + _CONNECTOR + _NUM,
+        )),
+        ("profit_threshold", (
+            r"(?:take[\s-]*profit|profit\s+(?:target|threshold|limit)|target\s+profit|profit|target)" + _CONNECTOR + _NUM,
+            _AMOUNT + r"\s+(?:take[\s-]*profit|profit(?:\s+target)?)",
+        )),
+        ("loss_threshold", (
+            r"(?:stop[\s-]*loss|loss\s+(?:threshold|limit)|max(?:imum)?\s+loss|loss)" + _CONNECTOR + _NUM,
+            _AMOUNT + r"\s+(?:stop[\s-]*loss|loss(?:\s+limit)?)",
+        )),
+        ("stake", (
+            r"stake(?:\s+amount)?" + _CONNECTOR + _NUM,
+            _AMOUNT + r"\s+stake",
+        )),
+    )
+)
+
+REQUIRED_FIELDS = ("stake",)
+
+
+class Extraction(NamedTuple):
+    """Parameters found by the rule-based extractor and how far they can be trusted"""
+    params: Dict[str, Any]
+    confidence: float
+    missing: Tuple[str, ...]
+    ambiguous: Tuple[str, ...]
+
+    @property
+    def complete(self) -> bool:
+        """True when the prompt was fully understood and the LLM can be skipped"""
+        return self.confidence >= 1.0 and not self.missing and not self.ambiguous
+
+    @property
+    def understood(self) -> bool:
+        """True when every number in the prompt was attributed to one field: enough to change known parameters"""
+        return self.confidence >= 1.0 and not self.ambiguous and bool(self.params)
+
+
+def _number(text: str):
+    value = Decimal(text.replace(",", ""))
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def _symbol(match) -> str:
+    if match.group("code"):
+        return next(symbol for symbol in SYMBOLS if symbol.lower() == match.group("code").lower())
+    if match.group("jump"):
+        return f"JD{match.group('jump')}"
+    if match.group("fast"):
+        return f"1HZ{match.group('vol')}V"
+    return f"R_{match.group('vol')}"
+
+
+def extract_parameters(prompt: str) -> Extraction:
+    """
+    Extract strategy parameters from a formulaic prompt without calling the LLM
+    Confidence is the share of numbers in the prompt that were attributed to a field; signed
+    numbers and those followed by a multiplier or a unit other than currency or ticks ("1k",
+    "10%", "2x", "5 minutes") are never attributed
+    """
+    found = {}
+    ambiguous = set()
+    claimed = []
+    numbers = [match.span() for match in _NUMBER_PATTERN.finditer(prompt)]
+    qualified = [
+        (start, end) for start, end in numbers
+        if _SIGN.search(prompt, max(0, start - 8), start) or not _FOLLOWER.match(prompt, end)
+    ]
+
+    symbols = set()
+    for match in _SYMBOL_PATTERN.finditer(prompt):
+        symbol = _symbol(match)
+        if symbol in SYMBOLS:
+            symbols.add(symbol)
+            claimed.append(match.span())
+    if len(symbols) > 1:
+        ambiguous.add("symbol")
+    elif symbols:
+        symbol = symbols.pop()
+        found["market"], found["submarket"] = SYMBOLS[symbol]
+        found["symbol"] = symbol
+
+    values = {field: set() for field, _ in FIELD_PATTERNS}
+    for rank in range(2):
+        for field, patterns in FIELD_PATTERNS:
+            for match in patterns[rank].finditer(prompt):
+                start, end = match.span("value")
+                if any(start < claim_end and claim_start < end for claim_start, claim_end in claimed + qualified):
+                    continue
+                values[field].add(_number(match.group("value")))
+                claimed.append((start, end))
+    for field, field_values in values.items():
+        if len(field_values) > 1:
+            ambiguous.add(field)
+        elif field_values:
+            found[field] = field_values.pop()
+
+    # Mirror the stake so the first trade and the reset stake agree
+    if "stake" in found and "initial_stake" not in found:
+        found["initial_stake"] = found["stake"]
+    elif "initial_stake" in found and "stake" not in found:
+        found["stake"] = found["initial_stake"]
+
+    attributed = sum(
+        any(claim_start <= start and end <= claim_end for claim_start, claim_end in claimed)
+        for start, end in numbers
+    )
+    confidence = attributed / len(numbers) if numbers else 0.0
+    if ambiguous:
+        confidence = 0.0
+
+    return Extraction(
+        params=found,
+        confidence=confidence,
+        missing=tuple(field for field in REQUIRED_FIELDS if field not in found),
+        ambiguous=tuple(sorted(ambiguous))
+    )
@@ -0,0 +1,114 @@
+"""HTTP caching for /generate_strategy: ETags, content-encoding negotiation and query-string parameters"""
+import gzip
+import hashlib
+import math
+import os
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from .strategy_generator import StrategySpec, TEMPLATE_DIGEST
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred first when the client weighs them equally
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+# Cached bodies are compressed once, so they get a higher level than per-response streams
+CACHED_LEVELS = {"gzip": 9, "br": 9}
+STREAM_LEVELS = {"gzip": 6, "br": 5}
+# A smaller hash table than zlib's default memLevel 8 cuts the per-stream compressor state
+# by about a third for well under 1% of compression ratio on the reference strategies
+GZIP_MEM_LEVEL = 5
+MAX_AGE = int(os.getenv("STRATEGY_MAX_AGE", 3600))
+# An archived strategy never changes under its hash
+ARCHIVE_MAX_AGE = 365 * 24 * 3600
+
+# Query-string arguments that shape the response rather than the strategy
+CONTROL_PARAMETERS = ("format", "stream", "risk")
+
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    """Best content coding the client accepts from a werkzeug Accept-Encoding header, or None for identity"""
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compress a whole body with a negotiated content coding"""
+    level = level or CACHED_LEVELS[encoding]
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def iter_compress(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress a stream of chunks incrementally, yielding output as it becomes available"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=STREAM_LEVELS["br"])
+        compress_chunk, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(STREAM_LEVELS["gzip"], zlib.DEFLATED, 16 + zlib.MAX_WBITS, GZIP_MEM_LEVEL)
+        compress_chunk, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = compress_chunk(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def strategy_etag(spec: StrategySpec, representation: str, encoding: Optional[str] = None) -> str:
+    """
+    Unquoted entity tag of a strategy response, hashed from the normalized spec, the template it
+    renders from and the representation, so it is known without rendering and stable across workers
+    """
+    if spec.reference is not None:
+        from .strategy_library import default_library
+        digest = default_library().template(spec.reference).digest
+    else:
+        digest = TEMPLATE_DIGEST
+    key = repr((spec.normalized(), digest, representation))
+    tag = hashlib.sha256(key.encode()).hexdigest()[:32]
+    # Each content coding is a different entity
+    return f"{tag}-{encoding}" if encoding else tag
+
+
+def query_value(text: str):
+    """
+    Read a query-string value as an int, float or boolean where it looks like one; raises
+    ValueError for infinities and NaN, which have no place in a strategy or its JSON
+    """
+    for convert in (int, float):
+        try:
+            value = convert(text)
+        except ValueError:
+            continue
+        if not math.isfinite(value):
+            raise ValueError(f"Parameter values must be finite numbers, not {text}")
+        return value
+    if text.lower() in ("true", "false"):
+        return text.lower() == "true"
+    return text
+
+
+def read_query(args) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Split query-string arguments into strategy parameters (reference options included) and
+    response controls; raises ValueError for parameters a generated strategy does not have
+    """
+    params, options, controls = {}, {}, {}
+    for name, text in args.items():
+        if name == "reference":
+            params[name] = text
+            continue
+        value = query_value(text)
+        if name in CONTROL_PARAMETERS:
+            controls[name] = value
+        elif name in StrategySpec._fields and name != "options":
+            params[name] = value
+        else:
+            options[name] = value
+    if options and "reference" not in params:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(options))}")
+    params["options"] = options
+    return params, controls
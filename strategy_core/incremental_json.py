@@ -0,0 +1,64 @@
+import json
+from typing import Any, Optional
+
+
+class JSONScanner:
+    """
+    Find the first complete JSON object (or array, with opening="[") in text that arrives in pieces,
+    skipping any prose before or after it. Only the characters added since the last feed are scanned
+    """
+
+    def __init__(self, opening: str = "{"):
+        self.opening = opening
+        self.buffer = ""
+        self.position = 0
+        self.start = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> Optional[Any]:
+        """Add text; returns the parsed value as soon as it is complete, else None"""
+        self.buffer += text
+        buffer = self.buffer
+        index = self.position
+        while index < len(buffer):
+            char = buffer[index]
+            if self.start is None:
+                if char == self.opening:
+                    self.start = index
+                    self.depth = 1
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        return json.loads(buffer[self.start:index + 1])
+                    except ValueError:
+                        # Bracketed prose rather than JSON; look again after its opening bracket
+                        index, self.start = self.start, None
+            index += 1
+        if self.start is None:
+            # Prose before the opening bracket is never looked at again
+            self.buffer, self.position = "", 0
+        else:
+            self.position = len(buffer)
+        return None
+
+
+def find_json(text: str, opening: str = "{") -> Any:
+    """Parse the first JSON object (or array) in `text`, ignoring surrounding prose; raises ValueError if there is none"""
+    value = JSONScanner(opening).feed(text)
+    if value is None:
+        raise ValueError(f"No JSON {'array' if opening == '[' else 'object'} in the LLM response")
+    return value
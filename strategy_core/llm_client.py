@@ -0,0 +1,415 @@
+"""
+Resilient access to the Anthropic Messages API: a shared pooled HTTP transport, per-call deadlines,
+jittered retries under a retry budget, a circuit breaker and hedged requests
+The anthropic SDK takes over a second to import, so it is imported when the first client is built
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 32))
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+
+
+def build_client():
+    """Anthropic client over one pooled connection set; retries are left to ResilientClient"""
+    import anthropic
+    return anthropic.Anthropic(
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        http_client=anthropic.DefaultHttpxClient(limits=_limits()),
+        max_retries=0
+    )
+
+
+def build_async_client():
+    """Asynchronous variant of build_client"""
+    import anthropic
+    return anthropic.AsyncAnthropic(
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        http_client=anthropic.DefaultAsyncHttpxClient(limits=_limits()),
+        max_retries=0
+    )
+
+
+class ResiliencePolicy(NamedTuple):
+    """How hard to try an LLM call; times are in seconds"""
+    # Whole call including retries and backoff, and each attempt within it
+    deadline: float = 30.0
+    attempt_timeout: float = 15.0
+    max_attempts: int = 3
+    # Full-jitter exponential backoff: sleep uniformly up to min(cap, base * 2 ** retry)
+    backoff_base: float = 0.2
+    backoff_cap: float = 2.0
+    # Retries and hedges may add about this fraction of calls, plus a small reserve
+    retry_ratio: float = 0.2
+    retry_reserve: int = 10
+    # Consecutive upstream failures that open the circuit, and how long it stays open
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+    # Send a second copy of an attempt still unanswered after this long; None disables hedging
+    hedge_after: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "ResiliencePolicy":
+        """Policy configured by the LLM_* environment variables"""
+        hedge_after = os.getenv("LLM_HEDGE_AFTER")
+        return cls(
+            deadline=float(os.getenv("LLM_DEADLINE", 30)),
+            attempt_timeout=float(os.getenv("LLM_ATTEMPT_TIMEOUT", 15)),
+            max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", 3)),
+            retry_ratio=float(os.getenv("LLM_RETRY_RATIO", 0.2)),
+            failure_threshold=int(os.getenv("LLM_FAILURE_THRESHOLD", 5)),
+            reset_timeout=float(os.getenv("LLM_RESET_TIMEOUT", 30)),
+            hedge_after=float(hedge_after) if hedge_after else None
+        )
+
+
+class CircuitOpen(Exception):
+    """The upstream is failing; calls are refused until the circuit's reset timeout passes"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """An LLM call ran out of its deadline"""
+
+
+def retryable(error: BaseException) -> bool:
+    """Whether an error says the upstream is unhealthy rather than the request is wrong"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # Until anthropic is imported, no error can come from it
+    anthropic = sys.modules.get("anthropic")
+    if anthropic is None:
+        return False
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class RetryBudget:
+    """Token bucket limiting retries and hedges to about `ratio` of calls, so they cannot multiply an outage"""
+
+    def __init__(self, ratio: float = 0.2, reserve: int = 10):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.tokens = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.reserve, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Closed while the upstream answers; open after `failure_threshold` consecutive failures, refusing
+    calls for `reset_timeout` seconds; then half open, letting a single trial call decide
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ResilientClient:
+    """
+    Drop-in wrapper for the `messages` API of an Anthropic client (or a stub with the same shape)
+    create() and stream() get the deadline, retries, circuit breaker and hedging of `policy`; a
+    stream is retried and hedged until it opens, after which its events are read as usual
+    Without a `client`, one is built by `factory` (build_client) on first use
+    """
+    factory = staticmethod(build_client)
+
+    def __init__(self, client=None, policy: ResiliencePolicy = ResiliencePolicy(), factory: Callable = None):
+        self._client = client
+        if factory is not None:
+            self.factory = factory
+        self.policy = policy
+        self.messages = self
+        self.budget = RetryBudget(policy.retry_ratio, policy.retry_reserve)
+        self.breaker = CircuitBreaker(policy.failure_threshold, policy.reset_timeout)
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.rejected = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._hedging = ThreadPoolExecutor(thread_name_prefix="llm-hedge") if policy.hedge_after else None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self.factory()
+        return self._client
+
+    def prepare(self):
+        """Build the wrapped client now rather than on the first call"""
+        return self.client
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _start(self) -> float:
+        """Admit a call through the circuit breaker; returns its deadline"""
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpen("LLM circuit is open")
+        self.budget.deposit()
+        return time.monotonic() + self.policy.deadline
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("LLM call deadline exceeded")
+        return min(self.policy.attempt_timeout, remaining)
+
+    def _backoff(self, error: BaseException, attempt: int, deadline: float) -> float:
+        """Record a failed attempt; returns the delay before retrying, or re-raises if it should not be"""
+        if not retryable(error):
+            # The upstream answered, it just rejected this request
+            self.breaker.record_success()
+            raise error
+        self.breaker.record_failure()
+        self._count("failures")
+        delay = random.uniform(0, min(self.policy.backoff_cap, self.policy.backoff_base * 2 ** attempt))
+        if attempt + 1 >= self.policy.max_attempts or time.monotonic() + delay >= deadline:
+            raise error
+        if not self.budget.withdraw():
+            raise error
+        self._count("retries")
+        return delay
+
+    def call(self, attempt: Callable, kwargs: Dict[str, Any], discard: Callable = None):
+        """Run attempt(**kwargs, timeout=...) under the policy; `discard` releases the result of a losing hedge"""
+        deadline = self._start()
+        for number in range(self.policy.max_attempts):
+            timeout = self._attempt_timeout(deadline)
+            try:
+                result = self._hedged(attempt, {**kwargs, "timeout": timeout}, discard)
+            except Exception as e:
+                time.sleep(self._backoff(e, number, deadline))
+                if not self.breaker.allow():
+                    self._count("rejected")
+                    raise CircuitOpen("LLM circuit opened while retrying") from e
+                continue
+            self.breaker.record_success()
+            return result
+        raise DeadlineExceeded("LLM call deadline exceeded")
+
+    def _hedged(self, attempt: Callable, kwargs: Dict[str, Any], discard: Callable = None):
+        if self._hedging is None or self.policy.hedge_after >= kwargs["timeout"]:
+            return attempt(**kwargs)
+        expires = time.monotonic() + kwargs["timeout"]
+        first = self._hedging.submit(attempt, **kwargs)
+        done, _ = wait([first], timeout=self.policy.hedge_after)
+        if done or not self.budget.withdraw():
+            return first.result(timeout=max(0, expires - time.monotonic()))
+        self._count("hedges")
+        second = self._hedging.submit(attempt, **kwargs)
+
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0, expires - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                error = DeadlineExceeded("LLM attempt timed out")
+                break
+            winners = [future for future in done if future.exception() is None]
+            if winners:
+                if winners[0] is second:
+                    self._count("hedge_wins")
+                # The slower copy cannot be interrupted; release whatever it returns
+                for loser in winners[1:] + list(pending):
+                    if discard:
+                        loser.add_done_callback(lambda future: future.exception() or discard(future.result()))
+                return winners[0].result()
+            error = next(iter(done)).exception()
+        if discard:
+            for future in pending:
+                future.add_done_callback(lambda future: future.exception() or discard(future.result()))
+        raise error
+
+    def create(self, **kwargs):
+        """messages.create with retries, hedging and the circuit breaker"""
+        return self.call(self.client.messages.create, kwargs)
+
+    def stream(self, **kwargs) -> "_ResilientStream":
+        """messages.stream whose opening request gets retries, hedging and the circuit breaker"""
+        return _ResilientStream(self, kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "rejected": self.rejected,
+                "circuit": self.breaker.state,
+                "circuit_opened": self.breaker.opened,
+                "retry_tokens": round(self.budget.tokens, 2)
+            }
+
+
+def _open_stream(client, **kwargs):
+    manager = client.messages.stream(**kwargs)
+    return manager, manager.__enter__()
+
+
+def _close_stream(opened):
+    opened[0].__exit__(None, None, None)
+
+
+class _ResilientStream:
+    def __init__(self, resilient: ResilientClient, kwargs: Dict[str, Any]):
+        self.resilient = resilient
+        self.kwargs = kwargs
+        self.manager = None
+
+    def __enter__(self):
+        self.manager, stream = self.resilient.call(
+            lambda **kwargs: _open_stream(self.resilient.client, **kwargs), self.kwargs, _close_stream
+        )
+        return stream
+
+    def __exit__(self, *exc):
+        return self.manager.__exit__(*exc)
+
+
+class AsyncResilientClient(ResilientClient):
+    """Asynchronous variant of ResilientClient for an AsyncAnthropic client; losing hedges are cancelled"""
+    factory = staticmethod(build_async_client)
+
+    async def call(self, attempt: Callable, kwargs: Dict[str, Any], discard: Callable = None):
+        deadline = self._start()
+        for number in range(self.policy.max_attempts):
+            timeout = self._attempt_timeout(deadline)
+            try:
+                result = await self._hedged(attempt, {**kwargs, "timeout": timeout}, discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await asyncio.sleep(self._backoff(e, number, deadline))
+                if not self.breaker.allow():
+                    self._count("rejected")
+                    raise CircuitOpen("LLM circuit opened while retrying") from e
+                continue
+            self.breaker.record_success()
+            return result
+        raise DeadlineExceeded("LLM call deadline exceeded")
+
+    async def _hedged(self, attempt: Callable, kwargs: Dict[str, Any], discard: Callable = None):
+        if not self.policy.hedge_after or self.policy.hedge_after >= kwargs["timeout"]:
+            return await asyncio.wait_for(attempt(**kwargs), kwargs["timeout"])
+        first = asyncio.ensure_future(asyncio.wait_for(attempt(**kwargs), kwargs["timeout"]))
+        done, _ = await asyncio.wait([first], timeout=self.policy.hedge_after)
+        if done or not self.budget.withdraw():
+            return await first
+        self._count("hedges")
+        second = asyncio.ensure_future(asyncio.wait_for(attempt(**kwargs), kwargs["timeout"] - self.policy.hedge_after))
+
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if task.exception() is None]
+                if winners:
+                    if winners[0] is second:
+                        self._count("hedge_wins")
+                    for loser in winners[1:]:
+                        if discard:
+                            await discard(loser.result())
+                    return winners[0].result()
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def create(self, **kwargs):
+        return await self.call(self.client.messages.create, kwargs)
+
+    def stream(self, **kwargs) -> "_AsyncResilientStream":
+        return _AsyncResilientStream(self, kwargs)
+
+
+async def _open_stream_async(client, **kwargs):
+    manager = client.messages.stream(**kwargs)
+    return manager, await manager.__aenter__()
+
+
+async def _close_stream_async(opened):
+    await opened[0].__aexit__(None, None, None)
+
+
+class _AsyncResilientStream:
+    def __init__(self, resilient: AsyncResilientClient, kwargs: Dict[str, Any]):
+        self.resilient = resilient
+        self.kwargs = kwargs
+        self.manager = None
+
+    async def __aenter__(self):
+        self.manager, stream = await self.resilient.call(
+            lambda **kwargs: _open_stream_async(self.resilient.client, **kwargs), self.kwargs, _close_stream_async
+        )
+        return stream
+
+    async def __aexit__(self, *exc):
+        return await self.manager.__aexit__(*exc)
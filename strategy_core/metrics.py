@@ -0,0 +1,231 @@
+"""
+Request counters, per-stage timings and LLM token usage, exposed in the Prometheus text format
+With METRICS_ENABLED=0 every recording call returns at once and nothing is kept
+"""
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from typing import Any, Callable, Dict, List, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds in seconds, from a cache hit to a slow LLM round trip
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name: (type, label names, help)
+FAMILIES = {
+    "strategy_requests_total": ("counter", ("endpoint", "status"), "Requests served, by endpoint and status"),
+    "strategy_request_duration_seconds": ("histogram", ("endpoint",), "Request latency until the response starts"),
+    "strategy_stage_duration_seconds": (
+        "histogram", ("stage",), "Time spent in each stage: normalize, cache_lookup, retrieve, llm, validate, render, risk, serialize"
+    ),
+    "llm_tokens_total": ("counter", ("direction",), "LLM tokens used, input and output"),
+}
+# Timings held back before they are added to the histograms, at most
+MAX_PENDING = 4096
+
+
+class Histogram:
+    """Bucket counts and sum of observed values"""
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        # A value equal to a bound belongs to that bucket ("le")
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        lines, total = [], 0
+        separator = "," if labels else ""
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {total}')
+        braces = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{braces} {self.sum!r}")
+        lines.append(f"{name}_count{braces} {total}")
+        return lines
+
+
+class _Stage:
+    __slots__ = ("metrics", "histogram", "start")
+
+    def __init__(self, metrics: "Metrics", histogram: Histogram):
+        self.metrics = metrics
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._record(self.histogram, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Metrics:
+    """Thread-safe registry of the FAMILIES series, plus values read from callbacks when scraped"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._series: Dict[str, Dict[Tuple[str, ...], Any]] = {name: {} for name in FAMILIES}
+        self._collectors: Dict[str, Tuple[str, str, Callable[[], float]]] = {}
+        # The stage histograms by stage name, saving a series lookup per stage
+        self._stages: Dict[str, Histogram] = {}
+        # Timings not yet added to their histogram: appending to a deque needs no lock, so a stage
+        # costs one append, and the lock holder adds them up in a batch
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Metrics":
+        """Registry enabled unless METRICS_ENABLED=0"""
+        return cls(enabled=os.getenv("METRICS_ENABLED", "1") == "1")
+
+    def inc(self, name: str, labels: Tuple[str, ...], amount: float = 1):
+        if not self.enabled:
+            return
+        series = self._series[name]
+        with self._lock:
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name: str, labels: Tuple[str, ...], value: float):
+        if not self.enabled:
+            return
+        series = self._series[name]
+        with self._lock:
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.observe(value)
+
+    def _histogram(self, name: str, labels: Tuple[str, ...]) -> Histogram:
+        series = self._series[name]
+        histogram = series.get(labels)
+        if histogram is None:
+            with self._lock:
+                histogram = series.setdefault(labels, Histogram())
+        return histogram
+
+    def stage(self, name: str):
+        """Context manager timing one stage of a request into strategy_stage_duration_seconds"""
+        if not self.enabled:
+            return _NULL_STAGE
+        histogram = self._stages.get(name)
+        if histogram is None:
+            histogram = self._stages[name] = self._histogram("strategy_stage_duration_seconds", (name,))
+        return _Stage(self, histogram)
+
+    def count_request(self, endpoint: str, status, seconds: float):
+        """Count a finished request and record its latency"""
+        if not self.enabled:
+            return
+        counts = self._series["strategy_requests_total"]
+        labels = (endpoint, str(status))
+        histogram = self._histogram("strategy_request_duration_seconds", (endpoint,))
+        with self._lock:
+            counts[labels] = counts.get(labels, 0) + 1
+        self._record(histogram, seconds)
+
+    def _record(self, histogram: Histogram, value: float):
+        """Queue a timing for its histogram, adding up the queue once MAX_PENDING are waiting"""
+        pending = self._pending
+        pending.append((histogram, value))
+        if len(pending) >= MAX_PENDING:
+            with self._lock:
+                self._fold()
+
+    def _fold(self):
+        """Add the pending timings to their histograms; the caller holds the lock"""
+        pending = self._pending
+        for _ in range(len(pending)):
+            histogram, value = pending.popleft()
+            histogram.observe(value)
+
+    def count_tokens(self, usage):
+        """Add the token usage of an LLM response (anything with input_tokens/output_tokens, or None)"""
+        if not self.enabled or usage is None:
+            return
+        self.inc("llm_tokens_total", ("input",), getattr(usage, "input_tokens", None) or 0)
+        self.inc("llm_tokens_total", ("output",), getattr(usage, "output_tokens", None) or 0)
+
+    def instrument(self, endpoint: str) -> Callable:
+        """Decorator counting and timing calls of a handler (an MCP tool, say); raising counts as status "error" """
+        def decorate(func):
+            if inspect.iscoroutinefunction(func):
+                @wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+                    start = time.perf_counter()
+                    status = "error"
+                    try:
+                        result = await func(*args, **kwargs)
+                        status = "ok"
+                        return result
+                    finally:
+                        self.count_request(endpoint, status, time.perf_counter() - start)
+                return async_wrapper
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                status = "error"
+                try:
+                    result = func(*args, **kwargs)
+                    status = "ok"
+                    return result
+                finally:
+                    self.count_request(endpoint, status, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def collect(self, name: str, kind: str, help: str, func: Callable[[], float]):
+        """Report func() as `name` at each scrape, for counters other components already keep; replaces an earlier `name`"""
+        self._collectors[name] = (kind, help, func)
+
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            self._fold()
+            for name, (kind, label_names, help) in FAMILIES.items():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for values, value in sorted(self._series[name].items()):
+                    labels = ",".join(f'{label}="{_escape(str(v))}"' for label, v in zip(label_names, values))
+                    if kind == "histogram":
+                        lines += value.samples(name, labels)
+                    else:
+                        lines.append(f"{name}{{{labels}}} {value!r}")
+        for name, (kind, help, func) in self._collectors.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {func()!r}"]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics.from_env()
@@ -0,0 +1,83 @@
+"""
+Preload/fork serving: build the shared read-only state once in a parent process, then fork
+workers that inherit it copy-on-write instead of each importing and building it again
+"""
+import gc
+import os
+import signal
+import socket
+import time
+import traceback
+from typing import Callable, Dict
+
+from .strategy_library import default_library
+
+
+def preload(parser=None) -> Dict[str, float]:
+    """
+    Build ahead of forking what every worker needs: the reference library and its splice
+    templates, and the parser's pooled LLM clients with the anthropic SDK behind them (each
+    worker opens its own connections on first use); returns the seconds each took
+    Objects left by then are frozen out of the garbage collector, so collections in the workers
+    do not touch, and so copy, the pages they share
+    """
+    timings = {}
+    start = time.perf_counter()
+    default_library()
+    timings["library"] = time.perf_counter() - start
+    if parser is not None:
+        start = time.perf_counter()
+        parser.client.prepare()
+        parser.async_client.prepare()
+        timings["llm_clients"] = time.perf_counter() - start
+    gc.collect()
+    gc.freeze()
+    return timings
+
+
+def serve_forked(serve: Callable[[socket.socket], None], host: str, port: int, workers: int):
+    """
+    Listen on host:port and fork `workers` processes, each running serve(listening socket) until it
+    returns; the parent replaces workers that die and stops them all on SIGINT or SIGTERM
+    """
+    listener = socket.create_server((host, port), backlog=1024)
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid:
+            children.add(pid)
+            return
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        status = 0
+        try:
+            serve(listener)
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+    print(f"Serving on {host}:{port} with {workers} forked workers")
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}; starting another")
+            spawn()
+    listener.close()
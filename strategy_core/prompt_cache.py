@@ -0,0 +1,119 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Optional
+
+_WHITESPACE = re.compile(r"\s+")
+# Commas only as valid thousands separators: "1,000" is 1000, while "1,5" and "1,2,3" stay lists
+_NUMBER = re.compile(r"(?<!\d)(?:\d{1,3}(?:,\d{3})+(?!\d)|\d+)(?:\.\d+)?")
+# Open caches, reconnected in forked children: SQLite connections must not cross a fork
+_OPEN_CACHES = weakref.WeakSet()
+
+
+def _normalize_number(match) -> str:
+    try:
+        value = Decimal(match.group().replace(",", ""))
+    except InvalidOperation:
+        return match.group()
+    return format(value.normalize(), "f")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize case, whitespace and number formatting so equivalent prompts share a key"""
+    prompt = _WHITESPACE.sub(" ", prompt.strip().lower())
+    return _NUMBER.sub(_normalize_number, prompt)
+
+
+class PromptCache:
+    """Persistent prompt-to-parameters cache backed by SQLite with least-recently-used eviction"""
+
+    def __init__(self, path: str = "prompt_cache.sqlite3", max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connect()
+        _OPEN_CACHES.add(self)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS prompt_cache ("
+            "key TEXT PRIMARY KEY, params TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS prompt_cache_last_used ON prompt_cache (last_used)")
+        self._entries = self._db.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+
+    @classmethod
+    def from_env(cls) -> Optional["PromptCache"]:
+        """Build a cache from PROMPT_CACHE_PATH / PROMPT_CACHE_MAX_ENTRIES; an empty path disables it"""
+        path = os.getenv("PROMPT_CACHE_PATH", "prompt_cache.sqlite3")
+        if not path:
+            return None
+        return cls(path, int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", 10000)))
+
+    def get(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """Return the cached parameters for `prompt`, or None on a miss"""
+        key = normalize_prompt(prompt)
+        with self._lock:
+            row = self._db.execute("SELECT params FROM prompt_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE prompt_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, prompt: str, params: Dict[str, Any]):
+        """Store the parameters extracted for `prompt`, evicting the least recently used entries"""
+        key = normalize_prompt(prompt)
+        with self._lock:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO prompt_cache (key, params, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(params), time.time())
+            ).rowcount
+            self._entries += inserted
+            excess = self._entries - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM prompt_cache WHERE key IN "
+                    "(SELECT key FROM prompt_cache ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._entries -= excess
+                self.evictions += excess
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and occupancy counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def close(self):
+        _OPEN_CACHES.discard(self)
+        with self._lock:
+            self._db.close()
+
+
+def _reconnect_after_fork():
+    # The parent's connection is left alone; closing it here would disturb the parent
+    for cache in list(_OPEN_CACHES):
+        cache._connect()
+
+
+os.register_at_fork(after_in_child=_reconnect_after_fork)
@@ -0,0 +1,177 @@
+"""
+Conversational refinement: a session keeps the parameters and spec of its last strategy, so a
+follow-up such as "same as before but stake 20" is read by the rule-based extractor where it can
+be and only the fields it changes are merged in
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from .metrics import METRICS
+from .strategy_generator import StrategySpec, render_strategy_bytes
+from .strategy_library import default_library
+from .strategy_parser import defaults_for
+from .validator import validate_strategy
+
+
+def _same(a, b) -> bool:
+    # 10 and 10.0 are equal but render differently
+    return type(a) is type(b) and a == b
+
+
+class Refinement(NamedTuple):
+    """
+    The outcome of one message in a session: its parameters, the fields changed from the previous
+    strategy (None for the first) and where the message was read ("parse" for the first message,
+    then "extractor", "llm" or "fallback")
+    """
+    session: str
+    params: Dict[str, Any]
+    changed: Optional[Tuple[str, ...]]
+    source: str
+    data: bytes
+    digest: Optional[str]
+
+    def summary(self) -> Dict[str, Any]:
+        """The response body for the refined strategy"""
+        return {
+            "session": self.session,
+            "strategy": self.data.decode(),
+            "parameters": self.params,
+            "changed": list(self.changed) if self.changed is not None else None,
+            "source": self.source,
+            "hash": self.digest
+        }
+
+
+class _Session:
+    __slots__ = ("params", "spec", "expires")
+
+    def __init__(self, params: Dict[str, Any], spec: StrategySpec, expires: float):
+        self.params = params
+        self.spec = spec
+        self.expires = expires
+
+
+class Refiner:
+    """
+    Refine strategies over a conversation: the first message of a session is parsed in full, later
+    ones only for the parameters they change
+    Sessions live in this process, at most `max_sessions` of them (least recently used dropped
+    first), each expiring `ttl` seconds after its last message. Like the StrategyCache, with
+    `validate` each refined strategy is checked by the structural validator, and with a `store`
+    it is archived there
+    """
+
+    def __init__(self, parser, store=None, max_sessions: int = 10000, ttl: float = 3600, validate: bool = False):
+        self.parser = parser
+        self.store = store
+        self.validate = validate
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.refinements = 0
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, parser, store=None) -> "Refiner":
+        """Build a refiner configured by REFINE_MAX_SESSIONS, REFINE_SESSION_TTL and STRATEGY_VALIDATE"""
+        return cls(
+            parser,
+            store,
+            max_sessions=int(os.getenv("REFINE_MAX_SESSIONS", 10000)),
+            ttl=float(os.getenv("REFINE_SESSION_TTL", 3600)),
+            validate=os.getenv("STRATEGY_VALIDATE", "1") == "1"
+        )
+
+    def _session(self, session_id: str) -> _Session:
+        """The live session with this id; raises KeyError for an unknown or expired one"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.expires <= time.monotonic():
+                self._sessions.pop(session_id, None)
+                raise KeyError(f"Unknown or expired session: {session_id}")
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def refine(self, message: str, session_id: Optional[str] = None, reference: Optional[str] = None,
+               options: Optional[Dict[str, Any]] = None) -> Refinement:
+        """
+        Apply a message to a session's strategy, or start a session with it when `session_id` is None
+        `reference` and `options` replace the session's when given. Raises KeyError for an unknown
+        session and ValueError when the result is not a valid strategy
+        """
+        session = self._session(session_id) if session_id is not None else None
+        if session is None:
+            params, source = self.parser.parse_prompt(message, defaults_for(reference)), "parse"
+        else:
+            delta, source = self.parser.refine_parameters(message, session.params)
+            params = {**session.params, **delta}
+        return self._apply(session_id, session, params, source, reference, options)
+
+    async def refine_async(self, message: str, session_id: Optional[str] = None, reference: Optional[str] = None,
+                           options: Optional[Dict[str, Any]] = None) -> Refinement:
+        """Asynchronous variant of refine for the ASGI server"""
+        session = self._session(session_id) if session_id is not None else None
+        if session is None:
+            params, source = await self.parser.parse_prompt_async(message, defaults_for(reference)), "parse"
+        else:
+            delta, source = await self.parser.refine_parameters_async(message, session.params)
+            params = {**session.params, **delta}
+        return self._apply(session_id, session, params, source, reference, options)
+
+    def _apply(self, session_id: Optional[str], session: Optional[_Session], params: Dict[str, Any], source: str,
+               reference: Optional[str], options: Optional[Dict[str, Any]]) -> Refinement:
+        """Render the new parameters of a session and keep them"""
+        if reference is not None:
+            params["reference"] = reference
+        if options is not None:
+            params["options"] = options
+        reference = params.get("reference")
+        if reference is not None and reference not in default_library().strategies:
+            raise ValueError(f"Unknown reference strategy: {reference}")
+        if reference is not None:
+            default_library().check_options(reference, params.get("options") or {})
+        with METRICS.stage("validate"):
+            valid = self.parser.validate_parameters(params)
+        if not valid:
+            raise ValueError("Could not extract valid parameters from prompt")
+
+        spec = StrategySpec.from_params(params)
+        with METRICS.stage("render"):
+            data = render_strategy_bytes(spec)
+        if self.validate:
+            with METRICS.stage("validate"):
+                validation = validate_strategy(data)
+            if not validation.valid:
+                raise ValueError(f"Rendered strategy is invalid: {'; '.join(validation.errors)}")
+        changed = None
+        if session is not None:
+            changed = tuple(
+                field for field, value in zip(spec._fields, spec) if not _same(value, getattr(session.spec, field))
+            )
+        digest = self.store.put(data) if self.store is not None else None
+
+        session_id = session_id or uuid.uuid4().hex
+        with self._lock:
+            self.refinements += 1
+            self._sessions[session_id] = _Session(params, spec, time.monotonic() + self.ttl)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return Refinement(session_id, params, changed, source, data, digest)
+
+    def stats(self) -> Dict[str, Any]:
+        """Live sessions and refinement counters"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "refinements": self.refinements,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,341 @@
+"""
+BM25 retrieval over the reference strategies and the docs, to put only relevant context in LLM prompts
+The index is built once into a flat binary file (native byte order, like any local cache) and
+memory-mapped: loading reads a fixed header, and lookups binary-search the sorted term table and
+read postings and snippet text straight from the mapped pages
+"""
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from .strategy_library import CACHE_DIRECTORY, REFERENCE_DIRECTORY, StrategyLibrary
+
+DOCS_DIRECTORY = os.getenv(
+    "DOCS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "docs")
+)
+INDEX_VERSION = 1
+MAGIC = b"STRBM25\0"
+# magic, version, fingerprint, documents, terms, postings, average document length
+_HEADER = struct.Struct("=8sI32sIIId")
+
+# Longer doc sections are split on paragraph boundaries
+MAX_SNIPPET_TOKENS = 300
+K1 = 1.2
+B = 0.75
+
+_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+_HEADING = re.compile(r"^(#{1,6})\s+(.*\S)")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in into is it its of on or so that the "
+    "their them then there these this to was we what when which will with you your".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text`, at about four characters per token"""
+    return (len(text) + 3) // 4
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case terms of `text`, splitting camelCase and snake_case names and dropping stopwords"""
+    terms = []
+    for word in _WORD.findall(text):
+        word = word.lower()
+        if word in _STOPWORDS:
+            continue
+        # Crude plural folding, so "strategies" finds "strategy"
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class Snippet(NamedTuple):
+    """A retrievable piece of context: one reference strategy, or one section of a doc"""
+    source: str
+    title: str
+    text: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.render())
+
+    def render(self) -> str:
+        return f"[{self.source}: {self.title}]\n{self.text}"
+
+
+def strategy_snippets(library: StrategyLibrary) -> Iterator[Snippet]:
+    """One snippet per reference strategy: its trade type, market, variables, procedures and parameters"""
+    for name, strategy in sorted(library.strategies.items()):
+        summary = strategy.summary()
+        yield Snippet(f"reference_strategies/{name}.xml", name, "\n".join((
+            f"Trade type: {'/'.join(filter(None, summary['trade_type']))}",
+            f"Market: {'/'.join(filter(None, summary['market']))}",
+            f"Variables: {', '.join(filter(None, summary['variables']))}",
+            f"Procedures: {', '.join(filter(None, summary['procedures']))}",
+            f"Parameters: {', '.join(sorted(strategy.parameters))}",
+        )))
+
+
+def _chunks(text: str) -> Iterator[str]:
+    """Split a long section into pieces of at most MAX_SNIPPET_TOKENS, between paragraphs where possible"""
+    piece = []
+    size = 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        tokens = estimate_tokens(paragraph)
+        if piece and size + tokens > MAX_SNIPPET_TOKENS:
+            yield "\n\n".join(piece)
+            piece, size = [], 0
+        piece.append(paragraph)
+        size += tokens
+    if piece:
+        yield "\n\n".join(piece)
+
+
+def doc_snippets(path: str) -> Iterator[Snippet]:
+    """Sections of a markdown document, titled by their heading path and split to MAX_SNIPPET_TOKENS"""
+    source = f"docs/{os.path.basename(path)}"
+    headings: List[str] = []
+    lines: List[str] = []
+    fenced = False
+
+    def section() -> Iterator[Snippet]:
+        text = "\n".join(lines).strip()
+        if text:
+            title = " > ".join(headings) or os.path.basename(path)
+            for number, chunk in enumerate(_chunks(text)):
+                yield Snippet(source, title if number == 0 else f"{title} ({number + 1})", chunk)
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.lstrip().startswith("```"):
+                fenced = not fenced
+            match = None if fenced else _HEADING.match(line)
+            if match is None:
+                lines.append(line)
+                continue
+            yield from section()
+            lines = []
+            level = len(match.group(1))
+            headings = headings[:level - 1] + [match.group(2)]
+    yield from section()
+
+
+def source_files(reference_directory: str = REFERENCE_DIRECTORY, docs_directory: str = DOCS_DIRECTORY) -> List[str]:
+    """The files an index is built from: reference strategies and markdown/text docs"""
+    files = [
+        os.path.join(reference_directory, name)
+        for name in sorted(os.listdir(reference_directory)) if name.endswith(".xml")
+    ]
+    if os.path.isdir(docs_directory):
+        files += [
+            os.path.join(docs_directory, name)
+            for name in sorted(os.listdir(docs_directory)) if name.endswith((".md", ".txt"))
+        ]
+    return files
+
+
+def fingerprint(files: Iterable[str]) -> bytes:
+    """Digest of the names, sizes and mtimes of `files`; an index is stale once it changes"""
+    digest = hashlib.sha256(str(INDEX_VERSION).encode())
+    for path in files:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+    return digest.digest()
+
+
+def write_index(path: str, snippets: List[Snippet], digest: bytes = b""):
+    """
+    Write the BM25 index of `snippets` to `path`: after the header come the sorted term table
+    (offsets, then UTF-8 terms), the postings of each term (offsets, document numbers, term
+    frequencies), the document lengths and the snippets as JSON, each behind its offsets
+    """
+    postings: Dict[str, Dict[int, int]] = {}
+    lengths = array("I")
+    for number, snippet in enumerate(snippets):
+        terms = tokenize(f"{snippet.title}\n{snippet.text}")
+        lengths.append(len(terms))
+        for term in terms:
+            documents = postings.setdefault(term, {})
+            documents[number] = documents.get(number, 0) + 1
+
+    terms = sorted(term.encode() for term in postings)
+    term_offsets, posting_offsets = array("I", [0]), array("I", [0])
+    posting_documents, posting_counts = array("I"), array("I")
+    for term in terms:
+        term_offsets.append(term_offsets[-1] + len(term))
+        for number, count in sorted(postings[term.decode()].items()):
+            posting_documents.append(number)
+            posting_counts.append(count)
+        posting_offsets.append(len(posting_documents))
+    texts = [json.dumps(snippet).encode() for snippet in snippets]
+    text_offsets = array("I", [0])
+    for text in texts:
+        text_offsets.append(text_offsets[-1] + len(text))
+
+    average = sum(lengths) / len(lengths) if lengths else 0.0
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, INDEX_VERSION, digest, len(snippets), len(terms), len(posting_documents), average))
+        # Arrays before the variable-length blobs keep every array 4-byte aligned
+        for block in (term_offsets, posting_offsets, posting_documents, posting_counts, lengths, text_offsets):
+            f.write(block.tobytes())
+        f.write(b"".join(terms))
+        f.write(b"".join(texts))
+    os.replace(temporary, path)
+
+
+class RetrievalIndex:
+    """Read-only BM25 index over a memory-mapped file written by write_index"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.fingerprint, self.documents, self.terms, postings, self.average_length = \
+            _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != INDEX_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {INDEX_VERSION} retrieval index")
+
+        view = memoryview(self._map)
+        position = _HEADER.size
+
+        def take(count: int) -> memoryview:
+            nonlocal position
+            block = view[position:position + 4 * count].cast("I")
+            position += 4 * count
+            return block
+
+        self._term_offsets = take(self.terms + 1)
+        self._posting_offsets = take(self.terms + 1)
+        self._posting_documents = take(postings)
+        self._posting_counts = take(postings)
+        self._lengths = take(self.documents)
+        self._text_offsets = take(self.documents + 1)
+        self._term_base = position
+        self._text_base = position + self._term_offsets[-1]
+
+    def _term(self, index: int) -> bytes:
+        return self._map[self._term_base + self._term_offsets[index]:self._term_base + self._term_offsets[index + 1]]
+
+    def _find(self, term: bytes) -> int:
+        """Position of `term` in the sorted term table, or -1"""
+        low, high = 0, self.terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.terms and self._term(low) == term else -1
+
+    def snippet(self, number: int) -> Snippet:
+        start, end = self._text_offsets[number], self._text_offsets[number + 1]
+        return Snippet(*json.loads(self._map[self._text_base + start:self._text_base + end]))
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """BM25 score of every document sharing a term with `query`"""
+        scores: Dict[int, float] = {}
+        average = self.average_length or 1.0
+        for term in set(tokenize(query)):
+            index = self._find(term.encode())
+            if index < 0:
+                continue
+            start, end = self._posting_offsets[index], self._posting_offsets[index + 1]
+            frequency = end - start
+            idf = math.log(1 + (self.documents - frequency + 0.5) / (frequency + 0.5))
+            for position in range(start, end):
+                number = self._posting_documents[position]
+                count = self._posting_counts[position]
+                norm = K1 * (1 - B + B * self._lengths[number] / average)
+                scores[number] = scores.get(number, 0.0) + idf * count * (K1 + 1) / (count + norm)
+        return scores
+
+    def search(self, query: str, k: int = 5, token_budget: int = 1000) -> List[Snippet]:
+        """The best `k` snippets for `query` that fit in `token_budget` tokens together, best first"""
+        scores = self.scores(query)
+        ranked = heapq.nlargest(len(scores), scores, key=scores.get)
+        found, used = [], 0
+        for number in ranked:
+            snippet = self.snippet(number)
+            if used + snippet.tokens > token_budget:
+                # A smaller snippet further down may still fit
+                continue
+            found.append(snippet)
+            used += snippet.tokens
+            if len(found) == k:
+                break
+        return found
+
+    def context(self, query: str, k: int = 5, token_budget: int = 1000) -> str:
+        """The snippets of search(), rendered for a prompt; empty if nothing matches"""
+        return "\n\n".join(snippet.render() for snippet in self.search(query, k, token_budget))
+
+    def close(self):
+        for block in (self._term_offsets, self._posting_offsets, self._posting_documents,
+                      self._posting_counts, self._lengths, self._text_offsets):
+            block.release()
+        self._map.close()
+
+
+def build_index(path: str, reference_directory: str = REFERENCE_DIRECTORY, docs_directory: str = DOCS_DIRECTORY,
+                files: Optional[List[str]] = None) -> int:
+    """Index the reference strategies and docs into `path`; returns the number of snippets"""
+    files = files if files is not None else source_files(reference_directory, docs_directory)
+    snippets = list(strategy_snippets(StrategyLibrary(reference_directory)))
+    for file in files:
+        if not file.endswith(".xml"):
+            snippets += doc_snippets(file)
+    write_index(path, snippets, fingerprint(files))
+    return len(snippets)
+
+
+def load_index(path: Optional[str] = None, reference_directory: str = REFERENCE_DIRECTORY,
+               docs_directory: str = DOCS_DIRECTORY) -> RetrievalIndex:
+    """
+    Map the index at `path` (RETRIEVAL_INDEX, by default under CACHE_DIRECTORY beside the library
+    index), building it first if it is missing, unreadable or older than its sources
+    """
+    if path is None:
+        # One index per pair of source directories, like the library index
+        sources = f"{os.path.abspath(reference_directory)}\0{os.path.abspath(docs_directory)}"
+        key = hashlib.sha256(sources.encode()).hexdigest()[:16]
+        path = os.getenv("RETRIEVAL_INDEX") or os.path.join(CACHE_DIRECTORY, f"retrieval_index-{key}")
+    files = source_files(reference_directory, docs_directory)
+    digest = fingerprint(files)
+    try:
+        index = RetrievalIndex(path)
+        if index.fingerprint == digest:
+            return index
+        index.close()
+    except (OSError, ValueError, struct.error):
+        pass
+    build_index(path, reference_directory, docs_directory, files)
+    return RetrievalIndex(path)
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def default_index() -> RetrievalIndex:
+    """The process-wide index over the reference strategies and docs, mapped on first use"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = load_index()
+        return _default_index
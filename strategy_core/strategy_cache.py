@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from .http_cache import ENCODINGS, compress
+from .strategy_generator import StrategySpec, render_strategy_bytes
+from .strategy_store import StrategyStore
+from .validator import validate_strategy
+
+
+class CachedStrategy:
+    """
+    A rendered strategy with optional gzip and brotli copies of the same payload, the digest
+    it is archived under when a strategy store is configured, and its response envelope by
+    content coding when the cache builds one
+    """
+    __slots__ = ("data", "gzipped", "brotli", "expires", "digest", "envelopes")
+
+    def __init__(self, data: bytes, gzipped: Optional[bytes], expires: Optional[float], brotli: Optional[bytes] = None,
+                 digest: Optional[str] = None, envelopes: Optional[Dict[Optional[str], bytes]] = None):
+        self.data = data
+        self.gzipped = gzipped
+        self.brotli = brotli
+        self.expires = expires
+        self.digest = digest
+        self.envelopes = envelopes or {}
+
+    def encoded(self, encoding: Optional[str]) -> Optional[bytes]:
+        """The payload in a content coding (None for identity), or None if no copy was made"""
+        if encoding is None:
+            return self.data
+        return self.brotli if encoding == "br" else self.gzipped
+
+    @property
+    def xml(self) -> str:
+        return self.data.decode()
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + len(self.gzipped or b"") + len(self.brotli or b"") + sum(map(len, self.envelopes.values()))
+
+
+class StrategyCache:
+    """
+    Bounded LRU cache of rendered strategy XML keyed on the normalized parameter tuple
+    With `validate`, each rendering is checked by the structural validator before it is cached;
+    with a `store`, each rendering is archived there for audit and re-download; with an `envelope`,
+    the response body it wraps each rendering in is cached (and compressed) alongside it
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl: Optional[float] = None, compress: bool = False,
+                 validate: bool = False, store: Optional[StrategyStore] = None,
+                 envelope: Optional[Callable[[bytes], bytes]] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.compress = compress
+        self.validate = validate
+        self.store = store
+        self.envelope = envelope
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, envelope: Optional[Callable[[bytes], bytes]] = None) -> "StrategyCache":
+        """Build a cache configured by the STRATEGY_CACHE_* environment variables and StrategyStore.from_env()"""
+        ttl = os.getenv("STRATEGY_CACHE_TTL")
+        return cls(
+            max_bytes=int(os.getenv("STRATEGY_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+            ttl=float(ttl) if ttl else None,
+            compress=os.getenv("STRATEGY_CACHE_GZIP", "1") == "1",
+            validate=os.getenv("STRATEGY_VALIDATE", "1") == "1",
+            store=StrategyStore.from_env(),
+            envelope=envelope
+        )
+
+    def cached(self, spec: StrategySpec) -> Optional[CachedStrategy]:
+        """The cached rendering of `spec`, counted as a hit, or None without rendering anything"""
+        key = spec.normalized()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.expires is None or entry.expires > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        return None
+
+    def get(self, spec: StrategySpec) -> CachedStrategy:
+        """Return the cached rendering of `spec`, rendering and storing it on a miss"""
+        entry = self.cached(spec)
+        if entry is not None:
+            return entry
+        key = spec.normalized()
+        now = time.monotonic()
+        with self._lock:
+            self.misses += 1
+
+        # Render outside the lock; a concurrent miss on the same key just renders twice
+        data = render_strategy_bytes(key)
+        if self.validate:
+            validation = validate_strategy(data)
+            if not validation.valid:
+                raise ValueError(f"Rendered strategy is invalid: {'; '.join(validation.errors)}")
+        gzipped = compress(data, "gzip") if self.compress else None
+        brotli = compress(data, "br") if self.compress and "br" in ENCODINGS else None
+        envelopes = {}
+        if self.envelope is not None:
+            envelopes[None] = self.envelope(data)
+            if self.compress:
+                envelopes.update((encoding, compress(envelopes[None], encoding)) for encoding in ENCODINGS)
+        digest = self.store.put(data) if self.store is not None else None
+        entry = CachedStrategy(data, gzipped, now + self.ttl if self.ttl is not None else None, brotli, digest, envelopes)
+        if entry.size > self.max_bytes:
+            return entry
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+                self.evictions += 1
+        return entry
+
+    def clear(self):
+        """Drop every cached entry, keeping the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current occupancy"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
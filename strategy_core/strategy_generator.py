@@ -0,0 +1,517 @@
+import hashlib
+import itertools
+import os
+import re
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import escape
+
+_SLOT_PATTERN = re.compile(r"\{(\w+)\}")
+_NEEDS_ESCAPE = re.compile(r'[&<>"]').search
+_ATTRIBUTE_ENTITIES = {'"': "&quot;"}
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _encode(value) -> bytes:
+    """Encode a slot value, escaping strings for XML text and attributes"""
+    if isinstance(value, str):
+        if _NEEDS_ESCAPE(value):
+            value = escape(value, _ATTRIBUTE_ENTITIES)
+        return value.encode()
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class Template:
+    """A block template compiled once into static byte segments and parameter slots"""
+
+    def __init__(self, source):
+        self.parts = []
+        self.slots = []
+        position = 0
+        for match in _SLOT_PATTERN.finditer(source):
+            self.parts.append(source[position:match.start()].encode())
+            self.slots.append((len(self.parts), match.group(1)))
+            self.parts.append(b"")
+            position = match.end()
+        self.parts.append(source[position:].encode())
+
+    def render(self, **params) -> bytes:
+        """Fill the parameter slots and join all segments in a single pass"""
+        parts = self.parts.copy()
+        for index, name in self.slots:
+            parts[index] = _encode(params[name])
+        return b"".join(parts)
+
+    def iter_render(self, **params) -> Iterator[bytes]:
+        """Yield the segments with the parameter slots filled, without joining them"""
+        names = dict(self.slots)
+        for index, part in enumerate(self.parts):
+            name = names.get(index)
+            yield part if name is None else _encode(params[name])
+
+    def bind(self, **params) -> "Template":
+        """Return a template with the given slots filled in and merged into the static segments"""
+        bound = Template("")
+        bound.parts, bound.slots = [], []
+        static = []
+        names = dict(self.slots)
+        for index, part in enumerate(self.parts):
+            name = names.get(index)
+            if name is None:
+                static.append(part)
+            elif name in params:
+                static.append(_encode(params[name]))
+            else:
+                bound.parts.append(b"".join(static))
+                bound.slots.append((len(bound.parts), name))
+                bound.parts.append(b"")
+                static = []
+        bound.parts.append(b"".join(static))
+        return bound
+
+
+XML_HEADER = '''<xml xmlns="http://www.w3.org/1999/xhtml" collection="false" is_dbot="true">
+'''
+
+VARIABLE_TEMPLATE = '''    <variable type="{type}" id="{id}" islocal="{islocal}" iscloud="{iscloud}">{name}</variable>
+'''
+
+TRADE_DEFINITION_TEMPLATE = '''
+  <block type="trade_definition" id="trade_def_main" x="0" y="0">
+    <statement name="TRADE_OPTIONS">
+      <block type="trade_definition_market" id="market_def" deletable="false" movable="false">
+        <field name="MARKET_LIST">{market}</field>
+        <field name="SUBMARKET_LIST">{submarket}</field>
+        <field name="SYMBOL_LIST">{symbol}</field>
+        <next>
+          <block type="trade_definition_tradetype" id="tradetype_def" deletable="false" movable="false">
+            <field name="TRADETYPECAT_LIST">callput</field>
+            <field name="TRADETYPE_LIST">callput</field>
+            <next>
+              <block type="trade_definition_contracttype" id="contracttype_def" deletable="false" movable="false">
+                <field name="TYPE_LIST">both</field>
+                <next>
+                  <block type="trade_definition_candleinterval" id="candleinterval_def" deletable="false" movable="false">
+                    <field name="CANDLEINTERVAL_LIST">60</field>
+                    <next>
+                      <block type="trade_definition_restartbuysell" id="restart_def" deletable="false" movable="false">
+                        <field name="TIME_MACHINE_ENABLED">FALSE</field>
+                        <next>
+                          <block type="trade_definition_restartonerror" id="error_def" deletable="false" movable="false">
+                            <field name="RESTARTONERROR">TRUE</field>
+                          </block>
+                        </next>
+                      </block>
+                    </next>
+                  </block>
+                </next>
+              </block>
+            </next>
+          </block>
+        </next>
+      </block>
+    </statement>
+    <statement name="SUBMARKET">
+      <block type="trade_definition_tradeoptions" id="tradeoptions_def">
+        <mutation has_first_barrier="false" has_second_barrier="false" has_prediction="false"></mutation>
+        <field name="DURATIONTYPE_LIST">t</field>
+        <value name="DURATION">
+          <shadow type="math_number">
+            <field name="NUM">{duration}</field>
+          </shadow>
+        </value>
+        <value name="AMOUNT">
+          <shadow type="math_number">
+            <field name="NUM">{stake}</field>
+          </shadow>
+        </value>
+      </block>
+    </statement>
+'''
+
+INITIALIZATION_TEMPLATE = '''
+    <statement name="INITIALIZATION">
+      <block type="variables_set" id="initial_stake_set">
+        <field name="VAR" id="initial_stake_var">Initial Stake</field>
+        <value name="VALUE">
+          <shadow type="math_number">
+            <field name="NUM">{initial_stake}</field>
+          </shadow>
+        </value>
+        <next>
+          <block type="variables_set" id="profit_threshold_set">
+            <field name="VAR" id="profit_threshold_var">Profit Threshold</field>
+            <value name="VALUE">
+              <shadow type="math_number">
+                <field name="NUM">{profit_threshold}</field>
+              </shadow>
+            </value>
+            <next>
+              <block type="variables_set" id="loss_threshold_set">
+                <field name="VAR" id="loss_threshold_var">Loss Threshold</field>
+                <value name="VALUE">
+                  <shadow type="math_number">
+                    <field name="NUM">{loss_threshold}</field>
+                  </shadow>
+                </value>
+              </block>
+            </next>
+          </block>
+        </next>
+      </block>
+    </statement>
+  </block>
+'''
+
+BEFORE_PURCHASE_TEMPLATE = '''
+  <block type="before_purchase" id="before_purchase" deletable="false">
+    <statement name="BEFOREPURCHASE_STACK">
+      <block type="purchase" id="purchase">
+        <field name="PURCHASE_LIST">{contract_type}</field>
+      </block>
+    </statement>
+  </block>
+'''
+
+TRADE_AGAIN_CONDITIONS = '''
+          <block type="logic_operation">
+            <field name="OP">AND</field>
+            <value name="A">
+              <block type="logic_compare">
+                <field name="OP">GT</field>
+                <value name="A">
+                  <block type="read_details">
+                    <field name="DETAIL_INDEX">4</field>
+                  </block>
+                </value>
+                <value name="B">
+                  <block type="math_number">
+                    <field name="NUM">-{loss_threshold}</field>
+                  </block>
+                </value>
+              </block>
+            </value>
+            <value name="B">
+              <block type="logic_compare">
+                <field name="OP">LT</field>
+                <value name="A">
+                  <block type="read_details">
+                    <field name="DETAIL_INDEX">4</field>
+                  </block>
+                </value>
+                <value name="B">
+                  <block type="math_number">
+                    <field name="NUM">{profit_threshold}</field>
+                  </block>
+                </value>
+              </block>
+            </value>
+          </block>
+'''
+
+AFTER_PURCHASE_TEMPLATE = '''
+  <block type="after_purchase" id="after_purchase">
+    <statement name="AFTERPURCHASE_STACK">
+      <block type="controls_if" id="trade_again_condition">
+        <mutation else="1"></mutation>
+        <value name="IF0">
+          {conditions}
+        </value>
+        <statement name="DO0">
+          <block type="trade_again" id="trade_again"></block>
+        </statement>
+      </block>
+    </statement>
+  </block>
+'''.replace("{conditions}", TRADE_AGAIN_CONDITIONS)
+
+# Compiled once at import; the whole document is rendered with a single join
+VARIABLE = Template(VARIABLE_TEMPLATE)
+TRADE_DEFINITION = Template(TRADE_DEFINITION_TEMPLATE)
+INITIALIZATION = Template(INITIALIZATION_TEMPLATE)
+BEFORE_PURCHASE = Template(BEFORE_PURCHASE_TEMPLATE)
+AFTER_PURCHASE = Template(AFTER_PURCHASE_TEMPLATE)
+STRATEGY = Template(
+    XML_HEADER
+    + "{variables}"
+    + TRADE_DEFINITION_TEMPLATE
+    + INITIALIZATION_TEMPLATE
+    + BEFORE_PURCHASE_TEMPLATE
+    + AFTER_PURCHASE_TEMPLATE
+    + "</xml>"
+)
+
+
+def make_variable(var_id, var_name, var_type="", is_local=False, is_cloud=False) -> Dict[str, str]:
+    """Build a variable definition for the variables section"""
+    return {
+        "type": var_type,
+        "id": var_id,
+        "name": var_name,
+        "islocal": str(is_local).lower(),
+        "iscloud": str(is_cloud).lower()
+    }
+
+
+def render_variables_section(variables: Iterable[Dict[str, str]]) -> bytes:
+    """Render the variables section of the XML as bytes"""
+    return b"".join(
+        [b"  <variables>\n"]
+        + [VARIABLE.render(**var) for var in variables]
+        + [b"  </variables>\n"]
+    )
+
+
+STANDARD_VARIABLES = (
+    make_variable("initial_stake_var", "Initial Stake"),
+    make_variable("profit_threshold_var", "Profit Threshold"),
+    make_variable("loss_threshold_var", "Loss Threshold"),
+    make_variable("total_profit_var", "Total Profit"),
+)
+STANDARD_VARIABLES_SECTION = render_variables_section(STANDARD_VARIABLES)
+# Changes whenever the generated strategy template does, for HTTP entity tags
+TEMPLATE_DIGEST = hashlib.sha256(b"".join(STRATEGY.parts) + STANDARD_VARIABLES_SECTION).hexdigest()
+
+
+class StrategySpec(NamedTuple):
+    """Immutable parameter set a strategy is rendered from"""
+    duration: Any = 1
+    stake: Any = 1
+    initial_stake: Any = 1
+    profit_threshold: Any = 1000
+    loss_threshold: Any = 500
+    market: str = "synthetic_index"
+    submarket: str = "random_index"
+    symbol: str = "1HZ10V"
+    # Name of a reference strategy to customize instead of the generated one, and
+    # (strategy_value, value) pairs for its other inputs such as size or max_stake
+    reference: Optional[str] = None
+    options: Tuple[Tuple[str, Any], ...] = ()
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any]) -> "StrategySpec":
+        """
+        Build a spec from a parameter dict such as StrategyParser.parse_prompt returns
+        For a reference strategy, fields missing from `params` are None: the strategy keeps its own
+        stake, duration, thresholds and market for them
+        """
+        fields = {field: params[field] for field in cls._fields if field in params}
+        if params.get("reference") is not None:
+            fields = {**dict.fromkeys(cls._fields[:-2]), **fields}
+            if fields["initial_stake"] is None:
+                fields["initial_stake"] = fields["stake"]
+        if isinstance(fields.get("options"), dict):
+            fields["options"] = tuple(sorted(fields["options"].items()))
+        return cls(**fields)
+
+    def normalized(self) -> "StrategySpec":
+        """Return an equivalent spec with integral floats as ints and strings stripped, for use as a cache key"""
+        return StrategySpec(*(_normalize(value) for value in self[:-1]), tuple(
+            (name, _normalize(value)) for name, value in self.options
+        ))
+
+
+def _normalize(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def render_strategy_bytes(spec: StrategySpec, variables_section: bytes = STANDARD_VARIABLES_SECTION) -> bytes:
+    """Render a strategy spec as UTF-8 XML; pure, so safe to call from any thread"""
+    if spec.reference is not None:
+        from .strategy_library import default_library
+        return default_library().template(spec.reference).render_spec(spec)
+    return STRATEGY.render(variables=variables_section, contract_type="CALL", **spec._asdict())
+
+
+def _coalesce(parts: Iterable[bytes], chunk_size: int) -> Iterator[bytes]:
+    """Join small segments into chunks of about `chunk_size` bytes; larger segments pass through uncopied"""
+    pending = []
+    size = 0
+    for part in parts:
+        if len(part) >= chunk_size:
+            if pending:
+                yield b"".join(pending)
+                pending = []
+                size = 0
+            yield part
+            continue
+        pending.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield b"".join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield b"".join(pending)
+
+
+def iter_strategy_bytes(spec: StrategySpec, variables_section: bytes = STANDARD_VARIABLES_SECTION,
+                        chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Render a strategy spec as a stream of UTF-8 chunks, never holding the whole document"""
+    if spec.reference is not None:
+        from .strategy_library import default_library
+        parts = default_library().template(spec.reference).iter_render_spec(spec)
+    else:
+        parts = STRATEGY.iter_render(variables=variables_section, contract_type="CALL", **spec._asdict())
+    return _coalesce(parts, chunk_size)
+
+
+def render_strategy(spec: StrategySpec, variables_section: bytes = STANDARD_VARIABLES_SECTION) -> str:
+    """Render a strategy spec as an XML string"""
+    return render_strategy_bytes(spec, variables_section).decode()
+
+
+def sweep_strategies(base: StrategySpec = StrategySpec(), variables_section: bytes = STANDARD_VARIABLES_SECTION,
+                     **ranges: Iterable[Any]) -> Iterator[Tuple[StrategySpec, bytes]]:
+    """
+    Lazily render every combination of the given field values, e.g. stake=[1, 2], duration=range(1, 6)
+    Fields not swept keep their value from `base` and are rendered into the template only once
+    """
+    unknown = set(ranges) - set(StrategySpec._fields)
+    if unknown:
+        raise ValueError(f"Unknown strategy fields: {', '.join(sorted(unknown))}")
+
+    if base.reference is not None or "reference" in ranges:
+        # Reference strategies are spliced per spec, there is no generated template to bind
+        for values in itertools.product(*ranges.values()):
+            spec = base._replace(**dict(zip(ranges, values)))
+            yield spec, render_strategy_bytes(spec)
+        return
+
+    fixed = {field: value for field, value in base._asdict().items() if field not in ranges}
+    template = STRATEGY.bind(variables=variables_section, contract_type="CALL", **fixed)
+    fields = list(ranges)
+    for values in itertools.product(*ranges.values()):
+        varying = dict(zip(fields, values))
+        yield base._replace(**varying), template.render(**varying)
+
+
+def sweep_filename(spec: StrategySpec) -> str:
+    """File name identifying a strategy within a sweep"""
+    prefix = f"{spec.reference}_" if spec.reference is not None else ""
+    return (f"{prefix}{spec.symbol}_duration-{spec.duration}_stake-{spec.stake}_initial-{spec.initial_stake}"
+            f"_profit-{spec.profit_threshold}_loss-{spec.loss_threshold}.xml")
+
+
+def write_sweep_zip(path: str, sweep: Iterable[Tuple[StrategySpec, bytes]], compresslevel: int = 6) -> int:
+    """Stream a sweep into a zip archive one strategy at a time; returns the number written"""
+    count = 0
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+        for spec, xml in sweep:
+            archive.writestr(sweep_filename(spec), xml)
+            count += 1
+    return count
+
+
+def write_sweep_directory(directory: str, sweep: Iterable[Tuple[StrategySpec, bytes]]) -> int:
+    """Write each strategy of a sweep to its own file; returns the number written"""
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for spec, xml in sweep:
+        with open(os.path.join(directory, sweep_filename(spec)), "wb") as f:
+            f.write(xml)
+        count += 1
+    return count
+
+
+class StrategyGenerator:
+    def __init__(self):
+        self.variables = {var["id"]: dict(var) for var in STANDARD_VARIABLES}
+        self._variables_section = STANDARD_VARIABLES_SECTION
+
+    def add_variable(self, var_id, var_name, var_type="", is_local=False, is_cloud=False):
+        """Add a variable definition to the strategy"""
+        variable = make_variable(var_id, var_name, var_type, is_local, is_cloud)
+        if self.variables.get(var_id) != variable:
+            self.variables[var_id] = variable
+            self._variables_section = None
+
+    def render_variables_section(self) -> bytes:
+        """Render the variables section of the XML as bytes, reusing it until a variable changes"""
+        if self._variables_section is None:
+            self._variables_section = render_variables_section(self.variables.values())
+        return self._variables_section
+
+    def generate_variables_section(self):
+        """Generate the variables section of the XML"""
+        return self.render_variables_section().decode()
+
+    def generate_trade_definition(self, market="synthetic_index", submarket="random_index", symbol="1HZ10V", duration=1, stake=1):
+        """Generate the trade definition section with required hierarchy and trade options"""
+        return TRADE_DEFINITION.render(
+            market=market, submarket=submarket, symbol=symbol, duration=duration, stake=stake
+        ).decode()
+
+    def generate_initialization(self, initial_stake=1, profit_threshold=1000, loss_threshold=500):
+        """Generate initialization block with standard variables"""
+        return INITIALIZATION.render(
+            initial_stake=initial_stake, profit_threshold=profit_threshold, loss_threshold=loss_threshold
+        ).decode()
+
+    def generate_before_purchase(self, contract_type="CALL"):
+        """Generate the before purchase block with standard structure"""
+        return BEFORE_PURCHASE.render(contract_type=contract_type).decode()
+
+    def generate_after_purchase(self, profit_threshold=1000, loss_threshold=500):
+        """Generate the after purchase block with trade again logic including profit and loss thresholds"""
+        return AFTER_PURCHASE.render(profit_threshold=profit_threshold, loss_threshold=loss_threshold).decode()
+
+    def generate_strategy_bytes(self, duration=1, stake=1, initial_stake=1, profit_threshold=1000, loss_threshold=500,
+                                reference=None, options=None):
+        """
+        Render the complete strategy XML as UTF-8 bytes
+        With `reference`, customize that reference strategy instead, setting its other inputs from `options`
+        """
+        spec = StrategySpec(
+            duration=duration,
+            stake=stake,
+            initial_stake=initial_stake,
+            profit_threshold=profit_threshold,
+            loss_threshold=loss_threshold,
+            reference=reference,
+            options=tuple(sorted((options or {}).items()))
+        )
+        return render_strategy_bytes(spec, self.render_variables_section())
+
+    def generate_strategy(self, duration=1, stake=1, initial_stake=1, profit_threshold=1000, loss_threshold=500,
+                          reference=None, options=None):
+        """Generate complete strategy XML with proper structure"""
+        return self.generate_strategy_bytes(
+            duration=duration,
+            stake=stake,
+            initial_stake=initial_stake,
+            profit_threshold=profit_threshold,
+            loss_threshold=loss_threshold,
+            reference=reference,
+            options=options
+        ).decode()
+
+    def sweep(self, base: StrategySpec = StrategySpec(), **ranges: Iterable[Any]) -> Iterator[Tuple[StrategySpec, bytes]]:
+        """Lazily render every combination of the given field values with this generator's variables"""
+        return sweep_strategies(base, self.render_variables_section(), **ranges)
+
+def example_usage():
+    """Example of how to use the StrategyGenerator"""
+    generator = StrategyGenerator()
+
+    # Generate a basic strategy with custom parameters
+    strategy_xml = generator.generate_strategy(
+        duration=5,          # 5 tick duration
+        stake=10,           # Initial stake amount
+        initial_stake=10,   # Starting stake
+        profit_threshold=100,  # Stop at 100 profit
+        loss_threshold=50    # Stop at 50 loss
+    )
+
+    # Save to file
+    with open("generated_strategy.xml", "w") as f:
+        f.write(strategy_xml)
+
+if __name__ == "__main__":
+    example_usage()
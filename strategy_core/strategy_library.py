@@ -0,0 +1,381 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+REFERENCE_DIRECTORY = os.getenv(
+    "REFERENCE_STRATEGIES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "reference_strategies")
+)
+INDEX_VERSION = 2
+# Where the parsed index is kept between runs, outside the source tree
+CACHE_DIRECTORY = os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "strategy_core"
+)
+
+_PARAMETER_TAG = re.compile(rb'<(value|field)\b[^>]*\bstrategy_value="([^"]+)"[^>]*>')
+_MARKET_FIELD = re.compile(rb'<field name="(MARKET_LIST|SUBMARKET_LIST|SYMBOL_LIST)"[^>]*>([^<]*)</field>')
+_VALUE_TAG = re.compile(rb'<(/?)value\b[^>]*?(/?)>')
+_FIELD_TEXT = re.compile(rb'<field\b[^>]*>([^<]*)</field>')
+_MARKET_KEYS = {b"MARKET_LIST": "market", b"SUBMARKET_LIST": "submarket", b"SYMBOL_LIST": "symbol"}
+
+# StrategySpec fields and the reference strategy parameters they set
+SPEC_PARAMETERS = (
+    ("initial_stake", "stake"),
+    ("duration", "duration"),
+    ("profit_threshold", "profit"),
+    ("loss_threshold", "loss"),
+    ("market", "market"),
+    ("submarket", "submarket"),
+    ("symbol", "symbol"),
+)
+
+
+class Parameter(NamedTuple):
+    """A configurable input of a reference strategy, marked with a strategy_value attribute"""
+    name: str
+    variable: Optional[str]
+    block_id: str
+    block_type: str
+    default: Optional[str]
+
+
+class ReferenceStrategy(NamedTuple):
+    """Index entry for one reference strategy file"""
+    name: str
+    trade_type: Tuple[str, str]
+    market: Tuple[str, str, str]
+    variables: Tuple[Tuple[str, str], ...]
+    procedures: Tuple[Tuple[str, str], ...]
+    parameters: Dict[str, Parameter]
+    xml: bytes
+
+    def summary(self) -> Dict[str, Any]:
+        """Describe the strategy without its XML"""
+        return {
+            "name": self.name,
+            "trade_type": list(self.trade_type),
+            "market": list(self.market),
+            "variables": [name for _, name in self.variables],
+            "procedures": [name for _, name in self.procedures],
+            "parameters": {name: param._asdict() for name, param in self.parameters.items()}
+        }
+
+
+def _encode_input(value, whole_value: bool) -> bytes:
+    """Encode a parameter as field text, or as a literal block replacing a whole <value>"""
+    if isinstance(value, bool):
+        text = "TRUE" if value else "FALSE"
+        block_type, field = "logic_boolean", "BOOL"
+    else:
+        text = escape(str(value))
+        block_type, field = "math_number", "NUM"
+    if whole_value:
+        text = f'<block type="{block_type}"><field name="{field}">{text}</field></block>'
+    return text.encode()
+
+
+class ReferenceTemplate:
+    """
+    A reference strategy split once into static byte segments around its parameter inputs,
+    so a customized copy is a splice of precomputed segments with no XML parsing
+    """
+
+    def __init__(self, data: bytes):
+        self.digest = hashlib.sha256(data).hexdigest()
+        slots = []
+        for match in _PARAMETER_TAG.finditer(data):
+            start = match.end()
+            key = match.group(2).decode()
+            if match.group(1) == b"field":
+                slots.append((start, data.index(b"</field>", start), key, False))
+                continue
+            end = self._closing_value(data, start)
+            literals = list(_FIELD_TEXT.finditer(data, start, end))
+            if len(literals) == 1:
+                # A single literal input (math_number, logic_boolean): replace just its text
+                slots.append((literals[0].start(1), literals[0].end(1), key, False))
+            else:
+                slots.append((start, end, key, True))
+        for match in _MARKET_FIELD.finditer(data):
+            slots.append((match.start(2), match.end(2), _MARKET_KEYS[match.group(1)], False))
+
+        self.parts = []
+        self.slots = []
+        position = 0
+        for start, end, key, whole_value in sorted(slots):
+            self.parts.append(data[position:start])
+            self.slots.append((len(self.parts), key, whole_value))
+            self.parts.append(data[start:end])
+            position = end
+        self.parts.append(data[position:])
+
+    @staticmethod
+    def _closing_value(data: bytes, start: int) -> int:
+        depth = 0
+        for match in _VALUE_TAG.finditer(data, start):
+            if match.group(2):
+                continue
+            if match.group(1):
+                if depth == 0:
+                    return match.start()
+                depth -= 1
+            else:
+                depth += 1
+        raise ValueError("Unbalanced <value> element")
+
+    def keys(self) -> List[str]:
+        return sorted({key for _, key, _ in self.slots})
+
+    def render(self, values: Dict[str, Any]) -> bytes:
+        """Splice the given parameter values into the strategy; others keep their original input"""
+        parts = self.parts.copy()
+        for index, key, whole_value in self.slots:
+            if key in values:
+                parts[index] = _encode_input(values[key], whole_value)
+        return b"".join(parts)
+
+    def iter_render(self, values: Dict[str, Any]) -> Iterator[bytes]:
+        """Yield the segments of render(values) without joining them"""
+        slots = {index: key for index, key, _ in self.slots if key in values}
+        whole = {index: whole_value for index, _, whole_value in self.slots}
+        for index, part in enumerate(self.parts):
+            key = slots.get(index)
+            yield part if key is None else _encode_input(values[key], whole[index])
+
+    def render_spec(self, spec) -> bytes:
+        """Render with the stake, duration, thresholds and market of a StrategySpec plus its options"""
+        return self.render(spec_values(spec))
+
+    def iter_render_spec(self, spec) -> Iterator[bytes]:
+        """Streaming variant of render_spec"""
+        return self.iter_render(spec_values(spec))
+
+
+def spec_values(spec) -> Dict[str, Any]:
+    """
+    Reference parameter values set by a StrategySpec: the stake, duration, thresholds and market
+    it was given (None leaves the strategy's own) and its options
+    """
+    values = {key: getattr(spec, field) for field, key in SPEC_PARAMETERS if getattr(spec, field) is not None}
+    values.update(spec.options)
+    return values
+
+
+def _local(tag: str) -> str:
+    """Strip the namespace; reference files use both the XHTML and Blockly namespaces"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _field(element, name: str) -> Optional[str]:
+    for child in element:
+        if _local(child.tag) == "field" and child.get("name") == name:
+            return child.text
+    return None
+
+
+def _find_field(root, name: str) -> Optional[str]:
+    for element in root.iter():
+        if _local(element.tag) == "field" and element.get("name") == name:
+            return element.text
+    return None
+
+
+def _default(element) -> Tuple[str, Optional[str]]:
+    """Type and literal value of the input feeding a <value> or <field> parameter"""
+    if _local(element.tag) == "field":
+        return "field", element.text
+    inputs = [child for child in element if _local(child.tag) in ("block", "shadow")]
+    # A real block overrides its shadow
+    inputs.sort(key=lambda child: _local(child.tag) != "block")
+    if not inputs:
+        return "", None
+    block = inputs[0]
+    literal = next((child.text for child in block if _local(child.tag) == "field"), None)
+    if block.get("type") == "text_prompt_ext":
+        literal = None
+    return block.get("type"), literal
+
+
+def parse_reference(name: str, data: bytes) -> ReferenceStrategy:
+    """Parse a reference strategy file into its index entry"""
+    root = ET.fromstring(data)
+    parents = {child: parent for parent in root.iter() for child in parent}
+
+    variables = tuple(
+        (element.get("id"), element.text)
+        for element in root.iter() if _local(element.tag) == "variable"
+    )
+    procedures = tuple(
+        (element.get("id"), _field(element, "NAME"))
+        for element in root.iter()
+        if _local(element.tag) == "block" and element.get("type", "").startswith("procedures_def")
+    )
+
+    parameters = {}
+    for element in root.iter():
+        key = element.get("strategy_value")
+        if key is None:
+            continue
+        block = parents[element]
+        block_type, default = _default(element)
+        parameters[key] = Parameter(
+            name=key,
+            variable=_field(block, "VAR"),
+            block_id=block.get("id"),
+            block_type=block_type,
+            default=default
+        )
+
+    return ReferenceStrategy(
+        name=name,
+        trade_type=(_find_field(root, "TRADETYPECAT_LIST"), _find_field(root, "TRADETYPE_LIST")),
+        market=(_find_field(root, "MARKET_LIST"), _find_field(root, "SUBMARKET_LIST"), _find_field(root, "SYMBOL_LIST")),
+        variables=variables,
+        procedures=procedures,
+        parameters=parameters,
+        xml=data
+    )
+
+
+def _plain(strategy: ReferenceStrategy) -> Dict[str, Any]:
+    """An index entry as JSON data; the XML is read from its file"""
+    return {
+        "name": strategy.name,
+        "trade_type": list(strategy.trade_type),
+        "market": list(strategy.market),
+        "variables": [list(variable) for variable in strategy.variables],
+        "procedures": [list(procedure) for procedure in strategy.procedures],
+        "parameters": [list(parameter) for parameter in strategy.parameters.values()]
+    }
+
+
+def _from_plain(plain: Dict[str, Any], data: bytes) -> ReferenceStrategy:
+    return ReferenceStrategy(
+        name=plain["name"],
+        trade_type=tuple(plain["trade_type"]),
+        market=tuple(plain["market"]),
+        variables=tuple(map(tuple, plain["variables"])),
+        procedures=tuple(map(tuple, plain["procedures"])),
+        parameters={parameter[0]: Parameter(*parameter) for parameter in plain["parameters"]},
+        xml=data
+    )
+
+
+class StrategyLibrary:
+    """
+    In-memory index of the reference strategies, parsed once and cached on disk as JSON, by
+    default under CACHE_DIRECTORY. The cached index is reused per file while its mtime and size
+    match, or failing that, while its content hash matches
+    """
+
+    def __init__(self, directory: str = REFERENCE_DIRECTORY, index_path: Optional[str] = None):
+        self.directory = directory
+        # One index per reference directory, so checkouts sharing a cache directory do not overwrite each other's
+        key = hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()[:16]
+        self.index_path = index_path or os.getenv("STRATEGY_LIBRARY_INDEX") or os.path.join(
+            CACHE_DIRECTORY, f"library_index-{key}.json"
+        )
+        self.strategies: Dict[str, ReferenceStrategy] = {}
+        self.templates: Dict[str, ReferenceTemplate] = {}
+        self.parsed = 0
+        self.load()
+
+    def _read_index(self) -> Dict[str, Any]:
+        try:
+            with open(self.index_path, "rb") as f:
+                index = json.load(f)
+            if index.get("version") == INDEX_VERSION:
+                return index["files"]
+        except Exception:
+            pass
+        return {}
+
+    def _write_index(self, files: Dict[str, Any]):
+        temporary = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            with open(temporary, "w") as f:
+                json.dump({"version": INDEX_VERSION, "files": files}, f)
+            os.replace(temporary, self.index_path)
+        except OSError as e:
+            print(f"Could not write strategy library index: {e}")
+
+    def load(self):
+        """(Re)build the index, parsing only files that changed since it was cached"""
+        cached = self._read_index()
+        files = {}
+        strategies = []
+        self.parsed = 0
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".xml"):
+                continue
+            with open(os.path.join(self.directory, filename), "rb") as f:
+                stat = os.fstat(f.fileno())
+                data = f.read()
+            version = [stat.st_mtime_ns, stat.st_size]
+            entry = cached.get(filename)
+            if entry and entry.get("stat") == version:
+                digest = entry["digest"]
+            else:
+                digest = hashlib.sha256(data).hexdigest()
+            strategy = None
+            if entry and entry.get("digest") == digest:
+                try:
+                    strategy = _from_plain(entry["strategy"], data)
+                except (KeyError, TypeError, ValueError):
+                    pass
+            if strategy is None:
+                strategy = parse_reference(filename[:-len(".xml")], data)
+                self.parsed += 1
+            files[filename] = {"stat": version, "digest": digest, "strategy": _plain(strategy)}
+            strategies.append(strategy)
+
+        if files != cached:
+            self._write_index(files)
+        self.strategies = {strategy.name: strategy for strategy in strategies}
+        self.templates = {name: ReferenceTemplate(strategy.xml) for name, strategy in self.strategies.items()}
+
+    def get(self, name: str) -> ReferenceStrategy:
+        """Look up a reference strategy by name; raises KeyError if unknown"""
+        return self.strategies[name]
+
+    def template(self, name: str) -> ReferenceTemplate:
+        """Splice template of a reference strategy; raises KeyError if unknown"""
+        return self.templates[name]
+
+    def names(self) -> List[str]:
+        return list(self.strategies)
+
+    def check_options(self, name: str, options: Dict[str, Any]):
+        """
+        Raise ValueError for options a reference strategy has no input for, or whose values are
+        not numbers, strings or booleans; raises KeyError if the strategy is unknown
+        """
+        unknown = sorted(set(options) - set(self.templates[name].keys()))
+        if unknown:
+            raise ValueError(f"Unknown options for {name}: {', '.join(unknown)}")
+        invalid = sorted(
+            key for key, value in options.items()
+            if not isinstance(value, (bool, int, float, str)) or isinstance(value, float) and not math.isfinite(value)
+        )
+        if invalid:
+            raise ValueError(f"Options must be finite numbers, strings or booleans: {', '.join(invalid)}")
+
+
+_default_library = None
+_default_library_lock = threading.Lock()
+
+
+def default_library() -> StrategyLibrary:
+    """The process-wide library over REFERENCE_DIRECTORY, loaded on first use"""
+    global _default_library
+    with _default_library_lock:
+        if _default_library is None:
+            _default_library = StrategyLibrary()
+        return _default_library
@@ -0,0 +1,388 @@
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import logging
+import math
+import os
+from dotenv import load_dotenv
+from .coalescing import MicroBatcher, SingleFlight
+from .fast_extractor import extract_parameters
+from .incremental_json import JSONScanner, find_json
+from .llm_client import AsyncResilientClient, ResiliencePolicy, ResilientClient
+from .metrics import METRICS
+from .prompt_cache import PromptCache, normalize_prompt
+
+load_dotenv()
+
+# Raw LLM replies, for debugging extraction, and LLM failures the rule-based extractor covered
+logger = logging.getLogger(__name__)
+
+# Default parameters
+DEFAULT_PARAMETERS = {
+    "duration": 1,
+    "stake": 1,
+    "initial_stake": 1,
+    "profit_threshold": 1000,
+    "loss_threshold": 500,
+    "market": "synthetic_index",
+    "submarket": "random_index",
+    "symbol": "1HZ10V"
+}
+
+
+def defaults_for(reference: Optional[str]) -> Dict[str, Any]:
+    """Parameters a request starts from: the defaults for a generated strategy, none for a reference one"""
+    return DEFAULT_PARAMETERS if reference is None else {}
+
+# Keys the LLM is asked for, with example values
+PARAMETER_EXAMPLE = """{
+                        "duration": 1,
+                        "initial_stake": 1,
+                        "profit_threshold": 1000,
+                        "loss_threshold": 500,
+                        "market": "synthetic_index",
+                        "submarket": "random_index",
+                        "symbol": "1HZ10V"
+                    }"""
+
+class StrategyParser:
+    def __init__(self, client=None, cache=None, fast_path=True, async_client=None, coalesce=True,
+                 batch_window=None, max_batch=None, stream=None, policy=None, retrieval=None, context_budget=None,
+                 context_snippets=None):
+        """
+        Initialize Anthropic client and the prompt cache
+        Pass `client` to substitute a stub for the Anthropic API and `cache` to
+        override the PromptCache configured from the environment
+        With `fast_path`, prompts the rule-based extractor fully understands skip the LLM
+        `async_client` is used by parse_prompt_async; without clients, pooled Anthropic clients
+        are built on the first LLM call
+        With `coalesce`, concurrent equivalent prompts share one LLM call
+        A `batch_window` in seconds (LLM_BATCH_WINDOW, 0 disables) packs up to `max_batch`
+        (LLM_MAX_BATCH) distinct prompts arriving within it into one LLM call
+        With `stream` (LLM_STREAM=1), replies are streamed and parsed as they arrive, returning
+        as soon as the JSON closes
+        Both clients are wrapped with the deadline, retries, circuit breaker and hedging of `policy`
+        (ResiliencePolicy.from_env() by default); when the LLM fails, prompts fall back to the
+        rule-based extractor
+        With a `context_budget` in tokens (LLM_CONTEXT_TOKENS, 0 disables), requests carry up to
+        `context_snippets` (LLM_CONTEXT_SNIPPETS) reference strategy and doc snippets relevant to
+        the prompt, found in `retrieval` (the default RetrievalIndex unless given)
+        """
+        policy = policy or ResiliencePolicy.from_env()
+        self.client = ResilientClient(client, policy)
+        self.async_client = AsyncResilientClient(async_client, policy)
+        self.fallbacks = 0
+        self.cache = cache if cache is not None else PromptCache.from_env()
+        self.fast_path = fast_path
+        self.stream = os.getenv("LLM_STREAM", "0") == "1" if stream is None else stream
+        self.flights = SingleFlight() if coalesce else None
+        batch_window = float(os.getenv("LLM_BATCH_WINDOW", 0)) if batch_window is None else batch_window
+        self.batcher = MicroBatcher(
+            self.request_parameters,
+            self.request_batch,
+            window=batch_window,
+            max_size=max_batch or int(os.getenv("LLM_MAX_BATCH", 8)),
+            send_one_async=self.request_parameters_async,
+            send_many_async=self.request_batch_async
+        ) if batch_window > 0 else None
+        self.context_budget = int(os.getenv("LLM_CONTEXT_TOKENS", 0)) if context_budget is None else context_budget
+        self.context_snippets = context_snippets or int(os.getenv("LLM_CONTEXT_SNIPPETS", 5))
+        if self.context_budget > 0 and retrieval is None:
+            from .retrieval import default_index
+            retrieval = default_index()
+        self.retrieval = retrieval if self.context_budget > 0 else None
+
+    def context(self, query: str) -> str:
+        """Reference material relevant to `query` to lead the request with, or nothing"""
+        if self.retrieval is None:
+            return ""
+        with METRICS.stage("retrieve"):
+            context = self.retrieval.context(query, self.context_snippets, self.context_budget)
+        return f"Reference material that may help:\n{context}\n\n" if context else ""
+
+    def build_request(self, prompt: str) -> Dict[str, Any]:
+        """Build the messages.create arguments asking for the parameters in the prompt"""
+        return dict(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=1000,
+            messages=[{
+                "role": "user",
+                "content": f"""{self.context(prompt)}What are the trading parameters in this sentence? '{prompt}'
+                Give the output in json format (exclude those keys which are not found):
+                    {PARAMETER_EXAMPLE}
+                Do not reply anything other than json. """
+            }]
+        )
+
+    def build_batch_request(self, prompts: List[str]) -> Dict[str, Any]:
+        """Build the messages.create arguments asking for the parameters in each of several prompts"""
+        sentences = "\n".join(f"                {number}. '{prompt}'" for number, prompt in enumerate(prompts, 1))
+        return dict(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=1000 * len(prompts),
+            messages=[{
+                "role": "user",
+                "content": f"""{self.context(" ".join(prompts))}What are the trading parameters in each of these sentences?
+{sentences}
+                Give the output as a json array with one object per sentence, in the same order,
+                each in this format (exclude those keys which are not found in that sentence):
+                    {PARAMETER_EXAMPLE}
+                Do not reply anything other than json. """
+            }]
+        )
+
+    def build_refine_request(self, message: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the messages.create arguments asking which parameters a follow-up message changes"""
+        current = {key: params[key] for key in DEFAULT_PARAMETERS if key in params}
+        return dict(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=1000,
+            messages=[{
+                "role": "user",
+                "content": f"""{self.context(message)}A trading strategy has these parameters: {json.dumps(current)}
+                Which parameters does this change request set, and to what? '{message}'
+                Give the output in json format with only the keys it changes, out of:
+                    {PARAMETER_EXAMPLE}
+                Do not reply anything other than json. """
+            }]
+        )
+
+    def read_response(self, response) -> Dict[str, Any]:
+        """Parse the JSON object in the LLM response, ignoring any prose around it"""
+        METRICS.count_tokens(getattr(response, "usage", None))
+        logger.debug("LLM reply: %s", response.content[0].text)
+        return find_json(response.content[0].text, "{")
+
+    def check_batch(self, extracted, count: int) -> List[Dict[str, Any]]:
+        """Check a batch reply holds one parameter object per prompt"""
+        if not isinstance(extracted, list) or len(extracted) != count:
+            raise ValueError(f"Expected a JSON array of {count} objects")
+        if not all(isinstance(item, dict) for item in extracted):
+            raise ValueError("Expected a JSON array of objects")
+        return extracted
+
+    def read_batch_response(self, response, count: int) -> List[Dict[str, Any]]:
+        """Parse the JSON array of `count` objects in the LLM response to a batch request"""
+        METRICS.count_tokens(getattr(response, "usage", None))
+        logger.debug("LLM reply: %s", response.content[0].text)
+        return self.check_batch(find_json(response.content[0].text, "["), count)
+
+    def stream_json(self, request: Dict[str, Any], opening: str = "{"):
+        """
+        Stream the LLM reply and parse its JSON object (or array) as soon as it closes, leaving the
+        stream early instead of waiting for the rest of the completion
+        """
+        scanner = JSONScanner(opening)
+        with self.client.messages.stream(**request) as stream:
+            for text in stream.text_stream:
+                extracted = scanner.feed(text)
+                if extracted is not None:
+                    # Output tokens so far: the rest are not generated once the stream closes
+                    METRICS.count_tokens(stream.current_message_snapshot.usage)
+                    logger.debug("LLM reply: %s", scanner.buffer)
+                    return extracted
+        logger.debug("LLM reply: %s", scanner.buffer)
+        raise ValueError("No JSON value in the LLM response")
+
+    async def stream_json_async(self, request: Dict[str, Any], opening: str = "{"):
+        """Asynchronous variant of stream_json"""
+        scanner = JSONScanner(opening)
+        async with self.async_client.messages.stream(**request) as stream:
+            async for text in stream.text_stream:
+                extracted = scanner.feed(text)
+                if extracted is not None:
+                    # Output tokens so far: the rest are not generated once the stream closes
+                    METRICS.count_tokens(stream.current_message_snapshot.usage)
+                    logger.debug("LLM reply: %s", scanner.buffer)
+                    return extracted
+        logger.debug("LLM reply: %s", scanner.buffer)
+        raise ValueError("No JSON value in the LLM response")
+
+    def request_batch(self, prompts: List[str]) -> List[Dict[str, Any]]:
+        """Ask the LLM for the parameters found in each prompt with a single call"""
+        request = self.build_batch_request(prompts)
+        with METRICS.stage("llm"):
+            if self.stream:
+                return self.check_batch(self.stream_json(request, "["), len(prompts))
+            return self.read_batch_response(self.client.messages.create(**request), len(prompts))
+
+    async def request_batch_async(self, prompts: List[str]) -> List[Dict[str, Any]]:
+        """Asynchronous variant of request_batch"""
+        request = self.build_batch_request(prompts)
+        with METRICS.stage("llm"):
+            if self.stream:
+                return self.check_batch(await self.stream_json_async(request, "["), len(prompts))
+            return self.read_batch_response(await self.async_client.messages.create(**request), len(prompts))
+
+    def request_parameters(self, prompt: str) -> Dict[str, Any]:
+        """Ask the LLM for the parameters found in the prompt"""
+        with METRICS.stage("llm"):
+            if self.stream:
+                return self.stream_json(self.build_request(prompt))
+            return self.read_response(self.client.messages.create(**self.build_request(prompt)))
+
+    async def request_parameters_async(self, prompt: str) -> Dict[str, Any]:
+        """Ask the LLM for the parameters found in the prompt without blocking the event loop"""
+        with METRICS.stage("llm"):
+            if self.stream:
+                return await self.stream_json_async(self.build_request(prompt))
+            return self.read_response(await self.async_client.messages.create(**self.build_request(prompt)))
+
+    def lookup(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """Return parameters available without an LLM call, or None"""
+        # Formulaic prompts are handled without a network call
+        if self.fast_path:
+            extraction = extract_parameters(prompt)
+            if extraction.complete:
+                return extraction.params
+        # Reuse parameters extracted for an equivalent prompt
+        if self.cache:
+            return self.cache.get(prompt)
+        return None
+
+    def remember(self, prompt: str, extracted: Dict[str, Any]):
+        """Store parameters the LLM extracted for later lookups"""
+        if self.cache:
+            self.cache.put(prompt, extracted)
+
+    def extract(self, prompt: str) -> Dict[str, Any]:
+        """Get the parameters of an uncached prompt from the LLM, micro-batched if enabled, and remember them"""
+        extracted = self.batcher.submit(prompt) if self.batcher else self.request_parameters(prompt)
+        self.remember(prompt, extracted)
+        return extracted
+
+    async def extract_async(self, prompt: str) -> Dict[str, Any]:
+        """Asynchronous variant of extract"""
+        if self.batcher:
+            extracted = await self.batcher.submit_async(prompt)
+        else:
+            extracted = await self.request_parameters_async(prompt)
+        self.remember(prompt, extracted)
+        return extracted
+
+    def fallback(self, prompt: str, error: Exception, defaults: Dict[str, Any] = DEFAULT_PARAMETERS) -> Dict[str, Any]:
+        """
+        Parameters for a prompt the LLM could not handle, when the rule-based extractor fully
+        understands it; raises ValueError otherwise, rather than answer with the defaults
+        """
+        self.fallbacks += 1
+        extraction = extract_parameters(prompt)
+        if not extraction.complete:
+            logger.warning("Error extracting parameters, and the rule-based extractor cannot read the prompt: %r", error)
+            raise ValueError("Could not extract parameters from prompt: the LLM is unavailable") from error
+        logger.warning("Error extracting parameters, falling back to the rule-based extractor: %r", error)
+        return {**defaults, **extraction.params}
+
+    def parse_prompt(self, prompt: str, defaults: Dict[str, Any] = DEFAULT_PARAMETERS) -> Dict[str, Any]:
+        """
+        Parse a natural language prompt into strategy parameters using LLM capabilities
+        Returns a dict of parameters for StrategyGenerator, the extracted ones over `defaults`
+        """
+        try:
+            with METRICS.stage("cache_lookup"):
+                extracted = self.lookup(prompt)
+            if extracted is None and self.flights:
+                # Equivalent prompts already being extracted share that call
+                with METRICS.stage("normalize"):
+                    key = normalize_prompt(prompt)
+                extracted = self.flights.run(key, self.extract, prompt)
+            elif extracted is None:
+                extracted = self.extract(prompt)
+            # Update defaults with extracted parameters
+            return {**defaults, **extracted}
+
+        except Exception as e:
+            return self.fallback(prompt, e, defaults)
+
+    async def parse_prompt_async(self, prompt: str, defaults: Dict[str, Any] = DEFAULT_PARAMETERS) -> Dict[str, Any]:
+        """Asynchronous variant of parse_prompt for the ASGI server"""
+        try:
+            with METRICS.stage("cache_lookup"):
+                extracted = self.lookup(prompt)
+            if extracted is None and self.flights:
+                with METRICS.stage("normalize"):
+                    key = normalize_prompt(prompt)
+                extracted = await self.flights.run_async(key, self.extract_async, prompt)
+            elif extracted is None:
+                extracted = await self.extract_async(prompt)
+            return {**defaults, **extracted}
+
+        except Exception as e:
+            return self.fallback(prompt, e, defaults)
+
+    def refinement_delta(self, message: str) -> Optional[Dict[str, Any]]:
+        """The parameters a follow-up message sets when the rule-based extractor fully understands it, or None"""
+        if not self.fast_path:
+            return None
+        extraction = extract_parameters(message)
+        return extraction.params if extraction.understood else None
+
+    def refine_fallback(self, message: str, error: Exception) -> Tuple[Dict[str, Any], str]:
+        """
+        Changes the LLM could not read from a follow-up message, when the rule-based extractor
+        attributes every number in it; raises ValueError otherwise, rather than change nothing
+        """
+        self.fallbacks += 1
+        extraction = extract_parameters(message)
+        if not extraction.understood:
+            logger.warning("Error extracting changes, and the rule-based extractor cannot read the message: %r", error)
+            raise ValueError("Could not extract changes from message: the LLM is unavailable") from error
+        logger.warning("Error extracting changes, falling back to the rule-based extractor: %r", error)
+        return extraction.params, "fallback"
+
+    def refine_parameters(self, message: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+        """
+        The parameters a follow-up message such as "same as before but stake 20" changes in `params`,
+        and where they were read: "extractor" for the rule-based extractor, "llm" when it needed the
+        LLM, or "fallback" when the LLM failed
+        """
+        with METRICS.stage("cache_lookup"):
+            delta = self.refinement_delta(message)
+        if delta is not None:
+            return delta, "extractor"
+        request = self.build_refine_request(message, params)
+        try:
+            with METRICS.stage("llm"):
+                if self.stream:
+                    return self.stream_json(request), "llm"
+                return self.read_response(self.client.messages.create(**request)), "llm"
+        except Exception as e:
+            return self.refine_fallback(message, e)
+
+    async def refine_parameters_async(self, message: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+        """Asynchronous variant of refine_parameters"""
+        with METRICS.stage("cache_lookup"):
+            delta = self.refinement_delta(message)
+        if delta is not None:
+            return delta, "extractor"
+        request = self.build_refine_request(message, params)
+        try:
+            with METRICS.stage("llm"):
+                if self.stream:
+                    return await self.stream_json_async(request), "llm"
+                return self.read_response(await self.async_client.messages.create(**request)), "llm"
+        except Exception as e:
+            return self.refine_fallback(message, e)
+
+    def stats(self) -> Dict[str, Any]:
+        """LLM call counters: coalesced duplicate prompts, micro-batched calls, retries and fallbacks"""
+        return {
+            "coalescing": self.flights.stats() if self.flights else None,
+            "batching": self.batcher.stats() if self.batcher else None,
+            "client": self.client.stats(),
+            "async_client": self.async_client.stats(),
+            "fallbacks": self.fallbacks
+        }
+
+    def validate_parameters(self, params: Dict[str, Any]) -> bool:
+        """
+        Validate the extracted parameters: the duration, stakes and thresholds must be finite positive
+        numbers, and all present unless a reference strategy keeps its own
+        """
+        required = ["duration", "stake", "profit_threshold", "loss_threshold"]
+        numeric = [key for key in required + ["initial_stake"] if key in params]
+
+        return (params.get("reference") is not None or all(key in params for key in required)) and all(
+            isinstance(params[key], (int, float)) and not isinstance(params[key], bool)
+            and math.isfinite(params[key]) and params[key] > 0
+            for key in numeric
+        )
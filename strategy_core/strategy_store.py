@@ -0,0 +1,347 @@
+"""
+Content-addressed archive of every strategy handed out, for audit and re-download
+Strategies are keyed by the SHA-256 of their canonical XML and compressed one by one against a
+dictionary built from the reference strategies and generated output: zstd when the zstandard
+package is installed, otherwise a raw deflate stream primed with a zlib preset dictionary
+Records are appended to a segment file and located through an open-addressing hash table kept
+in a memory-mapped index file, so a lookup is one probe sequence and one read
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import re
+import struct
+import threading
+import weakref
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+from .strategy_generator import StrategySpec, render_strategy_bytes
+from .strategy_library import REFERENCE_DIRECTORY
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Preferred first
+CODECS = ("zstd", "zlib") if zstandard is not None else ("zlib",)
+# zlib cannot use more than its 32 KB window
+ZLIB_DICTIONARY_SIZE = 32 * 1024
+# Below level 5 zstd misses most of the dictionary's long matches; level 8 compresses as well as 9 in a third of the time
+ZSTD_LEVEL = 8
+ZLIB_LEVEL = 9
+INDEX_VERSION = 1
+INITIAL_CAPACITY = 1024
+# Grow the index past this fraction of occupied slots
+MAX_LOAD = 0.5
+
+# magic, version, capacity, count, indexed segment bytes, uncompressed bytes
+_HEADER = struct.Struct("=8sI4xQQQQ")
+_HEADER_SIZE = 64
+# first half of the digest, record offset, compressed length (0 marks an empty slot)
+_SLOT = struct.Struct("=16sQI4x")
+# digest, compressed length
+_RECORD = struct.Struct("=32sI")
+_MAGIC = b"STRSTOR\0"
+_BETWEEN_TAGS = re.compile(rb">\s+<")
+_DIGEST = re.compile(r"[0-9a-f]{64}")
+# Open stores, given their own segment descriptor in forked children: a shared one would share its lock
+_OPEN_STORES = weakref.WeakSet()
+
+
+def canonical_xml(data: bytes) -> bytes:
+    """
+    The form a strategy is hashed in: line endings normalized and whitespace-only text between tags
+    dropped, so re-indented or re-saved copies of a strategy share its key
+    """
+    return _BETWEEN_TAGS.sub(b"><", data.replace(b"\r\n", b"\n").strip())
+
+
+def strategy_digest(data: bytes) -> str:
+    """Hex SHA-256 of the canonical XML: the key a strategy is stored under"""
+    return hashlib.sha256(canonical_xml(data)).hexdigest()
+
+
+def is_digest(text: str) -> bool:
+    return bool(_DIGEST.fullmatch(text))
+
+
+def dictionary_samples(reference_directory: str = REFERENCE_DIRECTORY) -> List[bytes]:
+    """The reference strategy files, then a generated strategy: every strategy handed out is a variation of one"""
+    samples = []
+    for name in sorted(os.listdir(reference_directory)):
+        if name.endswith(".xml"):
+            with open(os.path.join(reference_directory, name), "rb") as f:
+                samples.append(f.read())
+    samples.append(render_strategy_bytes(StrategySpec()))
+    return samples
+
+
+def build_dictionary(samples: Iterable[bytes], codec: str = CODECS[0]) -> bytes:
+    """
+    The dictionary for `codec` from sample strategies. For zstd it is the samples themselves as raw
+    content, so a strategy compresses to its differences from the sample it varies: a trained
+    (COVER) dictionary of the same samples does several times worse. zlib is limited to the
+    last 32 KB, which should end with the most common kind of strategy
+    """
+    data = b"".join(samples)
+    return data if codec == "zstd" else data[-ZLIB_DICTIONARY_SIZE:]
+
+
+class _Codec:
+    """Per-record compression against a shared dictionary"""
+
+    def __init__(self, codec: str, dictionary: bytes):
+        if codec not in CODECS:
+            raise RuntimeError(f"The {codec} codec is not available; install zstandard")
+        self.name = codec
+        self.dictionary = dictionary
+        self._local = threading.local()
+        if codec == "zlib":
+            # Priming with the dictionary costs more than compressing a strategy, so copy a primed state
+            self._compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15, 9, zdict=dictionary)
+            self._decompressor = zlib.decompressobj(-15, zdict=dictionary)
+        else:
+            self._dictionary = zstandard.ZstdCompressionDict(dictionary, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+            self._dictionary.precompute_compress(level=ZSTD_LEVEL)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zlib":
+            compressor = self._compressor.copy()
+            return compressor.compress(data) + compressor.flush()
+        # zstd contexts are not thread-safe; each thread keeps its own
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(
+                level=ZSTD_LEVEL, dict_data=self._dictionary, write_checksum=False, write_content_size=True
+            )
+        return compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.name == "zlib":
+            decompressor = self._decompressor.copy()
+            return decompressor.decompress(data) + decompressor.flush()
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor(dict_data=self._dictionary)
+        return decompressor.decompress(data)
+
+
+class StrategyStore:
+    """
+    Append-only, content-addressed strategy archive in `directory`: segment, index and
+    dictionary.<codec> files. The first open builds the dictionary (from `samples`, or
+    dictionary_samples()) for `codec`; later opens reuse it
+    Writes from several processes are serialized by a lock on the segment file; the index is
+    rebuilt from the segment if a writer died between appending a record and indexing it
+    """
+
+    def __init__(self, directory: str, codec: Optional[str] = None, samples: Optional[Iterable[bytes]] = None,
+                 sync: bool = False):
+        self.directory = directory
+        self.sync = sync
+        self.index_path = os.path.join(directory, "index")
+        os.makedirs(directory, exist_ok=True)
+        self.codec = self._open_codec(codec, samples)
+        self._map = None
+        self._open()
+        with self._writing():
+            self._recover()
+        _OPEN_STORES.add(self)
+
+    def _open(self):
+        self._lock = threading.Lock()
+        self._segment = os.open(os.path.join(self.directory, "segment"), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+
+    @classmethod
+    def from_env(cls) -> Optional["StrategyStore"]:
+        """Open the store at STRATEGY_STORE_DIR with STRATEGY_STORE_CODEC and STRATEGY_STORE_FSYNC; None unless it is set"""
+        directory = os.getenv("STRATEGY_STORE_DIR")
+        if not directory:
+            return None
+        codec = os.getenv("STRATEGY_STORE_CODEC") or None
+        return cls(directory, codec, sync=os.getenv("STRATEGY_STORE_FSYNC", "0") == "1")
+
+    def _open_codec(self, codec: Optional[str], samples: Optional[Iterable[bytes]]) -> _Codec:
+        for name in ("zstd", "zlib"):
+            path = os.path.join(self.directory, f"dictionary.{name}")
+            if os.path.exists(path):
+                if codec is not None and codec != name:
+                    raise ValueError(f"{self.directory} is a {name} store, not {codec}")
+                with open(path, "rb") as f:
+                    return _Codec(name, f.read())
+
+        codec = codec or CODECS[0]
+        dictionary = build_dictionary(samples if samples is not None else dictionary_samples(), codec)
+        path = os.path.join(self.directory, f"dictionary.{codec}")
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(dictionary)
+        os.replace(temporary, path)
+        return _Codec(codec, dictionary)
+
+    @contextmanager
+    def _writing(self):
+        """Hold the thread lock and the cross-process lock on the segment, with a current index map"""
+        with self._lock:
+            fcntl.flock(self._segment, fcntl.LOCK_EX)
+            try:
+                self._remap()
+                yield
+            finally:
+                fcntl.flock(self._segment, fcntl.LOCK_UN)
+
+    def _remap(self) -> bool:
+        """Map the index file if it is missing from this process or another process replaced it; True if remapped"""
+        try:
+            identity = os.stat(self.index_path).st_ino
+        except FileNotFoundError:
+            self._write_index(INITIAL_CAPACITY, [], 0, 0)
+            identity = os.stat(self.index_path).st_ino
+        if self._map is not None and identity == self._identity:
+            return False
+        with open(self.index_path, "r+b") as f:
+            index_map = mmap.mmap(f.fileno(), 0)
+            identity = os.fstat(f.fileno()).st_ino
+        magic, version, capacity, _, _, _ = _HEADER.unpack_from(index_map)
+        if magic != _MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{self.index_path} is not a version {INDEX_VERSION} strategy store index")
+        # Readers may still hold the old map; it is closed once they drop it
+        self._map, self._identity, self._capacity = index_map, identity, capacity
+        return True
+
+    def _write_index(self, capacity: int, slots: List[tuple], committed: int, raw: int):
+        """Write a fresh index holding `slots` and swap it in for the current one"""
+        index = bytearray(_HEADER_SIZE + capacity * _SLOT.size)
+        _HEADER.pack_into(index, 0, _MAGIC, INDEX_VERSION, capacity, len(slots), committed, raw)
+        for key, offset, length in slots:
+            _SLOT.pack_into(index, self._free_slot(index, capacity, key), key, offset, length)
+        temporary = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(index)
+        os.replace(temporary, self.index_path)
+
+    @staticmethod
+    def _free_slot(index, capacity: int, key: bytes) -> int:
+        slot = int.from_bytes(key[:8], "little") & (capacity - 1)
+        while _SLOT.unpack_from(index, _HEADER_SIZE + slot * _SLOT.size)[2]:
+            slot = (slot + 1) & (capacity - 1)
+        return _HEADER_SIZE + slot * _SLOT.size
+
+    def _find(self, key: bytes) -> Optional[tuple]:
+        """(offset, length) of the record whose digest starts with `key`, or None"""
+        # Sized from the map itself: a remap on another thread may be replacing both
+        index_map = self._map
+        capacity = (len(index_map) - _HEADER_SIZE) // _SLOT.size
+        slot = int.from_bytes(key[:8], "little") & (capacity - 1)
+        while True:
+            found, offset, length = _SLOT.unpack_from(index_map, _HEADER_SIZE + slot * _SLOT.size)
+            if not length:
+                return None
+            if found == key:
+                return offset, length
+            slot = (slot + 1) & (capacity - 1)
+
+    def _header(self) -> tuple:
+        return _HEADER.unpack_from(self._map)[3:]
+
+    def _index(self, key: bytes, offset: int, length: int, size: int):
+        """Add a record to the index, growing it first if it would pass MAX_LOAD"""
+        count, committed, raw = self._header()
+        if count + 1 > self._capacity * MAX_LOAD:
+            slots = []
+            for slot in range(self._capacity):
+                entry = _SLOT.unpack_from(self._map, _HEADER_SIZE + slot * _SLOT.size)
+                if entry[2]:
+                    slots.append(entry)
+            self._write_index(self._capacity * 2, slots, committed, raw)
+            self._remap()
+        _SLOT.pack_into(self._map, self._free_slot(self._map, self._capacity, key), key, offset, length)
+        _HEADER.pack_into(self._map, 0, _MAGIC, INDEX_VERSION, self._capacity, count + 1,
+                          offset + _RECORD.size + length, raw + size)
+
+    def _recover(self):
+        """Index records appended after the index was last updated; drop a trailing partial record"""
+        _, committed, _ = self._header()
+        end = os.fstat(self._segment).st_size
+        while committed < end:
+            header = os.pread(self._segment, _RECORD.size, committed)
+            if len(header) < _RECORD.size:
+                break
+            digest, length = _RECORD.unpack(header)
+            if committed + _RECORD.size + length > end:
+                break
+            payload = os.pread(self._segment, length, committed + _RECORD.size)
+            if self._find(digest[:16]) is None:
+                self._index(digest[:16], committed, length, len(self.codec.decompress(payload)))
+            committed += _RECORD.size + length
+        if committed < end:
+            os.truncate(self._segment, committed)
+
+    def put(self, data: bytes) -> str:
+        """Store a strategy unless its canonical form is stored already; returns its digest"""
+        digest = hashlib.sha256(canonical_xml(data)).digest()
+        if self._find(digest[:16]) is not None:
+            return digest.hex()
+        payload = self.codec.compress(data)
+        with self._writing():
+            if self._find(digest[:16]) is None:
+                offset = os.fstat(self._segment).st_size
+                os.write(self._segment, _RECORD.pack(digest, len(payload)) + payload)
+                if self.sync:
+                    os.fsync(self._segment)
+                self._index(digest[:16], offset, len(payload), len(data))
+        return digest.hex()
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """The strategy stored under a hex digest, or None"""
+        key = bytes.fromhex(digest)
+        location = self._find(key[:16])
+        if location is None:
+            # Another process may have grown the index since it was mapped here
+            with self._lock:
+                if not self._remap():
+                    return None
+            location = self._find(key[:16])
+            if location is None:
+                return None
+        offset, length = location
+        record = os.pread(self._segment, _RECORD.size + length, offset)
+        if record[:32] != key:
+            return None
+        return self.codec.decompress(record[_RECORD.size:])
+
+    def __contains__(self, digest: str) -> bool:
+        return self._find(bytes.fromhex(digest)[:16]) is not None
+
+    def __len__(self) -> int:
+        return self._header()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Stored strategies, their raw and compressed bytes and the compression ratio"""
+        count, committed, raw = self._header()
+        stored = committed - count * _RECORD.size
+        return {
+            "strategies": count,
+            "codec": self.codec.name,
+            "raw_bytes": raw,
+            "stored_bytes": stored,
+            "ratio": raw / stored if stored else 0.0
+        }
+
+    def close(self):
+        _OPEN_STORES.discard(self)
+        os.close(self._segment)
+        self._map = None
+
+
+def _reopen_after_fork():
+    for store in list(_OPEN_STORES):
+        os.close(store._segment)
+        store._open()
+
+
+os.register_at_fork(after_in_child=_reopen_after_fork)
@@ -0,0 +1,186 @@
+"""
+Structural validation of DBot Blockly strategy XML in one iterparse pass
+Elements are dropped as soon as they close, so memory stays bounded by the nesting depth rather
+than the document size; checks that need the whole document (variables referenced before their
+declaration, procedures called before their definition) resolve from small sets at the end
+"""
+import functools
+import io
+import xml.etree.ElementTree as ET
+from typing import IO, Dict, FrozenSet, List, NamedTuple, Tuple, Union
+
+TRADE_DEFINITION_CHILDREN = (
+    "trade_definition_market",
+    "trade_definition_tradetype",
+    "trade_definition_contracttype",
+    "trade_definition_candleinterval",
+    "trade_definition_restartbuysell",
+    "trade_definition_restartonerror",
+)
+# A trade definition sets its stake and duration through exactly one of these
+TRADE_PARAMETER_BLOCKS = ("trade_definition_tradeoptions", "trade_definition_multiplier", "trade_definition_accumulator")
+
+KNOWN_BLOCKS: FrozenSet[str] = frozenset(TRADE_DEFINITION_CHILDREN + TRADE_PARAMETER_BLOCKS + (
+    # Trade definition and the run loop
+    "trade_definition", "accumulator_take_profit", "multiplier_take_profit", "multiplier_stop_loss",
+    "before_purchase", "during_purchase", "after_purchase", "tick_analysis",
+    "purchase", "sell_at_market", "check_sell", "sell_price", "ask_price", "payout",
+    "contract_check_result", "read_details", "trade_again",
+    # Market data, account and utilities
+    "tick", "ticks", "tick_string", "ohlc", "ohlc_values", "ohlc_values_in_list", "read_ohlc", "get_ohlc",
+    "last_digit", "lastDigitList", "check_direction", "is_candle_black",
+    "balance", "total_profit", "total_runs", "epoch", "timeout", "stat",
+    "notify", "notify_telegram", "text_print", "text_prompt_ext", "text_statement",
+    "sma_statement", "sma_array", "ema_statement", "ema_array", "rsi_statement", "rsi_array",
+    "bb_statement", "bb_array", "macda_statement", "macda_array",
+    # Blockly core
+    "controls_if", "controls_repeat", "controls_repeat_ext", "controls_whileUntil", "controls_for",
+    "controls_forEach", "controls_flow_statements",
+    "logic_compare", "logic_operation", "logic_negate", "logic_boolean", "logic_null", "logic_ternary",
+    "math_number", "math_number_positive", "math_arithmetic", "math_single", "math_trig", "math_constant",
+    "math_number_property", "math_change", "math_round", "math_on_list", "math_modulo", "math_constrain",
+    "math_random_int", "math_random_float",
+    "text", "text_join", "text_append", "text_length", "text_isEmpty", "text_indexOf", "text_charAt",
+    "text_getSubstring", "text_changeCase", "text_trim",
+    "lists_create_empty", "lists_create_with", "lists_repeat", "lists_length", "lists_isEmpty",
+    "lists_indexOf", "lists_getIndex", "lists_setIndex", "lists_getSublist", "lists_split", "lists_sort",
+    "variables_get", "variables_set",
+    "procedures_defnoreturn", "procedures_defreturn", "procedures_callnoreturn", "procedures_callreturn",
+    "procedures_ifreturn",
+))
+
+PROCEDURE_DEFINITIONS = ("procedures_defnoreturn", "procedures_defreturn")
+PROCEDURE_CALLS = ("procedures_callnoreturn", "procedures_callreturn")
+# Errors reported per document; a broken upload can otherwise produce one per block
+MAX_ERRORS = 50
+
+
+class Validation(NamedTuple):
+    """Outcome of validating one strategy; warnings flag what Blockly repairs on load"""
+    errors: Tuple[str, ...]
+    blocks: int
+    variables: int
+    procedures: int
+    warnings: Tuple[str, ...] = ()
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def summary(self) -> Dict:
+        return {"valid": self.valid, **self._asdict(), "errors": list(self.errors), "warnings": list(self.warnings)}
+
+
+# Uploads choose their own namespaces, so the cache of tag names is bounded
+@functools.lru_cache(maxsize=256)
+def _local(tag: str) -> str:
+    """Tag name without its namespace"""
+    return tag.rpartition("}")[2]
+
+
+def validate_strategy(source: Union[bytes, str, IO[bytes]], known_blocks: FrozenSet[str] = KNOWN_BLOCKS) -> Validation:
+    """
+    Check a strategy (bytes, text or a binary file object) is well-formed DBot Blockly: known
+    block types, one complete trade definition, variable references declared in <variables>
+    and procedure calls matching a definition by name and argument count
+    """
+    if isinstance(source, str):
+        source = source.encode()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    errors: List[str] = []
+    declared_ids, declared_names = set(), set()
+    # Variable references as (id, name, block id) and calls as (name, arguments, block id)
+    references, calls = [], []
+    definitions: Dict[str, int] = {}
+    trade_definitions = 0
+    blocks = 0
+    # Open elements, and per open block [type, id, procedure name, argument count]
+    elements, frames = [], []
+    # Block types inside the open trade definition
+    trade_types = None
+
+    def error(message: str):
+        if len(errors) < MAX_ERRORS:
+            errors.append(message)
+
+    try:
+        for event, element in ET.iterparse(source, events=("start", "end")):
+            tag = _local(element.tag)
+            if event == "start":
+                if not elements and tag != "xml":
+                    error(f"root element is <{tag}>, not <xml>")
+                elements.append(element)
+                if tag == "block" or tag == "shadow":
+                    kind = element.get("type")
+                    blocks += 1
+                    if kind not in known_blocks:
+                        error(f"block {element.get('id')}: unknown type {kind!r}")
+                    frames.append([kind, element.get("id"), None, 0])
+                    if trade_types is not None:
+                        trade_types.add(kind)
+                    elif kind == "trade_definition":
+                        trade_definitions += 1
+                        trade_types = set()
+                continue
+
+            elements.pop()
+            if tag == "field":
+                name = element.get("name")
+                if name == "VAR" and frames:
+                    references.append((element.get("id"), element.text, frames[-1][1]))
+                elif name == "NAME" and frames and frames[-1][0] in PROCEDURE_DEFINITIONS:
+                    frames[-1][2] = element.text
+            elif tag == "arg" and frames:
+                frames[-1][3] += 1
+                if frames[-1][0] in PROCEDURE_DEFINITIONS:
+                    references.append((element.get("varid"), element.get("name"), frames[-1][1]))
+            elif tag == "mutation" and frames and frames[-1][0] in PROCEDURE_CALLS:
+                frames[-1][2] = element.get("name")
+            elif tag == "variable":
+                variable_id = element.get("id")
+                if variable_id in declared_ids:
+                    error(f"variable {variable_id!r} is declared twice")
+                declared_ids.add(variable_id)
+                declared_names.add(element.text)
+            elif tag == "block" or tag == "shadow":
+                kind, block_id, name, arguments = frames.pop()
+                if kind in PROCEDURE_DEFINITIONS:
+                    if name in definitions:
+                        error(f"block {block_id}: procedure {name!r} is defined twice")
+                    definitions[name] = arguments
+                elif kind in PROCEDURE_CALLS:
+                    calls.append((name, arguments, block_id))
+                elif kind == "trade_definition" and trade_types is not None:
+                    missing = [child for child in TRADE_DEFINITION_CHILDREN if child not in trade_types]
+                    if missing:
+                        error(f"block {block_id}: trade_definition lacks {', '.join(missing)}")
+                    if sum(kind in trade_types for kind in TRADE_PARAMETER_BLOCKS) != 1:
+                        error(f"block {block_id}: trade_definition needs exactly one of {', '.join(TRADE_PARAMETER_BLOCKS)}")
+                    trade_types = None
+
+            # Drop the closed element; its earlier siblings are gone already, so this is the first child
+            if elements:
+                elements[-1].remove(element)
+            element.clear()
+    except ET.ParseError as e:
+        return Validation((f"not well-formed: {e}",), blocks, len(declared_ids), len(definitions))
+
+    if trade_definitions != 1:
+        error(f"expected one trade_definition block, found {trade_definitions}")
+    warnings = {}
+    for variable_id, name, block_id in references:
+        if variable_id in declared_ids:
+            continue
+        if name not in declared_names:
+            error(f"block {block_id}: variable {name!r} (id {variable_id!r}) is not declared")
+        elif variable_id is not None and variable_id not in warnings:
+            # Blockly falls back to looking the variable up by name
+            warnings[variable_id] = f"variable id {variable_id!r} is not declared; {name!r} is, under another id"
+    for name, arguments, block_id in calls:
+        if name not in definitions:
+            error(f"block {block_id}: call to undefined procedure {name!r}")
+        elif definitions[name] != arguments:
+            error(f"block {block_id}: {name!r} takes {definitions[name]} arguments, called with {arguments}")
+    return Validation(tuple(errors), blocks, len(declared_ids), len(definitions), tuple(warnings.values()))